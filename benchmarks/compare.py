@@ -0,0 +1,39 @@
+import argparse
+import json
+import sys
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """
+    Compara duas execuções de `benchmarks/run.py`. Retorna uma linha por medição presente
+    nas duas, marcando regressão quando o p95 sobe ou a vazão cai mais que `threshold`.
+    """
+    rows = []
+    for name, before in baseline["results"].items():
+        after = current["results"].get(name)
+        if after is None:
+            continue
+        p95_change = after["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        throughput_change = after["items_per_second"] / before["items_per_second"] - 1 if before["items_per_second"] else 0.0
+        regressed = p95_change > threshold or throughput_change < -threshold
+        rows.append((name, before["p95_ms"], after["p95_ms"], p95_change, throughput_change, regressed))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara dois resultados de benchmark e aponta regressões.")
+    parser.add_argument("baseline", help="JSON da versão de referência.")
+    parser.add_argument("current", help="JSON da versão avaliada.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Variação tolerada (padrão: 10%%).")
+    args = parser.parse_args()
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold)
+    print(f"{'medição':45} {'p95 antes':>10} {'p95 agora':>10} {'Δ p95':>8} {'Δ vazão':>8}")
+    for name, p95_before, p95_after, p95_change, throughput_change, regressed in rows:
+        flag = "  ⚠️ regressão" if regressed else ""
+        print(f"{name:45} {p95_before:>10} {p95_after:>10} {p95_change:>+8.1%} {throughput_change:>+8.1%}{flag}")
+    sys.exit(1 if any(row[-1] for row in rows) else 0)
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import random
+import time
+import zlib
+from typing import Any, Callable, List, Optional, Union
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+TOOL_BY_KEYWORD = (
+    ("fatura", "get_billing_history"),
+    ("cobran", "get_billing_history"),
+    ("assinatura", "get_subscriptions"),
+    ("cartão", "get_payment_methods"),
+    ("pagamento", "get_payment_methods"),
+    ("e-mail", "get_personal_info"),
+    ("endereço", "get_personal_info"),
+)
+
+
+def tool_calling_script(messages: List[BaseMessage]) -> Union[str, AIMessage]:
+    """
+    Roteiro padrão no formato de chamada de funções: enquanto não há resultado de ferramenta
+    no turno, pede numa só resposta a verificação de contexto e a ferramenta que combina com
+    a mensagem do cliente (executadas em paralelo pelo agente); depois, entrega a resposta final.
+    """
+    turn_start = max((i for i, message in enumerate(messages) if isinstance(message, HumanMessage)), default=0)
+    if any(isinstance(message, ToolMessage) for message in messages[turn_start:]):
+        return "Grace: Pronto! Consultei sua conta e está tudo certo por aqui."
+    user_input = str(messages[turn_start].content).lower() if messages else ""
+    tools = ["get_user_context"]
+    tools += [name for keyword, name in TOOL_BY_KEYWORD if keyword in user_input][:1]
+    return AIMessage(content="", tool_calls=[
+        {"name": name, "args": {}, "id": f"call_{index}_{zlib.crc32(user_input.encode('utf-8'))}"}
+        for index, name in enumerate(tools)
+    ])
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Modelo de chat determinístico para benchmarks: responde conforme `script(mensagens)`
+    (texto ou um AIMessage com chamadas de ferramenta) e simula a latência da API (`latency_seconds` mais até `latency_jitter_seconds`, derivado
+    do próprio prompt para que a mesma execução sempre tenha os mesmos tempos). Em streaming,
+    entrega a resposta em pedaços de `chunk_chars` caracteres.
+
+    Para exercitar o ResilientLLMClient, uma fração `error_rate` das chamadas falha com
+    ConnectionError (como uma queda de rede ou um 503) e uma fração `stall_rate` demora
+    `stall_seconds` a mais (como uma API sobrecarregada).
+    """
+    script: Optional[Callable[[List[BaseMessage]], Union[str, AIMessage]]] = None
+    latency_seconds: float = 0.8
+    latency_jitter_seconds: float = 0.4
+    chunk_chars: int = 12
+    error_rate: float = 0.0
+    stall_rate: float = 0.0
+    stall_seconds: float = 60.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _prompt_text(self, messages: List[BaseMessage]) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    def _latency(self, prompt: str) -> float:
+        latency = self.latency_seconds + self.latency_jitter_seconds * (zlib.crc32(prompt.encode("utf-8")) % 1000) / 1000
+        if self.error_rate and random.random() < self.error_rate:
+            raise ConnectionError("Falha simulada na chamada ao modelo.")
+        if self.stall_rate and random.random() < self.stall_rate:
+            latency += self.stall_seconds
+        return latency
+
+    def _message(self, messages: List[BaseMessage], prompt: str) -> AIMessage:
+        reply = (self.script or tool_calling_script)(messages)
+        if isinstance(reply, str):
+            reply = AIMessage(content=reply)
+        input_tokens = len(prompt) // 4
+        output_tokens = (len(reply.content) + len(json.dumps([call["args"] for call in reply.tool_calls]))) // 4
+        return AIMessage(content=reply.content, tool_calls=reply.tool_calls, usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens,
+        })
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt = self._prompt_text(messages)
+        time.sleep(self._latency(prompt))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, prompt))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt = self._prompt_text(messages)
+        await asyncio.sleep(self._latency(prompt))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, prompt))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any):
+        prompt = self._prompt_text(messages)
+        await asyncio.sleep(self._latency(prompt))
+        message = self._message(messages, prompt)
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                for index, call in enumerate(message.tool_calls)
+            ]))
+            return
+        reply = message.content
+        for start in range(0, len(reply), self.chunk_chars):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=reply[start:start + self.chunk_chars]))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+SUITES = ("db", "guardian", "oracle", "columnar", "chat", "startup")
+HEAVY_MODULES = ("langchain", "langchain_core", "langchain_google_genai", "grpc")
+CHAT_SCRIPT = ("Olá", "mostre minhas faturas", "quero ver a cobrança de Curitiba", "quais são minhas assinaturas?",
+               "qual é o meu e-mail cadastrado?")
+
+
+def summarize(latencies: list, wall_seconds: float, items_per_op: int = 1) -> dict:
+    """p50/p95/p99 (em ms, por nearest-rank) e vazão de uma série de medições."""
+    samples = sorted(latencies)
+
+    def percentile(p):
+        return round(samples[max(0, int(round(p / 100 * len(samples))) - 1)] * 1000, 3)
+
+    return {
+        "ops": len(samples),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+        "ops_per_second": round(len(samples) / wall_seconds, 2),
+        "items_per_second": round(len(samples) * items_per_op / wall_seconds, 2),
+    }
+
+
+def measure(operation, iterations: int, concurrency: int = 1, items_per_op: int = 1, warmup: int = 3) -> dict:
+    """Executa `operation(i)` `iterations` vezes em `concurrency` threads e resume as latências."""
+    for i in range(min(warmup, iterations)):
+        operation(i)
+    latencies = []
+    lock = threading.Lock()
+
+    def timed(i):
+        started_at = time.perf_counter()
+        operation(i)
+        elapsed = time.perf_counter() - started_at
+        with lock:
+            latencies.append(elapsed)
+
+    started_at = time.perf_counter()
+    if concurrency == 1:
+        for i in range(iterations):
+            timed(i)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(timed, range(iterations)))
+    return summarize(latencies, time.perf_counter() - started_at, items_per_op)
+
+
+def bench_db(store, user_ids: list, rnd: random.Random, iterations: int) -> dict:
+    def bump_activity(profile):
+        profile["behavioral_data"]["last_activity_date"] = datetime.now().isoformat()
+
+    sample = lambda k: rnd.sample(user_ids, min(k, len(user_ids)))
+    return {
+        "db.get": measure(lambda i: store.get(rnd.choice(user_ids)), iterations),
+        "db.get_many_100": measure(lambda i: store.get_many(sample(100)), max(iterations // 20, 10), items_per_op=100),
+        "db.update": measure(lambda i: store.update(rnd.choice(user_ids), bump_activity), iterations // 2),
+        "db.patch_many_100": measure(
+            lambda i: store.patch_many("aegis_scores", {user_id: {"benchmark_run": i} for user_id in sample(100)}),
+            max(iterations // 20, 10), items_per_op=100,
+        ),
+    }
+
+
+def bench_guardian(registry, user_ids: list, rnd: random.Random, iterations: int) -> dict:
+    guardian = registry.guardian
+    profiles = registry.store.get_many(rnd.sample(user_ids, min(2000, len(user_ids))))
+    pairs = [(user_id, transaction) for user_id, profile in profiles.items() for transaction in profile["billing_history"]]
+    batch = pairs[:1000]
+    return {
+        "guardian.analyze_transaction": measure(lambda i: guardian.analyze_transaction(*rnd.choice(pairs)), iterations),
+        "guardian.analyze_transactions_batch_1000": measure(
+            lambda i: guardian.analyze_transactions_batch(batch), 10, items_per_op=len(batch)
+        ),
+    }
+
+
+def bench_oracle(registry, user_ids: list, rnd: random.Random, iterations: int) -> dict:
+    oracle = registry.oracle
+    segment = rnd.sample(user_ids, min(20000, len(user_ids)))
+    return {
+        "oracle.calculate_churn_risk": measure(lambda i: oracle.calculate_churn_risk(rnd.choice(user_ids)), iterations),
+        "oracle.calculate_churn_risk_bulk": measure(
+            lambda i: oracle.calculate_churn_risk_bulk(segment, write_back=False), 3, items_per_op=len(segment), warmup=0
+        ),
+    }
+
+
+def bench_columnar(registry, db_file: str) -> dict:
+    """Estatísticas por usuário e reanálise do Guardian: perfis completos x arquivo colunar."""
+    from src.storage.columnar_history import build_from_store
+
+    store = registry.store
+    directory = f"{db_file}.columns"
+    history = build_from_store(store, directory)
+    rows = history.rows("transactions")
+
+    def stats_from_profiles(i):
+        stats = {}
+        for user_id, profile in store.iter_profiles():
+            history_items = profile.get("billing_history", [])
+            amounts = [transaction["amount_brl"] for transaction in history_items]
+            stats[user_id] = {
+                "tx_count": len(amounts),
+                "amount_mean": sum(amounts) / len(amounts) if amounts else 0.0,
+                "failed_count": sum(transaction.get("status") == "failed" for transaction in history_items),
+            }
+        return stats
+
+    try:
+        return {
+            "columnar.build": measure(lambda i: build_from_store(store, directory).close(), 3, items_per_op=rows,
+                                      warmup=0),
+            "profiles.transaction_stats": measure(stats_from_profiles, 3, items_per_op=rows, warmup=0),
+            "columnar.transaction_stats": measure(lambda i: history.transaction_stats(), 3, items_per_op=rows, warmup=1),
+            "guardian.analyze_billing_histories": measure(
+                lambda i: registry.guardian.analyze_billing_histories(), 1, items_per_op=rows, warmup=0
+            ),
+            "guardian.analyze_billing_histories_columnar": measure(
+                lambda i: registry.guardian.analyze_billing_histories(history=history), 1, items_per_op=rows, warmup=0
+            ),
+        }
+    finally:
+        history.close()
+
+
+def bench_chat(registry, user_ids: list, rnd: random.Random, iterations: int, concurrency: int,
+               llm_latency: float, llm_error_rate: float = 0.0) -> dict:
+    from benchmarks.fake_llm import ScriptedChatModel
+    from src.agents.agent_concierge import ConciergeAgent
+
+    registry.override("concierge", ConciergeAgent(llm=ScriptedChatModel(
+        latency_seconds=llm_latency, latency_jitter_seconds=llm_latency / 2, error_rate=llm_error_rate
+    )))
+    import server
+
+    client = server.app.test_client()
+    sessions = [(f"bench_session_{n}", rnd.choice(user_ids)) for n in range(max(concurrency * 4, 1))]
+
+    def chat_turn(i):
+        session_id, user_id = sessions[i % len(sessions)]
+        message = CHAT_SCRIPT[(i // len(sessions)) % len(CHAT_SCRIPT)]
+        response = client.post("/chat", json={"message": message, "session_id": session_id, "user_id": user_id})
+        assert response.status_code == 200, response.status_code
+
+    return {"chat.post": measure(chat_turn, iterations, concurrency=concurrency, warmup=0)}
+
+
+def startup_probe(kind: str, llm_latency: float):
+    """
+    Executado num interpretador novo por `bench_startup`: mede o import (e, para o servidor, a
+    primeira resposta de /chat) e imprime um JSON com os tempos e os módulos pesados carregados.
+    """
+    started_at = time.perf_counter()
+    if kind == "backend":
+        import src.agents.agent_ambassador
+        import src.agents.agent_guardian
+        import src.agents.agent_oracle
+        import src.agents.guardian_stream
+    else:
+        import server
+    result = {"import_seconds": time.perf_counter() - started_at,
+              "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules]}
+    if kind == "server":
+        from benchmarks.fake_llm import ScriptedChatModel
+        from src.agents.agent_concierge import ConciergeAgent
+        from src.agents.registry import get_agent_registry
+
+        get_agent_registry().override("concierge", ConciergeAgent(llm=ScriptedChatModel(latency_seconds=llm_latency)))
+        response = server.app.test_client().post("/chat", json={"message": CHAT_SCRIPT[1], "session_id": "bench_startup"})
+        assert response.status_code == 200, response.status_code
+        result["first_response_seconds"] = time.perf_counter() - started_at
+    print(json.dumps(result))
+
+
+def bench_startup(iterations: int, llm_latency: float) -> dict:
+    """
+    Partida a frio, cada medição num processo novo: import de `server.py`, tempo até a primeira
+    resposta de /chat (modelo falso) e import dos agentes de bastidores, que não devem carregar o LangChain.
+    """
+    def probe(kind):
+        code = f"from benchmarks.run import startup_probe; startup_probe({kind!r}, {llm_latency!r})"
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+        return json.loads(output.stdout.strip().splitlines()[-1])
+
+    series = {"startup.import_server": [], "startup.first_response": [], "startup.import_backend_agents": []}
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        server_run, backend_run = probe("server"), probe("backend")
+        if backend_run["heavy_modules"]:
+            print(f"Aviso: os agentes de bastidores carregaram {', '.join(backend_run['heavy_modules'])}.")
+        series["startup.import_server"].append(server_run["import_seconds"])
+        series["startup.first_response"].append(server_run["first_response_seconds"])
+        series["startup.import_backend_agents"].append(backend_run["import_seconds"])
+    wall_seconds = time.perf_counter() - started_at
+    return {name: summarize(latencies, wall_seconds) for name, latencies in series.items()}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede latência (p50/p95/p99) e vazão dos caminhos críticos.")
+    parser.add_argument("--db", default=None, help="Base SQLite a usar; gerada com --users se não existir.")
+    parser.add_argument("--users", type=int, default=10000, help="Tamanho da base sintética gerada.")
+    parser.add_argument("--suites", nargs="*", default=list(SUITES), choices=SUITES)
+    parser.add_argument("--iterations", type=int, default=2000, help="Operações por medição nos caminhos sem LLM.")
+    parser.add_argument("--chat-iterations", type=int, default=200)
+    parser.add_argument("--startup-iterations", type=int, default=5, help="Processos novos na medição de partida a frio.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requisições simultâneas em /chat.")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="Latência base do modelo falso, em segundos.")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0,
+                        help="Fração das chamadas ao modelo falso que falham (exercita novas tentativas e o disjuntor).")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="Arquivo JSON de resultados (padrão: benchmarks/results/).")
+    args = parser.parse_args()
+
+    db_file = args.db or os.path.join(tempfile.gettempdir(), f"aegis_bench_{args.users}.db")
+    os.environ["AEGIS_DB_FILE"] = db_file
+    os.environ.setdefault("AEGIS_LLM_CACHE", "0")
+    os.environ.setdefault("AEGIS_LOG_LEVEL", "WARNING")
+
+    from benchmarks.synthetic_data import generate_database
+    from src.agents.registry import get_agent_registry
+    from src.storage.customer_store import get_customer_store
+
+    if not os.path.exists(db_file):
+        print(f"Gerando base sintética com {args.users} clientes em '{db_file}'...")
+        generate_database(db_file, args.users, seed=args.seed)
+    store = get_customer_store(db_file)
+    registry = get_agent_registry()
+    user_ids = store.user_ids()
+    rnd = random.Random(args.seed)
+
+    results = {}
+    if "db" in args.suites:
+        results.update(bench_db(store, user_ids, rnd, args.iterations))
+    if "guardian" in args.suites:
+        results.update(bench_guardian(registry, user_ids, rnd, args.iterations))
+    if "oracle" in args.suites:
+        results.update(bench_oracle(registry, user_ids, rnd, args.iterations))
+    if "columnar" in args.suites:
+        results.update(bench_columnar(registry, db_file))
+    if "chat" in args.suites:
+        results.update(bench_chat(registry, user_ids, rnd, args.chat_iterations, args.concurrency, args.llm_latency,
+                                  args.llm_error_rate))
+    if "startup" in args.suites:
+        results.update(bench_startup(args.startup_iterations, args.llm_latency))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "users": len(user_ids),
+            "llm_latency_seconds": args.llm_latency,
+            "llm_error_rate": args.llm_error_rate,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['meta']['timestamp'].replace(':', '')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"{'medição':45} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'itens/s':>12}")
+    for name, stats in results.items():
+        print(f"{name:45} {stats['p50_ms']:>10} {stats['p95_ms']:>10} {stats['p99_ms']:>10} {stats['items_per_second']:>12}")
+    print(f"\nResultados gravados em '{output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from faker import Faker
+
+from src.storage.customer_store import CustomerStore
+
+SERVICES = [
+    ("net_ultra_500", "Plano Fibra Ultra 500MB", 149.9, "Mensalidade Plano Fibra"),
+    ("net_basic_100", "Plano Fibra 100MB", 89.9, "Mensalidade Plano Fibra"),
+    ("tv_plus_hd", "Pacote de Canais Plus HD", 79.9, "Mensalidade Pacote de Canais"),
+    ("mobile_20gb", "Plano Móvel 20GB", 59.9, "Mensalidade Plano Móvel"),
+    ("stream_premium", "Streaming Premium", 39.9, "Mensalidade Streaming"),
+]
+CARD_BRANDS = ("Visa", "Mastercard", "Elo", "Amex")
+
+
+class ProfileFactory:
+    """
+    Gera perfis no mesmo formato de `customer_profile.json`. O Faker monta uma vez um
+    conjunto de nomes, endereços e cidades, que depois é combinado aleatoriamente: gerar
+    1M de perfis chamando o Faker a cada campo levaria horas. Com a mesma `seed`, a base
+    gerada é sempre a mesma.
+    """
+    def __init__(self, seed: int = 42, pool_size: int = 5000, now: datetime = None):
+        fake = Faker("pt_BR")
+        Faker.seed(seed)
+        self.random = random.Random(seed)
+        self.now = now or datetime(2025, 10, 1)
+        self.names = [fake.name() for _ in range(pool_size)]
+        self.addresses = [fake.address().replace("\n", ", ") for _ in range(pool_size)]
+        self.cities = list(dict.fromkeys(fake.city() for _ in range(200)))
+
+    def _date(self, max_days_ago: int, min_days_ago: int = 0) -> datetime:
+        return self.now - timedelta(days=self.random.randint(min_days_ago, max_days_ago), seconds=self.random.randint(0, 86399))
+
+    def profile(self, index: int) -> dict:
+        rnd = self.random
+        user_id = f"user_{index:07d}"
+        name = rnd.choice(self.names)
+        home_city = rnd.choice(self.cities)
+
+        payment_methods = []
+        for card_index in range(rnd.randint(1, 3)):
+            expiry = self._date(365 * 2) + timedelta(days=rnd.randint(0, 365 * 5))
+            payment_methods.append({
+                "id": f"cc_{user_id}_{card_index}",
+                "type": "credit_card",
+                "brand": rnd.choice(CARD_BRANDS),
+                "last4": f"{rnd.randint(0, 9999):04d}",
+                "expiry_date": expiry.strftime("%Y-%m"),
+                "added_date": self._date(1500).isoformat() + "Z",
+            })
+        if rnd.random() < 0.5:
+            payment_methods.append({"id": f"pix_{user_id}", "type": "pix", "details": "Chave aleatória vinculada",
+                                    "added_date": self._date(1500).isoformat() + "Z"})
+
+        services = rnd.sample(SERVICES, rnd.randint(1, 3))
+        subscriptions = [
+            {"service_id": service_id, "service_name": service_name, "monthly_fee_brl": fee,
+             "next_billing_date": (self.now + timedelta(days=rnd.randint(1, 30))).strftime("%Y-%m-%d")}
+            for service_id, service_name, fee, _ in services
+        ]
+        billing_history = []
+        for month in range(rnd.randint(1, 12)):
+            for service_id, _, fee, description in services:
+                billing_history.append({
+                    "transaction_id": f"txn_{user_id}_{month}_{service_id}",
+                    "date": (self.now - timedelta(days=30 * month + rnd.randint(0, 27))).strftime("%Y-%m-%d"),
+                    "amount_brl": fee if rnd.random() > 0.02 else round(fee * rnd.uniform(3, 10), 2),
+                    "description": description,
+                    "status": "failed" if rnd.random() < 0.05 else "success",
+                    "location": home_city if rnd.random() > 0.05 else rnd.choice(self.cities),
+                    "time_on_page_seconds": rnd.randint(2, 90),
+                })
+        amounts = [t["amount_brl"] for t in billing_history]
+
+        return {
+            "user_id": user_id,
+            "personal_info": {
+                "name": name,
+                "email": f"{user_id}@example.com",
+                "address": rnd.choice(self.addresses),
+                "signup_date": self._date(2000, 30).isoformat() + "Z",
+            },
+            "payment_methods": payment_methods,
+            "preferred_payment_method_id": payment_methods[0]["id"],
+            "subscriptions": subscriptions,
+            "billing_history": billing_history,
+            "behavioral_data": {
+                "avg_transaction_value": round(sum(amounts) / len(amounts), 2),
+                "login_locations": [
+                    {"city": home_city if rnd.random() > 0.1 else rnd.choice(self.cities),
+                     "date": self._date(60).strftime("%Y-%m-%d")}
+                    for _ in range(rnd.randint(1, 4))
+                ],
+                "last_activity_date": self._date(90).isoformat() + "Z",
+            },
+        }
+
+
+def generate_database(db_file: str, users: int, seed: int = 42, batch_size: int = 5000) -> CustomerStore:
+    """Cria (ou completa) `db_file` com `users` perfis sintéticos, gravados em lotes."""
+    store = CustomerStore(db_file, seed_file=None)
+    factory = ProfileFactory(seed=seed)
+    for start in range(0, users, batch_size):
+        store.put_many({
+            profile["user_id"]: profile
+            for profile in (factory.profile(index) for index in range(start, min(start + batch_size, users)))
+        })
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera uma base sintética de clientes para os benchmarks.")
+    parser.add_argument("db", help="Arquivo SQLite de destino.")
+    parser.add_argument("--users", type=int, default=10000, help="Quantidade de clientes (1k a 1M).")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    started_at = time.perf_counter()
+    generate_database(args.db, args.users, seed=args.seed)
+    print(f"✅ {args.users} perfis gerados em '{args.db}' em {time.perf_counter() - started_at:.1f}s.")
@@ -0,0 +1,42 @@
+import multiprocessing
+import os
+
+# Configuração de produção: `gunicorn -c gunicorn.conf.py server:app`.
+# As variáveis abaixo valem para o processo mestre e para todos os workers.
+os.environ.setdefault("AEGIS_SESSION_BACKEND", "sqlite")
+os.environ.setdefault("AEGIS_DEMO_RESET", "0")
+
+bind = os.getenv("AEGIS_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("AEGIS_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# Threads por worker: as conversas passam a maior parte do tempo esperando o modelo.
+worker_class = "gthread"
+threads = int(os.getenv("AEGIS_THREADS", "8"))
+timeout = int(os.getenv("AEGIS_WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+# Recicla os workers periodicamente (com jitter, para não reiniciarem todos juntos).
+max_requests = int(os.getenv("AEGIS_MAX_REQUESTS", "2000"))
+max_requests_jitter = max_requests // 10
+
+# O mestre importa a aplicação uma vez (agentes, base de clientes e, com AEGIS_WARM_UP, o
+# LangChain) e os workers herdam os módulos já carregados por fork. Conexões SQLite, o loop
+# assíncrono e as filas de log são recriados em cada worker na primeira utilização.
+preload_app = True
+
+
+def when_ready(server):
+    # Cria o esquema e completa a tabela de atributos uma única vez, antes de os workers subirem.
+    from src.agents.session_registry import create_session_backend
+    from src.storage.customer_store import get_customer_store
+    get_customer_store()
+    create_session_backend()
+    if os.getenv("AEGIS_WARM_UP", "1") == "1":
+        # Importar o LangChain no mestre faz os workers herdarem os módulos; os clientes do
+        # modelo (gRPC) não sobrevivem ao fork e são criados em cada worker, em `warm_up`.
+        import src.agents.agent_concierge
+
+
+def post_worker_init(worker):
+    import server
+    if server.WARM_UP:
+        server.warm_up()
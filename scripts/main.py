@@ -1,7 +1,9 @@
 import os
 import sys
 from dotenv import load_dotenv
-from agent_concierge import create_concierge_agent
+
+# Permite executar como `python scripts/main.py` a partir da raiz do projeto.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 def main():
     """
@@ -17,6 +19,8 @@ def main():
     print("   Simulação de uma conversa de WhatsApp.")
     print("="*60)
 
+    # Importado só depois da verificação da chave: carrega o LangChain e o cliente do Gemini.
+    from src.agents.agent_concierge import create_concierge_agent
     concierge = create_concierge_agent()
 
     print("\n--- Conversa Iniciada ---")
@@ -1,43 +1,148 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import json
+import os
+import time
+from functools import lru_cache
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from src.agents.agent_concierge import create_concierge_agent
+# Nada aqui importa o LangChain: a Concierge (e o modelo) só são carregados em `concierge()`,
+# na primeira conversa ou em `warm_up()`.
+from src.agents.registry import get_agent_registry
+from src.agents.session_registry import DEFAULT_SESSION_ID, USER_ID
+from src.agents.streaming import get_async_runner
+from src.observability.logs import get_logger
+from src.observability.telemetry import get_telemetry
+from src.storage.customer_store import get_customer_store, SEED_FILE
 
-try:
-    with open('src/data/customer_profile.json', 'r', encoding='utf-8') as f:
-        ORIGINAL_USER_PROFILE = json.load(f)
-except FileNotFoundError:
-    print("ERRO: Arquivo 'src/data/customer_profile.json' não encontrado. Verifique o caminho.")
-    exit()
+logger = get_logger("server")
+
+# Modo demonstração: um "Olá" restaura o perfil do cliente a partir do arquivo de seed.
+# Em produção (gunicorn.conf.py) fica desligado, para que nenhuma mensagem sobrescreva dados reais.
+DEMO_RESET = os.getenv("AEGIS_DEMO_RESET", "1") == "1"
+# Com "0", a Concierge só é criada na primeira conversa: o processo sobe mais rápido (réplicas
+# com autoscaling), e a primeira resposta paga a criação.
+WARM_UP = os.getenv("AEGIS_WARM_UP", "1") == "1"
+
+@lru_cache(maxsize=1)
+def original_user_profiles() -> dict:
+    try:
+        with open(SEED_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.error("ERRO: Arquivo 'src/data/customer_profile.json' não encontrado. Verifique o caminho.")
+        return {}
 
 def write_database(data):
-    with open('src/data/customer_profile.json', 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4)
+    get_customer_store().put_many(data)
 
 app = Flask(__name__)
 CORS(app)
 
-print("🤖 Inicializando a Agente Grace... Por favor, aguarde.")
-concierge_agent = create_concierge_agent()
-print("✅ Agente Pronta!")
+def concierge():
+    return get_agent_registry().concierge
 
-@app.route('/chat', methods=['POST'])
-def chat():
+def warm_up():
+    """
+    Cria a Concierge (modelo, ferramentas, agente) e abre a base antes da primeira requisição.
+    No gunicorn roda em cada worker, depois do fork (ver gunicorn.conf.py).
+    """
+    logger.info("🤖 Inicializando a Agente Grace... Por favor, aguarde.")
+    started_at = time.perf_counter()
+    with get_telemetry().span("startup.warm_up"):
+        get_customer_store().count()
+        concierge()
+    logger.info(f"✅ Agente Pronta! ({time.perf_counter() - started_at:.2f}s)")
+
+def read_chat_request():
     user_message = request.json['message']
-    print(f"👤 Mensagem recebida da interface: {user_message}")
+    session_id = request.json.get('session_id') or DEFAULT_SESSION_ID
+    user_id = request.json.get('user_id') or USER_ID
+    logger.info(f"👤 Mensagem recebida da interface ({session_id}): {user_message}")
 
     if user_message == "Olá":
-        print("🔄 Detectada nova sessão, restaurando o perfil do usuário para o padrão.")
-        write_database(ORIGINAL_USER_PROFILE)
+        logger.info("🔄 Detectada nova sessão, reiniciando a conversa.")
+        concierge().reset_session(session_id)
+        if DEMO_RESET and user_id in original_user_profiles():
+            logger.info("🔄 Modo demonstração: restaurando o perfil do usuário para o padrão.")
+            write_database({user_id: original_user_profiles()[user_id]})
+    return user_message, session_id, user_id
 
-    agent_response = concierge_agent.run(user_message)
-    print(f"🤖 Resposta gerada pela agente: {agent_response}")
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    with get_telemetry().span("http.chat") as span:
+        user_message, session_id, user_id = read_chat_request()
+        span["session_id"] = session_id
+        agent_response = concierge().run(user_message, session_id=session_id, user_id=user_id)
+    logger.info(f"🤖 Resposta gerada pela agente: {agent_response}")
 
     return jsonify({'reply': agent_response})
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Mesma conversa de /chat, mas entregue como server-sent events conforme o modelo gera a resposta."""
+    user_message, session_id, user_id = read_chat_request()
+    chunks = get_async_runner().iterate(
+        lambda: concierge().astream(user_message, session_id=session_id, user_id=user_id)
+    )
+
+    def generate():
+        started_at = time.perf_counter()
+        reply = []
+        try:
+            for chunk in chunks:
+                reply.append(chunk)
+                yield sse_event("token", {"text": chunk})
+        except Exception as error:
+            logger.error(f"❌ Erro durante o streaming da resposta: {error}")
+            get_telemetry().record_span("http.chat_stream", time.perf_counter() - started_at, status="error", session_id=session_id)
+            yield sse_event("error", {"reply": "Desculpe, tive um problema para responder agora. Tente novamente em um instante."})
+            return
+        get_telemetry().record_span("http.chat_stream", time.perf_counter() - started_at, session_id=session_id)
+        logger.info(f"🤖 Resposta gerada pela agente: {''.join(reply)}")
+        yield sse_event("done", {"reply": "".join(reply)})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Durações por span, tempo de banco e tokens do modelo no formato texto do Prometheus."""
+    return Response(get_telemetry().render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/fast-path', methods=['GET'])
+def fast_path_metrics():
+    """Taxa de acerto do roteador de consultas simples e o tempo estimado economizado com ele."""
+    return jsonify(concierge().router.stats())
+
+@app.route('/metrics/llm-cache', methods=['GET'])
+def llm_cache_metrics():
+    """Acertos do cache de respostas do LLM e o tempo de geração economizado."""
+    cache = concierge().response_cache
+    return jsonify(cache.stats() if cache else {"enabled": False})
+
+@app.route('/metrics/llm-client', methods=['GET'])
+def llm_client_metrics():
+    """Estado do disjuntor, chamadas em andamento, novas tentativas e pedidos agrupados."""
+    return jsonify(concierge().llm.client.stats())
+
+@app.route('/metrics/offer-cache', methods=['GET'])
+def offer_cache_metrics():
+    """Acertos do cache de ofertas do Dynamo (visualizações repetidas de uma fatura no checkout)."""
+    return jsonify(get_agent_registry().dynamo.offer_cache.stats())
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Verificação de vida para o balanceador e para o gunicorn: a base responde neste processo."""
+    get_customer_store().count()
+    return jsonify({"status": "ok", "pid": os.getpid()})
+
 if __name__ == '__main__':
+    if WARM_UP:
+        warm_up()
     app.run(debug=True, port=5000)
\ No newline at end of file
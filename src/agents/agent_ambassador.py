@@ -1,62 +1,222 @@
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
 from .agent_oracle import OracleAgent
+from ..storage.customer_store import get_customer_store
+from ..observability.logs import get_logger
+from ..observability.telemetry import traced
+
+logger = get_logger("ambassador")
+
+def build_retention_action(churn_analysis: dict) -> dict:
+    """Escolhe a ação de retenção para um resultado do Oracle, sem efeitos colaterais."""
+    churn_prob = churn_analysis["churn_probability"]
+    risk_level = churn_analysis["risk_level"]
+    reasons = churn_analysis["reasons"]
+
+    if risk_level not in ["Alto", "Médio"]:
+        return {
+            "action_taken": False,
+            "risk_level": risk_level,
+            "reason": "O risco de churn do cliente é baixo."
+        }
+
+    action_message = ""
+    if any("Inatividade" in r for r in reasons):
+        action_message = (
+            f"Olá! Sentimos sua falta. Notamos que você não tem aproveitado muito nossos serviços. "
+            f"Como incentivo, estamos oferecendo um upgrade de velocidade gratuito por 30 dias!"
+        )
+    elif any("falha(s) de pagamento" in r for r in reasons):
+         action_message = (
+            f"Olá, notamos que houve um problema com seu último pagamento. "
+            f"Não se preocupe, oferecemos opções flexíveis para regularizar. Que tal parcelar o valor em 2x sem juros?"
+        )
+    else:
+        action_message = (
+            f"Olá! Como nosso cliente, queremos garantir que você tenha a melhor experiência. "
+            f"Temos uma oferta especial de 15% de desconto na sua próxima fatura."
+        )
+
+    return {
+        "action_taken": True,
+        "risk_level": risk_level,
+        "churn_probability": churn_prob,
+        "suggested_action": "Enviar notificação proativa de retenção.",
+        "message_to_user": action_message
+    }
+
+class JsonlActionSink:
+    """Grava cada ação de retenção como uma linha JSON, à medida que são geradas."""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, action: dict):
+        with self._lock:
+            self._file.write(json.dumps(action, ensure_ascii=False) + "\n")
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
 
 class AmbassadorAgent:
     """
     O braço executivo do Oracle, agindo com base na inteligência preditiva
     para gerenciar proativamente a relação com o cliente.
     """
-    def __init__(self):
-        self.oracle = OracleAgent()
+    def __init__(self, oracle: OracleAgent = None, store=None):
+        self.store = store or get_customer_store()
+        self.oracle = oracle or OracleAgent(store=self.store)
 
+    @traced("ambassador.create_proactive_retention_action")
     def create_proactive_retention_action(self, user_id: str) -> dict:
         """
         Verifica o risco de churn e, se for alto, cria uma ação de retenção personalizada.
         """
-        print(f"🤖 Ambassador: Verificando necessidade de ação proativa para {user_id}.")
+        logger.info(f"🤖 Ambassador: Verificando necessidade de ação proativa para {user_id}.")
 
         churn_analysis = self.oracle.calculate_churn_risk(user_id)
         if churn_analysis.get("error"):
             return {"action_taken": False, "reason": churn_analysis["error"]}
 
-        churn_prob = churn_analysis["churn_probability"]
-        risk_level = churn_analysis["risk_level"]
-        reasons = churn_analysis["reasons"]
-
-        if risk_level in ["Alto", "Médio"]:
-            print(f"🤖 Ambassador: Risco de churn '{risk_level}' ({churn_prob:.2%}) detectado. Gerando ação.")
-
-            action_message = ""
-            if any("Inatividade" in r for r in reasons):
-                action_message = (
-                    f"Olá! Sentimos sua falta. Notamos que você não tem aproveitado muito nossos serviços. "
-                    f"Como incentivo, estamos oferecendo um upgrade de velocidade gratuito por 30 dias!"
-                )
-            elif any("falha(s) de pagamento" in r for r in reasons):
-                 action_message = (
-                    f"Olá, notamos que houve um problema com seu último pagamento. "
-                    f"Não se preocupe, oferecemos opções flexíveis para regularizar. Que tal parcelar o valor em 2x sem juros?"
-                )
-            else:
-                action_message = (
-                    f"Olá! Como nosso cliente, queremos garantir que você tenha a melhor experiência. "
-                    f"Temos uma oferta especial de 15% de desconto na sua próxima fatura."
-                )
-
-            return {
-                "action_taken": True,
-                "risk_level": risk_level,
-                "churn_probability": churn_prob,
-                "suggested_action": "Enviar notificação proativa de retenção.",
-                "message_to_user": action_message
-            }
+        action = build_retention_action(churn_analysis)
+        if action["action_taken"]:
+            logger.info(f"🤖 Ambassador: Risco de churn '{action['risk_level']}' ({action['churn_probability']:.2%}) detectado. Gerando ação.")
         else:
-            print(f"🤖 Ambassador: Risco de churn 'Baixo' ({churn_prob:.2%}). Nenhuma ação necessária.")
-            return {
-                "action_taken": False,
-                "risk_level": risk_level,
-                "reason": "O risco de churn do cliente é baixo."
+            logger.info(f"🤖 Ambassador: Risco de churn 'Baixo' ({churn_analysis['churn_probability']:.2%}). Nenhuma ação necessária.")
+        return action
+
+    @traced("ambassador.run_retention_campaign")
+    def run_retention_campaign(self, sink, user_ids: list = None, workers: int = None,
+                               dedup_days: int = 7, chunk_size: int = 1000) -> dict:
+        """
+        Executa uma campanha de retenção sobre um segmento (lista de user_ids) ou toda a base.
+        O churn é avaliado em lotes por um pool de `workers` processos; cada ação gerada é
+        enviada ao `sink` (ex.: JsonlActionSink) assim que o lote fica pronto. Clientes que
+        receberam uma ação nos últimos `dedup_days` dias são ignorados.
+        """
+        logger.info("🤖 Ambassador: Iniciando campanha de retenção.")
+        started_at = time.perf_counter()
+        store = self.store
+        if user_ids is None:
+            user_ids = store.user_ids()
+        workers = workers or os.cpu_count() or 1
+
+        cutoff = (datetime.now() - timedelta(days=dedup_days)).isoformat()
+        last_actions = store.json_field_many(user_ids, "$.retention.last_action_date")
+        eligible = [user_id for user_id in user_ids if user_id in last_actions and (last_actions[user_id] or "") < cutoff]
+
+        evaluated = 0
+        actions_sent = 0
+        for results in self.oracle.iter_churn_scores(eligible, processes=workers, chunk_size=chunk_size):
+            sent_now = {}
+            for churn_analysis in results:
+                evaluated += 1
+                action = build_retention_action(churn_analysis)
+                if not action["action_taken"]:
+                    continue
+                action["user_id"] = churn_analysis["user_id"]
+                action["created_at"] = datetime.now().isoformat()
+                sink.write(action)
+                sent_now[action["user_id"]] = {"last_action_date": action["created_at"]}
+            if sent_now:
+                store.patch_many("retention", sent_now)
+                actions_sent += len(sent_now)
+            if hasattr(sink, "flush"):
+                sink.flush()
+
+        elapsed = time.perf_counter() - started_at
+        summary = {
+            "segment_size": len(user_ids),
+            "skipped_recent_or_missing": len(user_ids) - len(eligible),
+            "evaluated": evaluated,
+            "actions_sent": actions_sent,
+            "workers": workers,
+            "elapsed_seconds": round(elapsed, 3),
+            "users_per_second": round(evaluated / elapsed, 1) if elapsed > 0 else None,
+        }
+        logger.info(f"🤖 Ambassador: Campanha concluída. {actions_sent} ações para {evaluated} clientes avaliados "
+                    f"em {summary['elapsed_seconds']}s.")
+        return summary
+
+    @traced("ambassador.run_card_expiry_campaign")
+    def run_card_expiry_campaign(self, sink, days: int = 30, dedup_days: int = 7) -> dict:
+        """
+        Avisa os clientes cujos cartões vencem nos próximos `days` dias, consultando o índice
+        de validade da base inteira de uma vez. Cada aviso vai para o `sink`; clientes avisados
+        nos últimos `dedup_days` dias são ignorados.
+        """
+        logger.info(f"🤖 Ambassador: Buscando cartões que vencem nos próximos {days} dias.")
+        started_at = time.perf_counter()
+        store = self.store
+        today = date.today()
+        cards = store.cards_expiring(until=today + timedelta(days=days), since=today)
+
+        cutoff = (datetime.now() - timedelta(days=dedup_days)).isoformat()
+        last_notices = store.json_field_many({card["user_id"] for card in cards}, "$.retention.last_card_notice_date")
+        notified = {}
+        for card in cards:
+            user_id = card["user_id"]
+            if user_id in notified or (last_notices.get(user_id) or "") >= cutoff:
+                continue
+            expiry_year, expiry_month = map(int, card["expiry_date"].split('-'))
+            action = {
+                "user_id": user_id,
+                "action_taken": True,
+                "suggested_action": "Enviar lembrete de cartão próximo do vencimento.",
+                "payment_method_id": card["payment_method_id"],
+                "message_to_user": (
+                    f"Olá! Seu cartão {card['brand']} com final {card['last4']} vence em {expiry_month}/{expiry_year}. "
+                    f"Atualize seus dados de pagamento para continuar aproveitando seus serviços sem interrupções."
+                ),
+                "created_at": datetime.now().isoformat(),
             }
+            sink.write(action)
+            notified[user_id] = {"last_card_notice_date": action["created_at"]}
+        if notified:
+            store.patch_many("retention", notified)
+        if hasattr(sink, "flush"):
+            sink.flush()
+
+        elapsed = time.perf_counter() - started_at
+        summary = {
+            "cards_expiring": len(cards),
+            "notices_sent": len(notified),
+            "elapsed_seconds": round(elapsed, 3),
+        }
+        logger.info(f"🤖 Ambassador: {summary['notices_sent']} avisos de vencimento enviados "
+                    f"({summary['cards_expiring']} cartões vencendo) em {summary['elapsed_seconds']}s.")
+        return summary
 
 
 def create_ambassador_agent():
-    return AmbassadorAgent()
\ No newline at end of file
+    return AmbassadorAgent()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Executa uma campanha de retenção proativa.")
+    parser.add_argument("output", help="Arquivo JSONL onde as ações geradas serão gravadas.")
+    parser.add_argument("--users", nargs="*", default=None, help="Segmento de user_ids (padrão: toda a base).")
+    parser.add_argument("--workers", type=int, default=None, help="Processos em paralelo (padrão: número de CPUs).")
+    parser.add_argument("--dedup-days", type=int, default=7, help="Ignora clientes que receberam ação nesse intervalo.")
+    parser.add_argument("--expiring-cards", type=int, default=None, metavar="DIAS",
+                        help="Em vez da campanha de churn, avisa os clientes com cartões vencendo nesse número de dias.")
+    args = parser.parse_args()
+    action_sink = JsonlActionSink(args.output)
+    try:
+        if args.expiring_cards is not None:
+            AmbassadorAgent().run_card_expiry_campaign(action_sink, days=args.expiring_cards, dedup_days=args.dedup_days)
+        else:
+            AmbassadorAgent().run_retention_campaign(action_sink, user_ids=args.users, workers=args.workers,
+                                                     dedup_days=args.dedup_days)
+    finally:
+        action_sink.close()
@@ -1,171 +1,274 @@
-import os
 import json
-import ast
-from datetime import datetime, timedelta
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.agents import AgentType, initialize_agent, Tool
+import asyncio
+import time
+from contextvars import ContextVar
+from datetime import date
+from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain.memory import ConversationBufferMemory
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.tools import StructuredTool
 
-from .agent_guardian import GuardianAgent
-from .agent_dynamo import DynamoAgent
+from .conversation_memory import MEMORY_MODE, BoundedSummaryMemory
+from .intent_router import IntentRouter
+from .llm_telemetry import LLMTelemetryCallback
+from .llm_cache import LLM_CACHE_ENABLED, ResponseCache
+from .llm_client import ResilientChatModel, get_llm_client
+from .registry import get_agent_registry
+from .session_registry import DEFAULT_SESSION_ID, USER_ID, SessionRegistry, create_session_backend
+from .streaming import get_async_runner
+from .tool_schemas import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, BillingCursor, BillingPageSize, BillingStatus, EndDate, Location, MaxAmount,
+    MinAmount, NewAddress, NewEmail, PaymentMethodId, PaymentMethodsCursor, PaymentMethodsPageSize, PaymentType,
+    StartDate, TransactionId,
+)
+from ..storage.billing_index import summarize_transaction
+from ..storage.customer_store import get_customer_store, CustomerNotFoundError
+from ..observability.logs import get_logger
+from ..observability.telemetry import get_telemetry, traced
 
-USER_ID = "user_maria_123"
+logger = get_logger("concierge")
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(BASE_DIR, '..', 'data', 'customer_profile.json')
+_current_user_id = ContextVar("current_user_id", default=USER_ID)
 
-def read_database():
-    with open(DB_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def write_database(data):
-    with open(DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4)
+def current_user_id() -> str:
+    """Usuário da sessão em atendimento; as ferramentas operam sempre sobre ele."""
+    return _current_user_id.get()
 
+@traced("tool.get_user_context")
 def get_user_context() -> str:
     """Verifica o contexto do usuário, como cartões expirando. Use sempre no início da conversa."""
-    print(f"🤖 Grace: Verificando contexto para {USER_ID}")
-    db = read_database()
-    user = db.get(USER_ID)
-    if not user:
+    user_id = current_user_id()
+    logger.info(f"🤖 Grace: Verificando contexto para {user_id}")
+    store = get_customer_store()
+    try:
+        alert = store.take_field(user_id, "proactive_alert")
+    except CustomerNotFoundError:
         return "Usuário não encontrado."
-    if user.get("proactive_alert"):
-        alert_details = user["proactive_alert"]["details"]
-        del user["proactive_alert"]
-        write_database(db)
-        return json.dumps({"proactive_alert": "blocked_transaction", "details": alert_details})
-    for pm in user["payment_methods"]:
-        if pm["type"] == "credit_card" and pm["expiry_date"]:
-            expiry_year, expiry_month = map(int, pm["expiry_date"].split('-'))
-            first_day_of_expiry_month = datetime(expiry_year, expiry_month, 1)
-            effective_expiry_date = (first_day_of_expiry_month + timedelta(days=32)).replace(day=1)
-            if datetime.now() >= effective_expiry_date:
-                return json.dumps({
-                    "proactive_alert": "expiring_card",
-                    "details": f"notei que o seu cartão {pm['brand']} com final {pm['last4']} expirou em {expiry_month}/{expiry_year}. Para evitar problemas em sua assinatura, o ideal é atualizá-lo."
-                })
+    if alert:
+        return json.dumps({"proactive_alert": alert.get("type", "blocked_transaction"), "details": alert["details"]})
+    for card in store.cards_expiring(until=date.today(), user_id=user_id)[:1]:
+        expiry_year, expiry_month = map(int, card["expiry_date"].split('-'))
+        return json.dumps({
+            "proactive_alert": "expiring_card",
+            "details": f"notei que o seu cartão {card['brand']} com final {card['last4']} expirou em {expiry_month}/{expiry_year}. Para evitar problemas em sua assinatura, o ideal é atualizá-lo."
+        })
     return "Nenhum alerta proativo imediato."
 
+@traced("tool.get_personal_info")
 def get_personal_info() -> str:
     """Busca as informações pessoais do usuário."""
-    print(f"🤖 Grace: Buscando informações de {USER_ID}")
-    db = read_database()
-    result = db.get(USER_ID, {}).get("personal_info", {})
+    user_id = current_user_id()
+    logger.info(f"🤖 Grace: Buscando informações de {user_id}")
+    result = (get_customer_store().get(user_id) or {}).get("personal_info", {})
     return json.dumps({"agent_source": "Agente Concierge", "result": result})
 
-def update_personal_info(new_email: str = None, new_address: str = None) -> str:
+@traced("tool.update_personal_info")
+def update_personal_info(new_email: NewEmail = None, new_address: NewAddress = None) -> str:
     """Atualiza o e-mail ou endereço do usuário."""
-    print(f"🤖 Grace: Atualizando informações de {USER_ID}")
-    db = read_database()
-    user = db.get(USER_ID)
-    if not user:
+    user_id = current_user_id()
+    logger.info(f"🤖 Grace: Atualizando informações de {user_id}")
+    def apply_changes(user):
+        if new_email:
+            user["personal_info"]["email"] = new_email
+        if new_address:
+            user["personal_info"]["address"] = new_address
+
+    try:
+        get_customer_store().update(user_id, apply_changes)
+    except CustomerNotFoundError:
         return json.dumps({"agent_source": "Agente Concierge", "result": "Usuário não encontrado."})
-    if new_email:
-        user["personal_info"]["email"] = new_email
-    if new_address:
-        user["personal_info"]["address"] = new_address
-    write_database(db)
     return json.dumps({"agent_source": "Agente Concierge", "result": f"Informações atualizadas com sucesso!"})
 
-def get_payment_methods() -> str:
-    """Consulta os métodos de pagamento do usuário."""
-    print(f"🤖 Grace: Consultando métodos de pagamento de {USER_ID}")
-    db = read_database()
-    result = db.get(USER_ID, {}).get("payment_methods", [])
+def _parse_cursor(cursor):
+    """O cursor das ferramentas de listagem é um inteiro não negativo em texto; None se inválido."""
+    try:
+        value = int(cursor)
+    except (TypeError, ValueError):
+        return None
+    return value if value >= 0 else None
+
+def _page_size(page_size) -> int:
+    return max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+@traced("tool.get_payment_methods")
+def get_payment_methods(payment_type: PaymentType = None, page_size: PaymentMethodsPageSize = DEFAULT_PAGE_SIZE,
+                        cursor: PaymentMethodsCursor = None) -> str:
+    """Consulta os métodos de pagamento do usuário, em páginas, opcionalmente só de um tipo."""
+    user_id = current_user_id()
+    logger.info(f"🤖 Grace: Consultando métodos de pagamento de {user_id}")
+    start = _parse_cursor(cursor) if cursor else 0
+    if start is None:
+        return json.dumps({"agent_source": "Agente Concierge", "result": f"Cursor inválido: {cursor}."})
+    methods = (get_customer_store().get(user_id) or {}).get("payment_methods", [])
+    if payment_type:
+        methods = [pm for pm in methods if pm.get("type") == payment_type]
+    end = start + _page_size(page_size)
+    result = {
+        "payment_methods": methods[start:end],
+        "total": len(methods),
+        "next_cursor": str(end) if end < len(methods) else None,
+    }
     return json.dumps({"agent_source": "Agente Concierge", "result": result})
 
-def get_billing_history() -> str:
-    """Consulta o histórico de faturamento do usuário."""
-    print(f"🤖 Grace: Consultando histórico de faturamento de {USER_ID}")
-    db = read_database()
-    result = db.get(USER_ID, {}).get("billing_history", [])
+@traced("tool.get_billing_history")
+def get_billing_history(start_date: StartDate = None, end_date: EndDate = None, status: BillingStatus = None,
+                        location: Location = None, min_amount: MinAmount = None, max_amount: MaxAmount = None,
+                        page_size: BillingPageSize = DEFAULT_PAGE_SIZE, cursor: BillingCursor = None) -> str:
+    """
+    Consulta o histórico de faturamento do usuário, das faturas mais recentes para as mais
+    antigas, com filtros opcionais e em páginas (pelo índice de transações da base).
+    """
+    user_id = current_user_id()
+    logger.info(f"🤖 Grace: Consultando histórico de faturamento de {user_id}")
+    position = _parse_cursor(cursor) if cursor else None
+    if cursor and position is None:
+        return json.dumps({"agent_source": "Agente Concierge", "result": f"Cursor inválido: {cursor}."})
+    page = get_customer_store().query_transactions(
+        user_id, since=start_date, until=end_date, status=status, location=location,
+        min_amount=min_amount, max_amount=max_amount, limit=_page_size(page_size), cursor=position,
+    )
+    result = {
+        "transactions": [summarize_transaction(transaction) for transaction in page["transactions"]],
+        "total": page["total"],
+        "next_cursor": str(page["next_cursor"]) if page["next_cursor"] is not None else None,
+    }
     return json.dumps({"agent_source": "Agente Concierge", "result": result})
 
+@traced("tool.get_subscriptions")
 def get_subscriptions() -> str:
     """Consulta as assinaturas e serviços ativos do usuário."""
-    print(f"🤖 Grace: Consultando assinaturas de {USER_ID}")
-    db = read_database()
-    result = db.get(USER_ID, {}).get("subscriptions", [])
+    user_id = current_user_id()
+    logger.info(f"🤖 Grace: Consultando assinaturas de {user_id}")
+    result = (get_customer_store().get(user_id) or {}).get("subscriptions", [])
     return json.dumps({"agent_source": "Agente Concierge", "result": result})
 
-def analyze_suspicious_transaction(transaction_id: str) -> str:
+@traced("tool.analyze_suspicious_transaction")
+def analyze_suspicious_transaction(transaction_id: TransactionId) -> str:
     """Analisa uma transação específica que o usuário considera suspeita."""
-    print(f"🤖 Grace: Acionando Guardian para análise da transação {transaction_id}")
-    db = read_database()
-    user_history = db.get(USER_ID, {}).get("billing_history", [])
-    transaction_to_analyze = next((t for t in user_history if t["transaction_id"] == transaction_id), None)
+    user_id = current_user_id()
+    logger.info(f"🤖 Grace: Acionando Guardian para análise da transação {transaction_id}")
+    transaction_to_analyze = get_customer_store().transaction(user_id, transaction_id)
     if not transaction_to_analyze:
         return json.dumps({"agent_source": "Agente Concierge", "result": f"Transação com ID {transaction_id} não encontrada."})
-    guardian_agent = GuardianAgent()
-    analysis_result = guardian_agent.analyze_transaction(USER_ID, transaction_to_analyze)
+    analysis_result = get_agent_registry().guardian.analyze_transaction(user_id, transaction_to_analyze)
     return json.dumps({"agent_source": "Agente Guardian", "result": analysis_result})
 
-def get_dynamic_payment_options(transaction_id: str) -> str:
+@traced("tool.get_dynamic_payment_options")
+def get_dynamic_payment_options(transaction_id: TransactionId) -> str:
     """Verifica e oferece opções de pagamento dinâmicas para uma fatura."""
-    print(f"🤖 Grace: Acionando Dynamo para obter opções para a transação {transaction_id}.")
-    db = read_database()
-    user = db.get(USER_ID)
-    if not user: return json.dumps({"agent_source": "Agente Concierge", "result": "Usuário não encontrado."})
-    transaction = next((t for t in user.get("billing_history", []) if t["transaction_id"] == transaction_id), None)
+    user_id = current_user_id()
+    logger.info(f"🤖 Grace: Acionando Dynamo para obter opções para a transação {transaction_id}.")
+    store = get_customer_store()
+    transaction = store.transaction(user_id, transaction_id)
+    if not transaction and not store.exists(user_id): return json.dumps({"agent_source": "Agente Concierge", "result": "Usuário não encontrado."})
     if not transaction: return json.dumps({"agent_source": "Agente Concierge", "result": f"Transação {transaction_id} não encontrada."})
-    transaction_details_for_dynamo = {"amount_brl": transaction["amount_brl"], "location": transaction["location"], "time_on_page_seconds": 20}
-    dynamo_agent = DynamoAgent()
-    offer = dynamo_agent.generate_dynamic_offer(USER_ID, transaction_details_for_dynamo)
+    transaction_details_for_dynamo = {"transaction_id": transaction_id, "amount_brl": transaction["amount_brl"], "location": transaction["location"], "time_on_page_seconds": 20}
+    offer = get_agent_registry().dynamo.generate_dynamic_offer(user_id, transaction_details_for_dynamo)
     return json.dumps({"agent_source": "Agente Dynamo", "result": offer})
 
-def delete_payment_method(payment_method_id: str) -> str:
+@traced("tool.delete_payment_method")
+def delete_payment_method(payment_method_id: PaymentMethodId) -> str:
     """Remove um método de pagamento do perfil do usuário."""
-    print(f"🤖 Grace: Removendo o método de pagamento {payment_method_id}.")
-    db = read_database()
-    user = db.get(USER_ID)
-    if not user:
-        return json.dumps({"agent_source": "Agente Concierge", "result": "Usuário não encontrado."})
-    initial_len = len(user["payment_methods"])
-    user["payment_methods"] = [pm for pm in user["payment_methods"] if pm.get("id") != payment_method_id]
-    if len(user["payment_methods"]) < initial_len:
+    user_id = current_user_id()
+    logger.info(f"🤖 Grace: Removendo o método de pagamento {payment_method_id}.")
+    def remove_method(user):
+        initial_len = len(user["payment_methods"])
+        user["payment_methods"] = [pm for pm in user["payment_methods"] if pm.get("id") != payment_method_id]
+        if len(user["payment_methods"]) == initial_len:
+            return False
         if user.get("preferred_payment_method_id") == payment_method_id:
             user["preferred_payment_method_id"] = None
-        write_database(db)
+        return True
+
+    try:
+        removed = get_customer_store().update(user_id, remove_method)
+    except CustomerNotFoundError:
+        return json.dumps({"agent_source": "Agente Concierge", "result": "Usuário não encontrado."})
+    if removed:
         return json.dumps({"agent_source": "Agente Concierge", "result": f"Método de pagamento {payment_method_id} removido com sucesso."})
     else:
         return json.dumps({"agent_source": "Agente Concierge", "result": f"Método de pagamento com ID {payment_method_id} não encontrado."})
 
+def _response_cache_scope() -> str:
+    """Respostas em cache valem só para o mesmo usuário e a mesma versão do perfil."""
+    user_id = current_user_id()
+    return f"{user_id}:{get_customer_store().version(user_id)}"
+
 class ConciergeAgent:
-    def __init__(self):
-        self.user_id = USER_ID
-        self.llm = ChatGoogleGenerativeAI(model="gemini-pro-latest", temperature=0.1, convert_system_message_to_human=True)
-        self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    """
+    Um único cliente LLM e um único conjunto de ferramentas atendem todas as conversas.
+    Cada sessão tem a própria memória e fica ligada a um user_id, que as ferramentas
+    leem via `current_user_id()` durante o turno. `llm` permite trocar o Gemini por outro
+    modelo de chat (ex.: o modelo roteirizado dos benchmarks). Em ambos os casos o modelo é
+    chamado através de `ResilientChatModel` (limite de concorrência, prazos, novas tentativas
+    e disjuntor, ver llm_client.py), que também consulta o cache de respostas.
+    """
+    def __init__(self, sessions: SessionRegistry = None, llm=None):
+        self.response_cache = ResponseCache(scope=_response_cache_scope) if LLM_CACHE_ENABLED else None
+        self.llm = ResilientChatModel(inner=llm or self._create_gemini(), client=get_llm_client(),
+                                      response_cache=self.response_cache)
+        if sessions is None:
+            sessions = SessionRegistry(memory_factory=self._new_memory, backend=create_session_backend())
+        self.sessions = sessions
+        self.router = IntentRouter(tools={
+            "subscriptions": get_subscriptions,
+            "billing_history": get_billing_history,
+            "payment_methods": get_payment_methods,
+        })
         self.agent = self._create_agent()
 
+    def _create_gemini(self):
+        # Importado só aqui: o cliente do Gemini carrega a pilha gRPC, desnecessária com outro modelo.
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model="gemini-pro-latest", temperature=0.1, convert_system_message_to_human=True,
+            # Uma tentativa por chamada: as novas tentativas e os prazos ficam com o ResilientLLMClient.
+            max_retries=1,
+            callbacks=[LLMTelemetryCallback("gemini-pro-latest")]
+        )
+
+    def _new_memory(self):
+        """
+        Memória de cada sessão, conforme `AEGIS_MEMORY_MODE`: "summary" (padrão) mantém as
+        últimas trocas e um resumo do restante; "llm_summary" faz esse resumo com o modelo;
+        "buffer" guarda a conversa inteira.
+        """
+        if MEMORY_MODE == "buffer":
+            return ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        return BoundedSummaryMemory(llm=self.llm if MEMORY_MODE == "llm_summary" else None)
+
     def _create_agent(self):
-        tools = [
-            Tool.from_function(func=lambda _: get_user_context(), name="Verificar Contexto do Usuário", description="Sempre use esta ferramenta primeiro para verificar se há alguma ação proativa a ser tomada, como um alerta de segurança ou um cartão expirado. Não requer argumentos."),
-            Tool.from_function(func=lambda _: get_personal_info(), name="Consultar Informações Pessoais", description="Útil para buscar o nome, e-mail ou endereço do usuário. Não requer argumentos."),
-            Tool(name="Atualizar Informações Pessoais", func=lambda tool_input: update_personal_info(**ast.literal_eval(tool_input)), description="Útil para alterar o e-mail ou endereço do usuário. Requer um dicionário com os novos dados (new_email ou new_address)."),
-            Tool.from_function(func=lambda _: get_payment_methods(), name="Consultar Métodos de Pagamento", description="Útil para listar os métodos de pagamento do usuário. Não requer argumentos."),
-            Tool.from_function(func=lambda _: get_billing_history(), name="Consultar Histórico de Faturamento", description="Útil para ver as faturas passadas do usuário. Não requer argumentos."),
-            
-            Tool.from_function(
-                func=lambda _: get_subscriptions(), 
-                name="Consultar Assinaturas Ativas", 
-                description="Use esta ferramenta quando o usuário perguntar sobre suas assinaturas, planos ou serviços ativos."
-            ),
+        def tool(func, description):
+            # O esquema de argumentos, inferido da assinatura da função (ver tool_schemas.py),
+            # vai para o modelo como declaração de função; os argumentos chegam já validados,
+            # sem interpretar texto livre.
+            return StructuredTool.from_function(
+                func=func, name=func.__name__, description=description, handle_validation_error=True,
+            )
 
-            Tool(
-                name="Analisar Transação Suspeita", 
-                func=lambda tool_input: analyze_suspicious_transaction(**ast.literal_eval(tool_input)),
-                description="Analisa uma transação suspeita usando seu ID. É a única forma de obter uma análise de risco. Se o usuário mencionar uma cobrança mas não fornecer o ID exato (ex: 'a cobrança de São Paulo'), você deve primeiro usar a ferramenta 'Consultar Histórico de Faturamento' para listar as transações e então pedir para o usuário confirmar o ID da transação que ele quer analisar."
+        self.tools = tools = [
+            tool(get_user_context, "Sempre use esta ferramenta primeiro para verificar se há alguma ação proativa a ser tomada, como um alerta de segurança ou um cartão expirado."),
+            tool(get_personal_info, "Útil para buscar o nome, e-mail ou endereço do usuário."),
+            tool(update_personal_info, "Útil para alterar o e-mail ou endereço do usuário."),
+            tool(get_payment_methods, "Útil para listar os métodos de pagamento do usuário. Se houver next_cursor, há mais métodos: repita a chamada com esse cursor para vê-los."),
+            tool(
+                get_billing_history,
+                "Útil para ver as faturas passadas do usuário, das mais recentes para as mais antigas. Use os filtros de período, status, local ou valor quando o usuário os mencionar (ex.: a cobrança de São Paulo, as faturas que falharam). O resultado traz o total de faturas encontradas; se houver next_cursor, repita a chamada com esse cursor para ver as anteriores.",
+            ),
+            tool(get_subscriptions, "Use esta ferramenta quando o usuário perguntar sobre suas assinaturas, planos ou serviços ativos."),
+            tool(
+                analyze_suspicious_transaction,
+                "Analisa uma transação suspeita usando seu ID. É a única forma de obter uma análise de risco. Se o usuário mencionar uma cobrança mas não fornecer o ID exato (ex: 'a cobrança de São Paulo'), você deve primeiro usar a ferramenta get_billing_history, filtrando pelo que ele disse (ex.: location='São Paulo'), para listar as transações e então pedir para o usuário confirmar o ID da transação que ele quer analisar.",
             ),
-            Tool(name="Oferecer Opções de Pagamento Dinâmico", func=lambda tool_input: get_dynamic_payment_options(**ast.literal_eval(tool_input)), description="Use para verificar e apresentar opções de pagamento, como parcelamentos, para uma fatura. Requer um dicionário com o ID da transação (transaction_id)."),
-            Tool(
-                name="Remover Método de Pagamento",
-                func=lambda tool_input: delete_payment_method(**ast.literal_eval(tool_input)),
-                description="Útil para apagar ou remover um método de pagamento existente, como um cartão de crédito. Requer o ID exato do método de pagamento (`payment_method_id`). Se o usuário não fornecer o ID, você deve primeiro usar a ferramenta 'Consultar Métodos de Pagamento' para listar os cartões e seus IDs, e então perguntar qual ele deseja remover."
+            tool(get_dynamic_payment_options, "Use para verificar e apresentar opções de pagamento, como parcelamentos, para uma fatura."),
+            tool(
+                delete_payment_method,
+                "Útil para apagar ou remover um método de pagamento existente, como um cartão de crédito. Se o usuário não fornecer o ID, você deve primeiro usar a ferramenta get_payment_methods para listar os cartões e seus IDs, e então perguntar qual ele deseja remover.",
             ),
         ]
 
-        agent_system_prompt = f"""
-        Você é a Grace, a assistente pessoal de IA da Bemobi para a usuária Maria Silva ({self.user_id}).
+        agent_system_prompt = """
+        Você é a Grace, a assistente pessoal de IA da Bemobi. Cada conversa é com um único cliente, e as ferramentas já operam sobre a conta dele; use get_personal_info para saber seu nome.
         Sua personalidade é prestativa, empática e, acima de tudo, proativa. Você se comunica de forma clara e amigável, como em uma conversa de WhatsApp.
         Seu objetivo é transformar o autoatendimento em uma experiência fácil e guiada.
 
@@ -180,18 +283,119 @@ class ConciergeAgent:
         | txn_def456   | 10/08/2025 | R$ 149,90 |
 
         **Instruções Críticas de Comportamento:**
-        1.  **Seja Proativa:** No início de CADA conversa, SEMPRE use a ferramenta "Verificar Contexto do Usuário". Se houver um alerta, inicie a conversa abordando esse ponto de forma natural. Exemplo: "Olá Maria! Tudo bem? Antes de mais nada, notei que...".
-        2.  **Atribuição de Agente:** Se a ferramenta retornar "agent_source", comece sua resposta com "Grace(Nome do Agente): ". Ex: "Grace(Agente Guardian): Maria, analisei a transação e...". Senão, responda normalmente como "Grace:".
-        3.  **Linguagem Natural:** Fale com a Maria de forma pessoal e direta. Evite jargões.
+        1.  **Seja Proativa:** No início de CADA conversa, SEMPRE use a ferramenta get_user_context. Se houver um alerta, inicie a conversa abordando esse ponto de forma natural. Exemplo: "Olá, [nome do cliente]! Tudo bem? Antes de mais nada, notei que...".
+        2.  **Atribuição de Agente:** Se a ferramenta retornar "agent_source", comece sua resposta com "Grace(Nome do Agente): ". Ex: "Grace(Agente Guardian): [nome do cliente], analisei a transação e...". Senão, responda normalmente como "Grace:".
+        3.  **Linguagem Natural:** Fale com o cliente de forma pessoal e direta. Evite jargões.
+        4.  **Ferramentas em Paralelo:** Quando precisar de mais de uma ferramenta e uma não depender da resposta da outra (ex.: get_user_context e get_personal_info no início da conversa), chame todas na mesma resposta.
         """
 
-        return initialize_agent(
-            tools, self.llm, agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION, verbose=False,
-            memory=self.memory, handle_parsing_errors=True, agent_kwargs={"system_message": agent_system_prompt}
-        )
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", agent_system_prompt),
+            MessagesPlaceholder("chat_history"),
+            ("human", "{input}"),
+            MessagesPlaceholder("agent_scratchpad"),
+        ])
+        return create_tool_calling_agent(self.llm, tools, prompt)
+
+    def _session_executor(self, session):
+        if session.executor is None:
+            session.executor = AgentExecutor(agent=self.agent, tools=self.tools, memory=session.memory, verbose=False)
+        return session.executor
+
+    async def _ainvoke(self, executor, user_id: str, user_input: str) -> dict:
+        # No caminho assíncrono o AgentExecutor executa em paralelo as chamadas de
+        # ferramenta independentes que o modelo pede num mesmo passo.
+        token = _current_user_id.set(user_id)
+        try:
+            return await executor.ainvoke({"input": user_input})
+        finally:
+            _current_user_id.reset(token)
+
+    def _fast_path(self, session, user_input):
+        """
+        Tenta responder sem o LLM (ver IntentRouter). O primeiro turno de cada sessão sempre
+        vai ao agente, que é quem verifica os alertas proativos do cliente. Quem chama grava
+        a troca na memória: `run` pela via síncrona, `astream` pela assíncrona.
+        """
+        if session.turns == 0:
+            return None
+        token = _current_user_id.set(session.user_id)
+        try:
+            return self.router.try_answer(user_input)
+        finally:
+            _current_user_id.reset(token)
+
+    def _finish_turn(self, session):
+        session.turns += 1
+        self.sessions.save(session)
+
+    def run(self, user_input, session_id: str = DEFAULT_SESSION_ID, user_id: str = USER_ID):
+        session = self.sessions.get_or_create(session_id, user_id)
+        with get_telemetry().span("concierge.run", session_id=session_id) as span, session.lock:
+            reply = self._fast_path(session, user_input)
+            span["path"] = "fast_path" if reply is not None else "llm"
+            if reply is not None:
+                session.memory.save_context({"input": user_input}, {"output": reply})
+                self._finish_turn(session)
+                return reply
+            executor = self._session_executor(session)
+            started_at = time.perf_counter()
+            result = get_async_runner().run(self._ainvoke(executor, session.user_id, user_input))
+            self.router.record_llm_latency(time.perf_counter() - started_at)
+            self._finish_turn(session)
+        return result.get("output", "Desculpe. Ocorreu um erro e não consegui processar sua solicitação.")
+
+    async def astream(self, user_input, session_id: str = DEFAULT_SESSION_ID, user_id: str = USER_ID):
+        """
+        Versão assíncrona de `run` que entrega a resposta final em pedaços, à medida que o
+        modelo gera os tokens. Só o texto das respostas do modelo é repassado; as chamadas
+        de ferramenta dos passos intermediários ficam de fora.
+        """
+        session = self.sessions.get_or_create(session_id, user_id)
+        if session.async_lock is None:
+            session.async_lock = asyncio.Lock()
+        stream_started_at = time.perf_counter()
+        async with session.async_lock:
+            reply = self._fast_path(session, user_input)
+            if reply is not None:
+                await session.memory.asave_context({"input": user_input}, {"output": reply})
+                self._finish_turn(session)
+                get_telemetry().record_span("concierge.astream", time.perf_counter() - stream_started_at,
+                                            session_id=session_id, path="fast_path")
+                yield reply
+                return
+            executor = self._session_executor(session)
+            token = _current_user_id.set(session.user_id)
+            started_at = time.perf_counter()
+            try:
+                tool_call_runs = set()
+                streamed = False
+                final_output = None
+                async for event in executor.astream_events({"input": user_input}, version="v2"):
+                    if event["event"] == "on_chat_model_stream":
+                        chunk = event["data"]["chunk"]
+                        if chunk.tool_call_chunks:
+                            tool_call_runs.add(event["run_id"])
+                            continue
+                        text = chunk.content
+                        if event["run_id"] in tool_call_runs or not isinstance(text, str) or not text:
+                            continue
+                        streamed = True
+                        yield text
+                    elif event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                        final_output = (event["data"].get("output") or {}).get("output")
+            finally:
+                _current_user_id.reset(token)
+            self.router.record_llm_latency(time.perf_counter() - started_at)
+            self._finish_turn(session)
+        get_telemetry().record_span("concierge.astream", time.perf_counter() - stream_started_at,
+                                    session_id=session_id, path="llm")
+        if not streamed:
+            yield final_output or "Desculpe. Ocorreu um erro e não consegui processar sua solicitação."
 
-    def run(self, user_input):
-        return self.agent.invoke({"input": user_input}).get("output", "Desculpe, Maria. Ocorreu um erro e não consegui processar sua solicitação.")
+    def reset_session(self, session_id: str = DEFAULT_SESSION_ID):
+        """Encerra a conversa da sessão; a próxima mensagem começa do zero."""
+        self.sessions.reset(session_id)
 
 def create_concierge_agent():
     return ConciergeAgent()
\ No newline at end of file
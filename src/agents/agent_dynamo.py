@@ -1,46 +1,121 @@
-from .agent_guardian import GuardianAgent
+from .agent_guardian import DEFAULT_TIME_ON_PAGE_SECONDS, GuardianAgent
+from .offer_cache import OfferCache
+from ..observability.logs import get_logger
+from ..observability.telemetry import traced
+
+logger = get_logger("dynamo")
+
+# Opções oferecidas além do pagamento à vista, e a mensagem, por nível de risco.
+PAYMENT_OPTIONS_BY_RISK = {
+    "Baixo": (
+        [{"installments": 3, "description": "3x sem juros"},
+         {"installments": 6, "description": "6x sem juros (Oferta Especial!)"}],
+        "Você tem ótimas opções de parcelamento sem juros!",
+    ),
+    "Médio": (
+        [{"installments": 2, "description": "2x com juros de 5%"}],
+        "Oferecemos uma opção de parcelamento para você.",
+    ),
+    "Alto": (
+        [],
+        "Para esta transação, apenas o pagamento à vista está disponível por motivos de segurança.",
+    ),
+}
+
+def offer_fingerprint(transaction_details: dict) -> tuple:
+    """
+    Os campos da transação que entram na análise do Guardian; com o perfil, determinam a oferta.
+    O ID conta porque uma fatura já registrada é analisada sem ela própria no histórico.
+    """
+    return (
+        transaction_details.get("transaction_id"),
+        transaction_details["amount_brl"],
+        transaction_details["location"],
+        transaction_details.get("time_on_page_seconds", DEFAULT_TIME_ON_PAGE_SECONDS),
+    )
+
+def build_offer(transaction_details: dict, risk_analysis: dict) -> dict:
+    """Monta a oferta a partir da análise de risco do Guardian."""
+    risk_level = risk_analysis.get("risk_level", "Indeterminado")
+    offer = {
+        "base_amount": transaction_details['amount_brl'],
+        "risk_level": risk_level,
+        "risk_reasons": risk_analysis.get("reasons", []),
+        "payment_options": [{"installments": 1, "description": "Pagamento à vista"}]
+    }
+    if risk_level in PAYMENT_OPTIONS_BY_RISK:
+        options, message = PAYMENT_OPTIONS_BY_RISK[risk_level]
+        offer["payment_options"].extend(dict(option) for option in options)
+        offer["message"] = message
+    return offer
 
 class DynamoAgent:
     """
     Agente focado em maximizar a taxa de sucesso dos pagamentos
     e reduzir a inadimplência através de ofertas dinâmicas.
+
+    As ofertas ficam em cache por usuário e transação e valem enquanto o perfil do
+    usuário não mudar, então as visualizações repetidas de uma fatura no checkout
+    não refazem a análise do Guardian.
     """
-    def __init__(self):
-        self.guardian = GuardianAgent()
+    def __init__(self, guardian: GuardianAgent = None, offer_cache: OfferCache = None):
+        self.guardian = guardian or GuardianAgent()
+        self.store = self.guardian.store
+        self.offer_cache = offer_cache or OfferCache()
 
+    @traced("dynamo.generate_dynamic_offer")
     def generate_dynamic_offer(self, user_id: str, transaction_details: dict) -> dict:
         """
         Gera uma oferta de pagamento personalizada baseada na análise de risco.
         """
-        print(f"🤖 Dynamo: Gerando oferta dinâmica para a transação de R${transaction_details['amount_brl']}.")
+        logger.info(f"🤖 Dynamo: Gerando oferta dinâmica para a transação de R${transaction_details['amount_brl']}.")
+
+        # A versão é lida antes da análise: se o perfil mudar no meio, a oferta fica guardada
+        # com a versão antiga e não volta a ser usada.
+        version = self.store.version(user_id)
+        fingerprint = offer_fingerprint(transaction_details)
+        offer = self.offer_cache.get(user_id, fingerprint, version) if version else None
+        if offer is not None:
+            logger.info(f"🤖 Dynamo: Oferta reaproveitada do cache: {offer.get('message')}")
+            return offer
 
         risk_analysis = self.guardian.analyze_transaction(user_id, transaction_details)
-        risk_level = risk_analysis.get("risk_level", "Indeterminado")
-        risk_reasons = risk_analysis.get("reasons", [])
-
-        print(f"🤖 Dynamo: Análise de risco do Guardian recebida. Nível: {risk_level}.")
-
-        offer = {
-            "base_amount": transaction_details['amount_brl'],
-            "risk_level": risk_level,
-            "risk_reasons": risk_reasons,
-            "payment_options": []
-        }
-
-        offer["payment_options"].append({"installments": 1, "description": "Pagamento à vista"})
-
-        if risk_level == "Baixo":
-            offer["payment_options"].append({"installments": 3, "description": "3x sem juros"})
-            offer["payment_options"].append({"installments": 6, "description": "6x sem juros (Oferta Especial!)"})
-            offer["message"] = "Você tem ótimas opções de parcelamento sem juros!"
-        elif risk_level == "Médio":
-            offer["payment_options"].append({"installments": 2, "description": "2x com juros de 5%"})
-            offer["message"] = "Oferecemos uma opção de parcelamento para você."
-        elif risk_level == "Alto":
-            offer["message"] = "Para esta transação, apenas o pagamento à vista está disponível por motivos de segurança."
-
-        print(f"🤖 Dynamo: Oferta final gerada: {offer['message']}")
+        logger.info(f"🤖 Dynamo: Análise de risco do Guardian recebida. Nível: {risk_analysis.get('risk_level', 'Indeterminado')}.")
+
+        offer = build_offer(transaction_details, risk_analysis)
+        if version:
+            self.offer_cache.set(user_id, fingerprint, version, offer)
+        logger.info(f"🤖 Dynamo: Oferta final gerada: {offer.get('message')}")
         return offer
 
+    @traced("dynamo.generate_dynamic_offers")
+    def generate_dynamic_offers(self, transactions) -> list:
+        """
+        Versão em lote de `generate_dynamic_offer` para vários pares (user_id, transação),
+        como as faturas em aberto antes de um ciclo de cobrança. Retorna as ofertas na mesma
+        ordem; as que não estão em cache são analisadas juntas por `analyze_transactions_batch`
+        e passam a estar, então o checkout seguinte é um acerto de cache.
+        """
+        transactions = list(transactions)
+        logger.info(f"🤖 Dynamo: Gerando ofertas dinâmicas para {len(transactions)} transações.")
+        versions = self.store.version_many({user_id for user_id, _ in transactions})
+        offers = [None] * len(transactions)
+        pending = []
+        for i, (user_id, transaction_details) in enumerate(transactions):
+            version = versions.get(user_id, 0)
+            if version:
+                offers[i] = self.offer_cache.get(user_id, offer_fingerprint(transaction_details), version)
+            if offers[i] is None:
+                pending.append(i)
+
+        analyses = self.guardian.analyze_transactions_batch([transactions[i] for i in pending]) if pending else []
+        for i, risk_analysis in zip(pending, analyses):
+            user_id, transaction_details = transactions[i]
+            offers[i] = build_offer(transaction_details, risk_analysis)
+            if versions.get(user_id, 0):
+                self.offer_cache.set(user_id, offer_fingerprint(transaction_details), versions[user_id], offers[i])
+        logger.info(f"🤖 Dynamo: {len(transactions)} ofertas geradas, {len(transactions) - len(pending)} reaproveitadas do cache.")
+        return offers
+
 def create_dynamo_agent():
-    return DynamoAgent()
\ No newline at end of file
+    return DynamoAgent()
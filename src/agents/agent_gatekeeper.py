@@ -1,40 +1,79 @@
-import json
+import queue
+import threading
 import time
+import uuid
+from collections import deque
 from datetime import datetime
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(BASE_DIR, '..', 'data', 'customer_profile.json')
+from ..storage.customer_store import get_customer_store
+from ..observability.logs import get_logger
+from ..observability.telemetry import get_telemetry, traced
 
-def read_database():
-    with open(DB_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+logger = get_logger("gatekeeper")
 
-def write_database(data):
-    with open(DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4)
+ONBOARDING_STAGES = ("ocr", "kyc", "profile")
+
+class SimulatedOcrBackend:
+    """Simula a leitura do documento: devolve os dados informados após a latência típica de um OCR."""
+    def __init__(self, latency_seconds: float = 1.5):
+        self.latency_seconds = latency_seconds
+
+    def extract(self, document_image_path: str, new_user_data: dict) -> dict:
+        time.sleep(self.latency_seconds)
+        return {
+            "name": new_user_data["personal_info"]["name"],
+            "email": new_user_data["personal_info"]["email"],
+        }
+
+class SimulatedKycBackend:
+    """Simula a verificação biométrica e KYC, sempre aprovando após a latência típica do serviço."""
+    def __init__(self, latency_seconds: float = 2):
+        self.latency_seconds = latency_seconds
+
+    def verify(self, extracted_data: dict) -> dict:
+        time.sleep(self.latency_seconds)
+        return {"approved": True}
 
 class GatekeeperAgent:
     """
     Agente responsável por simular o onboarding de novos clientes.
+    Os serviços de OCR e KYC são plugáveis; por padrão usam as simulações acima.
     """
+    def __init__(self, ocr_backend=None, kyc_backend=None, store=None):
+        self.store = store or get_customer_store()
+        self.ocr_backend = ocr_backend or SimulatedOcrBackend()
+        self.kyc_backend = kyc_backend or SimulatedKycBackend()
+
+    @traced("gatekeeper.simulate_onboarding")
     def simulate_onboarding(self, document_image_path: str, new_user_data: dict):
         """
         Simula o processo completo de onboarding: OCR, verificação e criação de perfil.
         """
-        print(f"🤖 Gatekeeper: Iniciando onboarding com o documento '{document_image_path}'.")
+        logger.info(f"🤖 Gatekeeper: Iniciando onboarding com o documento '{document_image_path}'.")
+        extracted = self._run_ocr(document_image_path, new_user_data)
+        verification = self._run_kyc(extracted)
+        if not verification.get("approved"):
+            return {"status": "error", "message": verification.get("reason", "Verificação de identidade reprovada.")}
+        return self._create_profile(new_user_data, extracted)
 
-        time.sleep(1.5)
-        print("🤖 Gatekeeper: Processando imagem com OCR... Dados extraídos.")
-        extracted_name = new_user_data["personal_info"]["name"]
-        extracted_email = new_user_data["personal_info"]["email"]
+    def _run_ocr(self, document_image_path: str, new_user_data: dict) -> dict:
+        extracted = self.ocr_backend.extract(document_image_path, new_user_data)
+        logger.info("🤖 Gatekeeper: Processando imagem com OCR... Dados extraídos.")
+        return extracted
 
-        time.sleep(2)
-        print(f"🤖 Gatekeeper: Realizando verificação biométrica e KYC para '{extracted_name}'...")
-        print("🤖 Gatekeeper: Verificação concluída com sucesso. Nenhuma pendência encontrada.")
+    def _run_kyc(self, extracted: dict) -> dict:
+        logger.info(f"🤖 Gatekeeper: Realizando verificação biométrica e KYC para '{extracted['name']}'...")
+        verification = self.kyc_backend.verify(extracted)
+        if verification.get("approved"):
+            logger.info("🤖 Gatekeeper: Verificação concluída com sucesso. Nenhuma pendência encontrada.")
+        else:
+            logger.info(f"🤖 Gatekeeper: Verificação reprovada para '{extracted['name']}'.")
+        return verification
 
-        db = read_database()
+    def _create_profile(self, new_user_data: dict, extracted: dict) -> dict:
+        store = self.store
         user_id = new_user_data["user_id"]
-        if user_id in db:
+        if store.exists(user_id):
             return {"status": "error", "message": f"Usuário com ID {user_id} já existe."}
 
         new_user_data["personal_info"]["signup_date"] = datetime.now().isoformat()
@@ -45,15 +84,187 @@ class GatekeeperAgent:
         new_user_data["behavioral_data"]["last_activity_date"] = datetime.now().isoformat()
 
 
-        db[user_id] = new_user_data
-        write_database(db)
-        print(f"🤖 Gatekeeper: Perfil para o usuário '{user_id}' criado com sucesso no sistema.")
+        if not store.insert(user_id, new_user_data):
+            return {"status": "error", "message": f"Usuário com ID {user_id} já existe."}
+        logger.info(f"🤖 Gatekeeper: Perfil para o usuário '{user_id}' criado com sucesso no sistema.")
 
         return {
             "status": "success",
             "user_id": user_id,
-            "message": f"Onboarding de {extracted_name} ({extracted_email}) concluído."
+            "message": f"Onboarding de {extracted['name']} ({extracted['email']}) concluído."
         }
 
+class OnboardingJob:
+    def __init__(self, job_id: str, document_image_path: str, new_user_data: dict, callback=None):
+        self.job_id = job_id
+        self.document_image_path = document_image_path
+        self.new_user_data = new_user_data
+        self.callback = callback
+        self.status = "queued"
+        self.extracted = None
+        self.result = None
+        self.stage_seconds = {}
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "user_id": self.new_user_data.get("user_id"),
+            "status": self.status,
+            "result": self.result,
+            "stage_seconds": dict(self.stage_seconds),
+            "submitted_at": datetime.fromtimestamp(self.submitted_at).isoformat(),
+            "finished_at": datetime.fromtimestamp(self.finished_at).isoformat() if self.finished_at else None,
+        }
+
+class OnboardingPipeline:
+    """
+    Onboarding assíncrono em estágios (OCR → KYC → criação de perfil). Cada estágio tem
+    uma fila limitada e um grupo próprio de threads, então vários candidatos avançam ao
+    mesmo tempo. `submit` devolve um job_id para consulta em `get_status` ou chama o
+    `callback` ao terminar; com as filas cheias, `submit` espera (ou falha após `timeout`).
+    """
+    def __init__(self, gatekeeper: GatekeeperAgent = None, workers_per_stage: dict = None,
+                 queue_size: int = 100, max_finished_jobs: int = 10000, latency_window: int = 1000):
+        self.gatekeeper = gatekeeper or GatekeeperAgent()
+        workers = {"ocr": 8, "kyc": 8, "profile": 2}
+        workers.update(workers_per_stage or {})
+        self.max_finished_jobs = max_finished_jobs
+        self._queues = {stage: queue.Queue(maxsize=queue_size) for stage in ONBOARDING_STAGES}
+        self._latencies = {stage: deque(maxlen=latency_window) for stage in ONBOARDING_STAGES}
+        self._processed = {stage: 0 for stage in ONBOARDING_STAGES}
+        self._failed = 0
+        self._jobs = {}
+        self._finished_job_ids = deque()
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._closed = False
+        self._threads = []
+        for stage in ONBOARDING_STAGES:
+            for i in range(workers[stage]):
+                thread = threading.Thread(target=self._stage_worker, args=(stage,), name=f"onboarding-{stage}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, document_image_path: str, new_user_data: dict, callback=None, timeout: float = None) -> str:
+        """
+        Enfileira um onboarding e retorna o job_id. Levanta queue.Full se não houver vaga até
+        `timeout` e RuntimeError depois de `shutdown`.
+        """
+        job = OnboardingJob(uuid.uuid4().hex, document_image_path, new_user_data, callback)
+        # O enfileiramento acontece sob `_submit_lock` para que nenhum job entre na fila do OCR
+        # depois dos sinais de parada de `shutdown`.
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("O pipeline de onboarding foi encerrado.")
+            with self._lock:
+                self._jobs[job.job_id] = job
+            try:
+                self._queues["ocr"].put(job, timeout=timeout)
+            except queue.Full:
+                with self._lock:
+                    self._jobs.pop(job.job_id, None)
+                raise
+        logger.info(f"🤖 Gatekeeper: Onboarding {job.job_id} enfileirado para o documento '{document_image_path}'.")
+        return job.job_id
+
+    def get_status(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def _stage_worker(self, stage: str):
+        stage_queue = self._queues[stage]
+        while True:
+            job = stage_queue.get()
+            if job is None:
+                return
+            job.status = stage
+            started_at = time.perf_counter()
+            status = "ok"
+            try:
+                next_stage = self._run_stage(stage, job)
+            except Exception as error:
+                job.result = {"status": "error", "message": f"Falha no estágio '{stage}': {error}"}
+                next_stage = None
+                status = "error"
+            elapsed = time.perf_counter() - started_at
+            get_telemetry().record_span(f"gatekeeper.{stage}", elapsed, status=status, job_id=job.job_id)
+            job.stage_seconds[stage] = round(elapsed, 4)
+            with self._lock:
+                self._latencies[stage].append(elapsed)
+                self._processed[stage] += 1
+            if next_stage:
+                self._queues[next_stage].put(job)
+            else:
+                self._finish(job)
+
+    def _run_stage(self, stage: str, job: OnboardingJob):
+        """Executa um estágio e retorna o próximo, ou None quando o job termina."""
+        if stage == "ocr":
+            job.extracted = self.gatekeeper._run_ocr(job.document_image_path, job.new_user_data)
+            return "kyc"
+        if stage == "kyc":
+            verification = self.gatekeeper._run_kyc(job.extracted)
+            if not verification.get("approved"):
+                job.result = {"status": "error", "message": verification.get("reason", "Verificação de identidade reprovada.")}
+                return None
+            return "profile"
+        job.result = self.gatekeeper._create_profile(job.new_user_data, job.extracted)
+        return None
+
+    def _finish(self, job: OnboardingJob):
+        job.status = "completed" if job.result and job.result.get("status") == "success" else "failed"
+        job.finished_at = time.time()
+        with self._lock:
+            if job.status == "failed":
+                self._failed += 1
+            self._finished_job_ids.append(job.job_id)
+            while len(self._finished_job_ids) > self.max_finished_jobs:
+                self._jobs.pop(self._finished_job_ids.popleft(), None)
+        if job.callback:
+            try:
+                job.callback(job.to_dict())
+            except Exception as error:
+                logger.error(f"❌ Gatekeeper: Erro no callback do onboarding {job.job_id}: {error}")
+
+    def metrics(self) -> dict:
+        """Latência por estágio (média e p95 das execuções recentes), volume processado e filas."""
+        with self._lock:
+            stages = {}
+            for stage in ONBOARDING_STAGES:
+                samples = sorted(self._latencies[stage])
+                stages[stage] = {
+                    "processed": self._processed[stage],
+                    "queue_depth": self._queues[stage].qsize(),
+                    "avg_seconds": round(sum(samples) / len(samples), 4) if samples else None,
+                    "p95_seconds": round(samples[int(0.95 * (len(samples) - 1))], 4) if samples else None,
+                }
+            return {"stages": stages, "failed_jobs": self._failed, "tracked_jobs": len(self._jobs)}
+
+    def shutdown(self, wait: bool = True):
+        """
+        Recusa novos jobs e encerra os estágios em ordem depois que os jobs já enfileirados forem
+        processados (e seus callbacks chamados). Com `wait=False` o encerramento continua em
+        segundo plano.
+        """
+        with self._submit_lock:
+            self._closed = True
+        drain = threading.Thread(target=self._drain_stages, name="onboarding-shutdown", daemon=True)
+        drain.start()
+        if wait:
+            drain.join()
+
+    def _drain_stages(self):
+        # Os sinais de parada de um estágio só são enviados depois que o estágio anterior terminou:
+        # antes disso ele ainda pode encaminhar jobs, que ficariam atrás dos sinais, sem worker.
+        for stage in ONBOARDING_STAGES:
+            workers = [t for t in self._threads if t.name.startswith(f"onboarding-{stage}-")]
+            for _ in workers:
+                self._queues[stage].put(None)
+            for thread in workers:
+                thread.join()
+
 def create_gatekeeper_agent():
-    return GatekeeperAgent()
\ No newline at end of file
+    return GatekeeperAgent()
@@ -1,37 +1,151 @@
-import json
 import os
-from datetime import datetime, timedelta
+import time
+from datetime import date
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(BASE_DIR, '..', 'data', 'customer_profile.json')
+from ..storage.card_expiry import effective_expiry
+from ..storage.columnar_history import ColumnarHistory
+from ..storage.customer_store import get_customer_store
+from ..storage.user_features import seen_locations, without_transaction
+from ..observability.logs import get_logger
+from ..observability.telemetry import traced
 
-def read_database():
-    with open(DB_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+logger = get_logger("guardian")
+
+VALUE_ANOMALY_MULTIPLIER = 3
+VALUE_ANOMALY_SCORE = 40
+NETWORK_ANOMALY_SCORE = 30
+NOVEL_LOCATION_SCORE = 20
+DEFAULT_TIME_ON_PAGE_SECONDS = 30
+MIN_TIME_ON_PAGE_SECONDS = 5
+BEHAVIORAL_ANOMALY_SCORE = 30
+HIGH_RISK_SCORE = 70
+MEDIUM_RISK_SCORE = 40
+# Campos da transação usados na pontuação, lidos do arquivo colunar na reanálise em lote.
+SCORED_TRANSACTION_FIELDS = ("transaction_id", "amount_brl", "location", "time_on_page_seconds")
+HISTORY_ROWS_PER_PROFILE = 20
+# Abaixo disso (alguns segundos de validação num só processo), iniciar o pool custa mais do que economiza.
+PARALLEL_MIN_CARDS = 500000
+
+USER_NOT_FOUND_RESULT = {"risk_score": 100, "risk_level": "Alto", "reason": "Usuário não encontrado."}
+
+def _value_anomaly_reason(amount, avg_value):
+    return f"Valor da transação (R${amount}) é significativamente maior que a média do usuário (R${avg_value})."
+
+def _network_anomaly_reason(location, last_location):
+    return f"Transação originada em '{location}', mas a última localização conhecida do usuário é '{last_location}'."
+
+def _novel_location_reason(location):
+    return f"Transação originada em '{location}', cidade nunca vista no histórico do usuário."
+
+BEHAVIORAL_ANOMALY_REASON = "Tempo de preenchimento da página de pagamento suspeitosamente baixo."
+
+CARD_VALID_MESSAGE = "Cartão validado com sucesso."
+LUHN_FAILURE_REASON = "O número do cartão é inválido (falha na verificação do algoritmo de Luhn)."
+EXPIRED_CARD_REASON = "O cartão informado já está expirado."
+INVALID_EXPIRY_REASON = "Formato da data de validade inválido. Use AAAA-MM."
+MISSING_EXPIRY_REASON = "Data de validade não fornecida."
+INVALID_CVV_REASON = "CVV inválido."
+
+# Valor de cada dígito ASCII como byte, direto e dobrado (com o "- 9" do Luhn já aplicado):
+# com bytes.translate e sum, o checksum de um número inteiro é calculado em C.
+_DIGIT_VALUES = bytes.maketrans(b"0123456789", bytes(range(10)))
+_DOUBLED_DIGIT_VALUES = bytes.maketrans(b"0123456789", bytes((0, 2, 4, 6, 8, 1, 3, 5, 7, 9)))
+
+def _luhn_reference(card_number) -> bool:
+    try:
+        checksum = 0
+        for i, digit in enumerate(reversed([int(d) for d in card_number])):
+            if i % 2 == 1:
+                digit *= 2
+                if digit > 9:
+                    digit -= 9
+            checksum += digit
+        return checksum % 10 == 0
+    except (ValueError, TypeError):
+        return False
+
+def luhn_valid(card_number) -> bool:
+    """Mesmo resultado de `GuardianAgent._luhn_check`, sem laço por dígito para números ASCII."""
+    if not isinstance(card_number, str) or not card_number.isascii():
+        return _luhn_reference(card_number)
+    if not card_number.isdigit():
+        return card_number == ""
+    reversed_digits = card_number[::-1].encode("ascii")
+    checksum = sum(reversed_digits[0::2].translate(_DIGIT_VALUES)) + sum(reversed_digits[1::2].translate(_DOUBLED_DIGIT_VALUES))
+    return checksum % 10 == 0
+
+def _expiry_reason(expiry_date, today: date):
+    """Motivo de recusa pela validade (ou None), como em `validate_new_card`."""
+    if not expiry_date:
+        return MISSING_EXPIRY_REASON
+    try:
+        if today >= effective_expiry(expiry_date):
+            return EXPIRED_CARD_REASON
+    except (ValueError, IndexError):
+        return INVALID_EXPIRY_REASON
+    return None
+
+def validate_cards_chunk(numbers: list, expiry_dates: list, cvvs: list, today: date) -> list:
+    """
+    Valida um lote de cartões com as mesmas regras e mensagens de `validate_new_card`. A
+    validade é verificada uma vez por valor distinto (um lote grande tem poucas centenas de
+    meses de validade), e o Luhn usa `luhn_valid`. Executado também nos processos do pool.
+    """
+    expiry_reasons = {}
+    results = []
+    for number, expiry_date, cvv in zip(numbers, expiry_dates, cvvs):
+        reasons = []
+        if not luhn_valid(number.replace(" ", "")):
+            reasons.append(LUHN_FAILURE_REASON)
+        if expiry_date not in expiry_reasons:
+            expiry_reasons[expiry_date] = _expiry_reason(expiry_date, today)
+        if expiry_reasons[expiry_date]:
+            reasons.append(expiry_reasons[expiry_date])
+        if not (cvv and 3 <= len(cvv) <= 4 and cvv.isdigit()):
+            reasons.append(INVALID_CVV_REASON)
+        if reasons:
+            results.append({"is_valid": False, "reasons": reasons})
+        else:
+            results.append({"is_valid": True, "message": CARD_VALID_MESSAGE})
+    return results
 
 class GuardianAgent:
-    def __init__(self):
-        self.db = read_database()
+    def __init__(self, store=None):
+        self.store = store or get_customer_store()
 
+    @traced("guardian.analyze_transaction")
     def analyze_transaction(self, user_id: str, transaction_details: dict) -> dict:
-        """Analisa uma transação e retorna um perfil de risco."""
-        print(f"🤖 Guardian: Analisando transação para {user_id}")
-        user_profile = self.db.get(user_id)
-        if not user_profile:
-            return {"risk_score": 100, "risk_level": "Alto", "reason": "Usuário não encontrado."}
+        """
+        Analisa uma transação e retorna um perfil de risco. Se ela já estiver no histórico
+        (mesmo `transaction_id`), é comparada com as demais, sem entrar na própria média
+        nem nos locais conhecidos.
+        """
+        logger.info(f"🤖 Guardian: Analisando transação para {user_id}")
+        features = self.store.features(user_id)
+        if not features:
+            return dict(USER_NOT_FOUND_RESULT)
+        transaction_id = transaction_details.get("transaction_id")
+        recorded = self.store.transaction(user_id, transaction_id) if isinstance(transaction_id, str) else None
+        if recorded is not None:
+            features = without_transaction(features, recorded)
 
         risk_score = 0
         risk_reasons = []
 
-        risk_score, risk_reasons = self._check_value_anomaly(user_profile, transaction_details, risk_score, risk_reasons)
+        risk_score, risk_reasons = self._check_value_anomaly(features, transaction_details, risk_score, risk_reasons)
+
 
+        risk_score, risk_reasons = self._check_network_anomaly(features, transaction_details, risk_score, risk_reasons)
 
-        risk_score, risk_reasons = self._check_network_anomaly(user_profile, transaction_details, risk_score, risk_reasons)
+        risk_score, risk_reasons = self._check_location_novelty(features, transaction_details, risk_score, risk_reasons)
         
         risk_score, reasons = self._check_behavioral_anomaly(transaction_details, risk_score, risk_reasons)
 
         final_risk = self._classify_risk(risk_score)
-        print(f"🤖 Guardian: Análise concluída. Risco: {final_risk} (Score: {risk_score})")
+        logger.info(f"🤖 Guardian: Análise concluída. Risco: {final_risk} (Score: {risk_score})")
 
         return {
             "risk_score": risk_score,
@@ -39,57 +153,170 @@ class GuardianAgent:
             "reasons": risk_reasons
         }
 
-    def _check_value_anomaly(self, profile, transaction, score, reasons):
-        avg_value = profile["behavioral_data"].get("avg_transaction_value", 0)
-        if avg_value > 0 and transaction["amount_brl"] > avg_value * 3:
-            score += 40
-            reasons.append(f"Valor da transação (R${transaction['amount_brl']}) é significativamente maior que a média do usuário (R${avg_value}).")
+    def _check_value_anomaly(self, features, transaction, score, reasons):
+        avg_value = round(features["amount_mean"], 2)
+        if avg_value > 0 and transaction["amount_brl"] > avg_value * VALUE_ANOMALY_MULTIPLIER:
+            score += VALUE_ANOMALY_SCORE
+            reasons.append(_value_anomaly_reason(transaction["amount_brl"], avg_value))
         return score, reasons
 
-    def _check_network_anomaly(self, profile, transaction, score, reasons):
-        login_locations = profile["behavioral_data"].get("login_locations", [])
-        if not login_locations:
+    def _check_network_anomaly(self, features, transaction, score, reasons):
+        last_location = features["last_login_city"]
+        if not last_location or transaction.get("location") is None:
             return score, reasons
             
-        last_location = login_locations[-1]["city"]
         if transaction["location"] != last_location:
-            score += 30
-            reasons.append(f"Transação originada em '{transaction['location']}', mas a última localização conhecida do usuário é '{last_location}'.")
+            score += NETWORK_ANOMALY_SCORE
+            reasons.append(_network_anomaly_reason(transaction["location"], last_location))
+        return score, reasons
+
+    def _check_location_novelty(self, features, transaction, score, reasons):
+        known_locations = seen_locations(features)
+        if known_locations and transaction.get("location") is not None and transaction["location"] not in known_locations:
+            score += NOVEL_LOCATION_SCORE
+            reasons.append(_novel_location_reason(transaction["location"]))
         return score, reasons
 
     def _check_behavioral_anomaly(self, transaction, score, reasons):
-        if transaction.get("time_on_page_seconds", 30) < 5:
-            score += 30
-            reasons.append("Tempo de preenchimento da página de pagamento suspeitosamente baixo.")
+        if transaction.get("time_on_page_seconds", DEFAULT_TIME_ON_PAGE_SECONDS) < MIN_TIME_ON_PAGE_SECONDS:
+            score += BEHAVIORAL_ANOMALY_SCORE
+            reasons.append(BEHAVIORAL_ANOMALY_REASON)
         return score, reasons
 
     def _classify_risk(self, score):
-        if score >= 70:
+        if score >= HIGH_RISK_SCORE:
             return "Alto"
-        if score >= 40:
+        if score >= MEDIUM_RISK_SCORE:
             return "Médio"
         return "Baixo"
 
+    @traced("guardian.analyze_transactions_batch")
+    def analyze_transactions_batch(self, transactions) -> list:
+        """
+        Analisa vários pares (user_id, transação) de uma vez, regra a regra sobre colunas,
+        em vez de transação a transação. Retorna, na mesma ordem, exatamente o mesmo
+        resultado que `analyze_transaction` daria para cada par.
+        """
+        transactions = list(transactions)
+        logger.info(f"🤖 Guardian: Analisando {len(transactions)} transações em lote.")
+        features = self.store.features_many({user_id for user_id, _ in transactions})
+        recorded = self.store.transactions_many(
+            (user_id, transaction["transaction_id"]) for user_id, transaction in transactions
+            if isinstance(transaction.get("transaction_id"), str)
+        )
+        results = self.score_batch(transactions, features, [
+            recorded.get((user_id, transaction.get("transaction_id"))) for user_id, transaction in transactions
+        ])
+        high_risk = sum(1 for result in results if result["risk_level"] == "Alto")
+        logger.info(f"🤖 Guardian: Análise em lote concluída. {high_risk} de {len(results)} transações com risco Alto.")
+        return results
+
+    def score_batch(self, transactions: list, features_by_user: dict, recorded: list = None) -> list:
+        """
+        Pontua pares (user_id, transação) com os atributos já carregados de cada usuário.
+        `recorded` traz, na mesma ordem, a transação do histórico a descontar dos atributos
+        (ou None), como em `analyze_transaction`.
+        """
+        user_ids = [user_id for user_id, _ in transactions]
+        found = [user_id in features_by_user for user_id in user_ids]
+        features = [features_by_user[user_id] if ok else None for user_id, ok in zip(user_ids, found)]
+        if recorded is not None:
+            features = [
+                without_transaction(data, own) if data is not None and own is not None else data
+                for data, own in zip(features, recorded)
+            ]
+        avg_values = [round(data["amount_mean"], 2) if data is not None else 0 for data in features]
+        last_locations = [data["last_login_city"] if data is not None else None for data in features]
+        known_locations = [seen_locations(data) if data is not None else set() for data in features]
+        amounts = [transaction["amount_brl"] for _, transaction in transactions]
+        locations = [transaction.get("location") for _, transaction in transactions]
+        page_times = [transaction.get("time_on_page_seconds", DEFAULT_TIME_ON_PAGE_SECONDS) for _, transaction in transactions]
+
+        value_flags = [avg > 0 and amount > avg * VALUE_ANOMALY_MULTIPLIER for amount, avg in zip(amounts, avg_values)]
+        network_flags = [bool(last) and location is not None and location != last
+                         for location, last in zip(locations, last_locations)]
+        novelty_flags = [bool(known) and location is not None and location not in known
+                         for location, known in zip(locations, known_locations)]
+        behavioral_flags = [seconds < MIN_TIME_ON_PAGE_SECONDS for seconds in page_times]
+        scores = [
+            VALUE_ANOMALY_SCORE * value + NETWORK_ANOMALY_SCORE * network + NOVEL_LOCATION_SCORE * novel
+            + BEHAVIORAL_ANOMALY_SCORE * behavior
+            for value, network, novel, behavior in zip(value_flags, network_flags, novelty_flags, behavioral_flags)
+        ]
+
+        results = []
+        for i, ok in enumerate(found):
+            if not ok:
+                results.append(dict(USER_NOT_FOUND_RESULT))
+                continue
+            reasons = []
+            if value_flags[i]:
+                reasons.append(_value_anomaly_reason(amounts[i], avg_values[i]))
+            if network_flags[i]:
+                reasons.append(_network_anomaly_reason(locations[i], last_locations[i]))
+            if novelty_flags[i]:
+                reasons.append(_novel_location_reason(locations[i]))
+            if behavioral_flags[i]:
+                reasons.append(BEHAVIORAL_ANOMALY_REASON)
+            results.append({"risk_score": scores[i], "risk_level": self._classify_risk(scores[i]), "reasons": reasons})
+        return results
+
+    @traced("guardian.analyze_billing_histories")
+    def analyze_billing_histories(self, user_ids=None, chunk_size: int = 500, history: ColumnarHistory = None) -> dict:
+        """
+        Reanalisa todo o `billing_history` dos usuários informados (ou de todos), um lote
+        de perfis por vez. Retorna {user_id: {transaction_id: análise}}.
+
+        Com `history` (o arquivo colunar gerado a partir da base), as transações são lidas
+        das colunas, `chunk_size` × HISTORY_ROWS_PER_PROFILE por lote, sem carregar os perfis.
+        """
+        if history is not None:
+            return self._analyze_columnar_history(history, user_ids, chunk_size * HISTORY_ROWS_PER_PROFILE)
+        if user_ids is None:
+            profile_stream = self.store.iter_profiles(batch_size=chunk_size)
+        else:
+            profile_stream = iter(self.store.get_many(user_ids).items())
+        logger.info("🤖 Guardian: Reanalisando históricos de faturamento em lote.")
+        results = {}
+        while True:
+            chunk = dict(islice(profile_stream, chunk_size))
+            if not chunk:
+                break
+            pairs = [
+                (user_id, transaction)
+                for user_id, profile in chunk.items()
+                for transaction in profile.get("billing_history", [])
+            ]
+            features = self.store.features_many(chunk)
+            analyses = self.score_batch(pairs, features, [transaction for _, transaction in pairs])
+            for (user_id, transaction), analysis in zip(pairs, analyses):
+                results.setdefault(user_id, {})[transaction["transaction_id"]] = analysis
+        logger.info(f"🤖 Guardian: {sum(len(r) for r in results.values())} transações de {len(results)} usuários reanalisadas.")
+        return results
+
+    def _analyze_columnar_history(self, history: ColumnarHistory, user_ids, rows_per_batch: int) -> dict:
+        logger.info("🤖 Guardian: Reanalisando históricos de faturamento a partir do arquivo colunar.")
+        pairs = history.iter_rows("transactions", user_ids, fields=SCORED_TRANSACTION_FIELDS)
+        results = {}
+        while True:
+            chunk = list(islice(pairs, rows_per_batch))
+            if not chunk:
+                break
+            features = self.store.features_many({user_id for user_id, _ in chunk})
+            analyses = self.score_batch(chunk, features, [transaction for _, transaction in chunk])
+            for (user_id, transaction), analysis in zip(chunk, analyses):
+                results.setdefault(user_id, {})[transaction.get("transaction_id")] = analysis
+        logger.info(f"🤖 Guardian: {sum(len(r) for r in results.values())} transações de {len(results)} usuários reanalisadas.")
+        return results
+
     def _luhn_check(self, card_number: str) -> bool:
         """Verifica se um número de cartão é válido usando o Algoritmo de Luhn."""
-        try:
-            digits = [int(d) for d in card_number]
-            checksum = 0
-            for i, digit in enumerate(reversed(digits)):
-                if i % 2 == 1:
-                    doubled_digit = digit * 2
-                    if doubled_digit > 9:
-                        doubled_digit -= 9
-                    checksum += doubled_digit
-                else:
-                    checksum += digit
-            return checksum % 10 == 0
-        except (ValueError, TypeError):
-            return False
+        return _luhn_reference(card_number)
 
+    @traced("guardian.validate_new_card")
     def validate_new_card(self, card_details: dict) -> dict:
         """Valida um novo cartão de crédito usando verificações simuladas."""
-        print("🤖 Guardian: Validando novo cartão.")
+        logger.info("🤖 Guardian: Validando novo cartão.")
         card_number = card_details.get("number", "").replace(" ", "")
         expiry_date = card_details.get("expiry_date") # "YYYY-MM"
         cvv = card_details.get("cvv")
@@ -99,33 +326,71 @@ class GuardianAgent:
 
         if not self._luhn_check(card_number):
             is_valid = False
-            reasons.append("O número do cartão é inválido (falha na verificação do algoritmo de Luhn).")
-
-        if expiry_date:
-            try:
-                expiry_year, expiry_month = map(int, expiry_date.split('-'))
-                first_day_of_expiry_month = datetime(expiry_year, expiry_month, 1)
-                effective_expiry_date = (first_day_of_expiry_month + timedelta(days=32)).replace(day=1)
-                if datetime.now() >= effective_expiry_date:
-                    is_valid = False
-                    reasons.append("O cartão informado já está expirado.")
-            except (ValueError, IndexError):
-                is_valid = False
-                reasons.append("Formato da data de validade inválido. Use AAAA-MM.")
-        else:
+            reasons.append(LUHN_FAILURE_REASON)
+
+        expiry_reason = _expiry_reason(expiry_date, date.today())
+        if expiry_reason:
             is_valid = False
-            reasons.append("Data de validade não fornecida.")
+            reasons.append(expiry_reason)
 
         if not (cvv and 3 <= len(cvv) <= 4 and cvv.isdigit()):
             is_valid = False
-            reasons.append("CVV inválido.")
+            reasons.append(INVALID_CVV_REASON)
 
         if is_valid:
-            print("🤖 Guardian: Cartão validado com sucesso.")
-            return {"is_valid": True, "message": "Cartão validado com sucesso."}
+            logger.info("🤖 Guardian: Cartão validado com sucesso.")
+            return {"is_valid": True, "message": CARD_VALID_MESSAGE}
         else:
-            print(f"🤖 Guardian: Falha na validação do cartão. Motivos: {reasons}")
+            logger.info(f"🤖 Guardian: Falha na validação do cartão. Motivos: {reasons}")
             return {"is_valid": False, "reasons": reasons}
 
+    @traced("guardian.validate_cards_bulk")
+    def validate_cards_bulk(self, numbers, expiry_dates, cvvs, processes: int = None,
+                            chunk_size: int = 100000) -> dict:
+        """
+        Valida em lote cartões dados como listas paralelas (números, validades "AAAA-MM" e CVVs),
+        para migrações e retokenizações. `results[i]` é exatamente o que `validate_new_card`
+        retornaria para o i-ésimo cartão. Com `processes` > 1, os lotes de `chunk_size`
+        cartões são distribuídos entre processos; sem `processes`, o pool (um processo por
+        CPU) só é usado a partir de `PARALLEL_MIN_CARDS` cartões. O resumo informa quantos
+        processos validaram de fato.
+        """
+        numbers, expiry_dates, cvvs = list(numbers), list(expiry_dates), list(cvvs)
+        if not len(numbers) == len(expiry_dates) == len(cvvs):
+            raise ValueError("numbers, expiry_dates e cvvs precisam ter o mesmo tamanho.")
+        logger.info(f"🤖 Guardian: Validando {len(numbers)} cartões em lote.")
+        started_at = time.perf_counter()
+        validate_chunk = partial(validate_cards_chunk, today=date.today())
+        chunks = [
+            (numbers[start:start + chunk_size], expiry_dates[start:start + chunk_size], cvvs[start:start + chunk_size])
+            for start in range(0, len(numbers), chunk_size)
+        ]
+        if processes is None:
+            processes = (os.cpu_count() or 1) if len(numbers) >= PARALLEL_MIN_CARDS else 1
+        workers = max(1, min(processes, len(chunks)))
+        results = []
+        if workers == 1:
+            for chunk in chunks:
+                results.extend(validate_chunk(*chunk))
+        else:
+            with Pool(processes=workers) as pool:
+                for chunk_results in pool.starmap(validate_chunk, chunks):
+                    results.extend(chunk_results)
+
+        elapsed = time.perf_counter() - started_at
+        valid = sum(1 for result in results if result["is_valid"])
+        summary = {
+            "results": results,
+            "cards": len(results),
+            "valid": valid,
+            "invalid": len(results) - valid,
+            "processes": workers,
+            "elapsed_seconds": round(elapsed, 3),
+            "cards_per_second": round(len(results) / elapsed, 1) if elapsed > 0 else None,
+        }
+        logger.info(f"🤖 Guardian: {len(results)} cartões validados em {summary['elapsed_seconds']}s "
+                    f"({summary['cards_per_second']} cartões/s), {valid} válidos.")
+        return summary
+
 def create_guardian_agent():
     return GuardianAgent()
\ No newline at end of file
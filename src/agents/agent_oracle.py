@@ -1,80 +1,170 @@
-import json
-from datetime import datetime, timedelta
+import argparse
+import os
+import time
+from datetime import datetime
+from functools import partial
+from multiprocessing import Pool
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(BASE_DIR, '..', 'data', 'customer_profile.json')
+from ..storage.customer_store import get_customer_store
+from ..observability.logs import get_logger
+from ..observability.telemetry import traced
 
-def read_database():
-    with open(DB_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+logger = get_logger("oracle")
+
+def _parse_datetime(value: str) -> datetime:
+    """Lê datas ISO (inclusive com sufixo 'Z') como horário local sem fuso, comparável a datetime.now()."""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def _classify_churn_risk(score: float) -> str:
+    if score > 0.6:
+        return "Alto"
+    if score > 0.3:
+        return "Médio"
+    return "Baixo"
+
+def score_churn(user_id: str, last_activity_str: str, failed_payments: int, signup_date_str: str,
+                now: datetime) -> dict:
+    """Calcula o risco de churn a partir dos atributos já extraídos do perfil, sem acessar a base."""
+    base_score = 0.05
+    reasons = ["Pontuação base inicial."]
+
+    if last_activity_str:
+        last_activity = _parse_datetime(last_activity_str)
+        days_inactive = (now - last_activity).days
+        if days_inactive > 30:
+            base_score += 0.25
+            reasons.append(f"Inatividade por mais de {days_inactive} dias.")
+        elif days_inactive > 15:
+            base_score += 0.10
+            reasons.append(f"Inatividade por mais de {days_inactive} dias.")
+
+    if failed_payments > 0:
+        base_score += 0.15 * failed_payments
+        reasons.append(f"{failed_payments} falha(s) de pagamento no histórico.")
+
+    if signup_date_str:
+        try:
+            signup_date = _parse_datetime(signup_date_str)
+            months_as_customer = (now - signup_date).days / 30
+            if months_as_customer > 12:
+                base_score -= 0.05
+                reasons.append("Cliente há mais de 1 ano (bônus de lealdade).")
+        except ValueError:
+            reasons.append("Não foi possível calcular o tempo de cliente (data de cadastro inválida).")
+    else:
+        reasons.append("Não foi possível calcular o tempo de cliente (data de cadastro não preenchida).")
+
+    final_score = max(0.01, min(base_score, 0.95))
+
+    return {
+        "user_id": user_id,
+        "churn_probability": final_score,
+        "risk_level": _classify_churn_risk(final_score),
+        "reasons": reasons,
+        "last_calculated_date": now.isoformat()
+    }
+
+def _score_user_chunk(user_ids: list, now: datetime, db_file: str) -> list:
+    """Executado em cada processo do pool: extrai os atributos do próprio lote e pontua todos."""
+    return [
+        score_churn(user_id, last_activity, failed_payments, signup_date, now)
+        for user_id, last_activity, signup_date, failed_payments in get_customer_store(db_file).churn_features(user_ids)
+    ]
 
 class OracleAgent:
     """
     Agente de análise preditiva que opera nos bastidores para
     calcular a probabilidade de churn de cada cliente.
     """
+    def __init__(self, store=None):
+        self.store = store or get_customer_store()
+
+    @traced("oracle.calculate_churn_risk")
     def calculate_churn_risk(self, user_id: str) -> dict:
         """
         Simula o cálculo de risco de churn baseado em dados do perfil do usuário.
         Em um cenário real, isso seria um modelo de ML treinado.
         """
-        print(f"🤖 Oracle: Calculando risco de churn para o usuário {user_id}.")
-        db = read_database()
-        user = db.get(user_id)
-        if not user:
+        logger.info(f"🤖 Oracle: Calculando risco de churn para o usuário {user_id}.")
+        features = self.store.features(user_id)
+        if not features:
             return {"error": "Usuário não encontrado."}
 
-        base_score = 0.05
-        reasons = ["Pontuação base inicial."]
-
-        last_activity_str = user["behavioral_data"].get("last_activity_date")
-        if last_activity_str:
-            last_activity = datetime.fromisoformat(last_activity_str)
-            days_inactive = (datetime.now() - last_activity).days
-            if days_inactive > 30:
-                base_score += 0.25
-                reasons.append(f"Inatividade por mais de {days_inactive} dias.")
-            elif days_inactive > 15:
-                base_score += 0.10
-                reasons.append(f"Inatividade por mais de {days_inactive} dias.")
-
-        failed_payments = [p for p in user.get("billing_history", []) if p["status"] == "failed"]
-        if len(failed_payments) > 0:
-            base_score += 0.15 * len(failed_payments)
-            reasons.append(f"{len(failed_payments)} falha(s) de pagamento no histórico.")
-
-        signup_date_str = user["personal_info"].get("signup_date")
-        if signup_date_str:
-            try:
-                signup_date = datetime.fromisoformat(signup_date_str)
-                months_as_customer = (datetime.now() - signup_date).days / 30
-                if months_as_customer > 12:
-                    base_score -= 0.05
-                    reasons.append("Cliente há mais de 1 ano (bônus de lealdade).")
-            except ValueError:
-                reasons.append("Não foi possível calcular o tempo de cliente (data de cadastro inválida).")
-        else:
-            reasons.append("Não foi possível calcular o tempo de cliente (data de cadastro não preenchida).")
-
-
-        final_score = max(0.01, min(base_score, 0.95))
-
-        print(f"🤖 Oracle: Cálculo concluído para {user_id}. Risco de Churn: {final_score:.2%}")
-
-        return {
-            "user_id": user_id,
-            "churn_probability": final_score,
-            "risk_level": self._classify_risk(final_score),
-            "reasons": reasons,
-            "last_calculated_date": datetime.now().isoformat()
+        result = score_churn(
+            user_id,
+            features["last_activity_date"],
+            features["failed_count"],
+            features["signup_date"],
+            datetime.now(),
+        )
+
+        logger.info(f"🤖 Oracle: Cálculo concluído para {user_id}. Risco de Churn: {result['churn_probability']:.2%}")
+
+        return result
+
+    def iter_churn_scores(self, user_ids: list = None, processes: int = None, chunk_size: int = 1000):
+        """
+        Pontua os usuários informados (ou toda a base) em lotes, distribuídos entre
+        `processes` processos. Gera uma lista de resultados por lote concluído.
+        """
+        if user_ids is None:
+            user_ids = self.store.user_ids()
+        processes = processes or os.cpu_count() or 1
+        chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+        score_chunk = partial(_score_user_chunk, now=datetime.now(), db_file=self.store.db_file)
+        if processes == 1 or len(chunks) <= 1:
+            yield from map(score_chunk, chunks)
+            return
+        with Pool(processes=min(processes, len(chunks))) as pool:
+            yield from pool.imap_unordered(score_chunk, chunks)
+
+    @traced("oracle.calculate_churn_risk_bulk")
+    def calculate_churn_risk_bulk(self, user_ids: list = None, processes: int = None,
+                                  chunk_size: int = 1000, write_back: bool = True) -> dict:
+        """
+        Recalcula o churn de toda a base (ou de uma lista de usuários) numa única passada e
+        grava `aegis_scores.churn_probability`/`last_calculated_date` numa escrita em lote.
+        """
+        logger.info("🤖 Oracle: Iniciando recálculo de churn em lote.")
+        started_at = time.perf_counter()
+        processes = processes or os.cpu_count() or 1
+        updates = {}
+        risk_levels = {"Alto": 0, "Médio": 0, "Baixo": 0}
+        for results in self.iter_churn_scores(user_ids, processes=processes, chunk_size=chunk_size):
+            for result in results:
+                risk_levels[result["risk_level"]] += 1
+                updates[result["user_id"]] = {
+                    "churn_probability": result["churn_probability"],
+                    "last_calculated_date": result["last_calculated_date"],
+                }
+        if write_back and updates:
+            self.store.patch_many("aegis_scores", updates)
+
+        elapsed = time.perf_counter() - started_at
+        summary = {
+            "users_scored": len(updates),
+            "risk_levels": risk_levels,
+            "processes": processes,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(len(updates) / elapsed, 1) if elapsed > 0 else None,
         }
+        logger.info(f"🤖 Oracle: {summary['users_scored']} usuários pontuados em {summary['elapsed_seconds']}s "
+                    f"({summary['rows_per_second']} usuários/s).")
+        return summary
 
     def _classify_risk(self, score: float) -> str:
-        if score > 0.6:
-            return "Alto"
-        if score > 0.3:
-            return "Médio"
-        return "Baixo"
+        return _classify_churn_risk(score)
 
 def create_oracle_agent():
-    return OracleAgent()
\ No newline at end of file
+    return OracleAgent()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula o risco de churn de toda a base de clientes.")
+    parser.add_argument("--processes", type=int, default=None, help="Processos em paralelo (padrão: número de CPUs).")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Usuários por lote.")
+    parser.add_argument("--dry-run", action="store_true", help="Calcula sem gravar os resultados.")
+    args = parser.parse_args()
+    OracleAgent().calculate_churn_risk_bulk(processes=args.processes, chunk_size=args.chunk_size, write_back=not args.dry_run)
@@ -0,0 +1,166 @@
+import os
+import re
+import textwrap
+from typing import Any, Dict, List
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import (
+    BaseMessage, SystemMessage, get_buffer_string, messages_from_dict, messages_to_dict,
+)
+
+MEMORY_MODE = os.getenv("AEGIS_MEMORY_MODE", "summary")
+DEFAULT_RECENT_TURNS = int(os.getenv("AEGIS_MEMORY_RECENT_TURNS", "4"))
+DEFAULT_MAX_TOKENS = int(os.getenv("AEGIS_MEMORY_MAX_TOKENS", "1500"))
+DEFAULT_SUMMARY_MAX_TOKENS = int(os.getenv("AEGIS_MEMORY_SUMMARY_MAX_TOKENS", "400"))
+MAX_MESSAGE_CHARS = 1500
+
+_TABLE_BLOCK = re.compile(r"(?:^[ \t]*\|.*\|[ \t]*(?:\n|$))+", re.MULTILINE)
+_JSON_BLOB = re.compile(r"(?:\{\"|\[\{)[^\n]{200,}[\]}]")
+
+
+def approximate_tokens(text: str) -> int:
+    """Estimativa barata (~4 caracteres por token), suficiente para controlar o orçamento."""
+    return len(text) // 4 + 1
+
+
+def compact_message(text: str) -> str:
+    """
+    Versão da mensagem que volta ao prompt: tabelas Markdown e JSON extensos, que já
+    foram mostrados ao cliente, viram um marcador curto. Das tabelas fica só a primeira
+    coluna, onde estão os IDs que o cliente pode citar depois.
+    """
+    def table_marker(match):
+        rows = match.group(0).strip().splitlines()[2:]
+        first_cells = [row.strip().strip("|").split("|")[0].strip() for row in rows]
+        return f"[tabela exibida ao cliente; primeira coluna: {', '.join(first_cells)}]\n"
+
+    text = _TABLE_BLOCK.sub(table_marker, text)
+    text = _JSON_BLOB.sub("[dados da ferramenta omitidos]", text)
+    if len(text) > MAX_MESSAGE_CHARS:
+        text = text[:MAX_MESSAGE_CHARS] + "…"
+    return text.strip()
+
+
+def extractive_summary(previous_summary: str, messages: List[BaseMessage], max_tokens: int) -> str:
+    """Acrescenta uma linha curta por mensagem ao resumo e descarta as linhas mais antigas acima do orçamento."""
+    lines = previous_summary.splitlines() if previous_summary else []
+    for message in messages:
+        speaker = "Cliente" if message.type == "human" else "Grace"
+        lines.append(f"- {speaker}: {textwrap.shorten(str(message.content), width=160, placeholder='…')}")
+    while len(lines) > 1 and approximate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class BoundedSummaryMemory(BaseChatMemory):
+    """
+    Memória de conversa com tamanho limitado. As últimas `recent_turns` trocas voltam ao
+    prompt na íntegra (com tabelas e JSON compactados); as anteriores são incorporadas,
+    uma vez só, a um resumo acumulado. Quando as trocas recentes passam de `max_tokens`,
+    as mais antigas também vão para o resumo, então o prompt fica praticamente estável
+    ao longo de um atendimento longo.
+    """
+    memory_key: str = "chat_history"
+    return_messages: bool = True
+    recent_turns: int = DEFAULT_RECENT_TURNS
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    summary_max_tokens: int = DEFAULT_SUMMARY_MAX_TOKENS
+    llm: Any = None
+    summary: str = ""
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        messages = list(self.chat_memory.messages)
+        if self.summary:
+            messages.insert(0, SystemMessage(content=f"Resumo da conversa até aqui:\n{self.summary}"))
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)}
+
+    async def aload_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        # Só lê o que está em memória: não precisa do executor padrão do LangChain.
+        return self.load_memory_variables(inputs)
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        evicted = self._add_turn(inputs, outputs)
+        if evicted:
+            self.summary = self._summarize(evicted)
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        # Caminho do AgentExecutor assíncrono (`ainvoke` e `astream_events`): a mesma
+        # compactação, com o resumo pelo modelo aguardado no event loop, sem bloqueá-lo.
+        evicted = self._add_turn(inputs, outputs)
+        if evicted:
+            self.summary = await self._asummarize(evicted)
+
+    def _add_turn(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> List[BaseMessage]:
+        """Guarda a troca (compactada) e devolve as mensagens que saíram da janela recente."""
+        input_str, output_str = self._get_input_output(inputs, outputs)
+        self.chat_memory.add_user_message(compact_message(input_str))
+        self.chat_memory.add_ai_message(compact_message(output_str))
+        return self._prune()
+
+    def _prune(self) -> List[BaseMessage]:
+        messages = self.chat_memory.messages
+        keep = 2 * self.recent_turns
+        evicted = []
+        while len(messages) > 2 and (
+            len(messages) > keep or approximate_tokens(get_buffer_string(messages)) > self.max_tokens
+        ):
+            evicted, messages = evicted + messages[:2], messages[2:]
+        self.chat_memory.messages = messages
+        return evicted
+
+    def _summary_prompt(self, messages: List[BaseMessage]) -> str:
+        return (
+            "Atualize o resumo de um atendimento ao cliente com as novas mensagens. Mantenha pedidos do "
+            "cliente, dados confirmados, ações já executadas e pendências; ignore saudações. "
+            f"Responda só com o resumo, em até {self.summary_max_tokens * 3 // 4} palavras.\n\n"
+            f"Resumo atual:\n{self.summary or '(vazio)'}\n\n"
+            f"Novas mensagens:\n{get_buffer_string(messages, human_prefix='Cliente', ai_prefix='Grace')}"
+        )
+
+    def _summarize(self, messages: List[BaseMessage]) -> str:
+        if self.llm is None:
+            return extractive_summary(self.summary, messages, self.summary_max_tokens)
+        try:
+            summary = str(self.llm.invoke(self._summary_prompt(messages)).content).strip()
+        except Exception:
+            return extractive_summary(self.summary, messages, self.summary_max_tokens)
+        return summary[:self.summary_max_tokens * 4]
+
+    async def _asummarize(self, messages: List[BaseMessage]) -> str:
+        if self.llm is None:
+            return extractive_summary(self.summary, messages, self.summary_max_tokens)
+        try:
+            summary = str((await self.llm.ainvoke(self._summary_prompt(messages))).content).strip()
+        except Exception:
+            return extractive_summary(self.summary, messages, self.summary_max_tokens)
+        return summary[:self.summary_max_tokens * 4]
+
+    def clear(self) -> None:
+        super().clear()
+        self.summary = ""
+
+    async def aclear(self) -> None:
+        await super().aclear()
+        self.summary = ""
+
+
+def dump_memory_state(memory) -> dict:
+    """Estado serializável (JSON) da memória de uma sessão, para guardá-lo fora do processo."""
+    return {
+        "messages": messages_to_dict(memory.chat_memory.messages),
+        "summary": getattr(memory, "summary", ""),
+    }
+
+
+def restore_memory_state(memory, state: dict):
+    """Recarrega na memória um estado produzido por `dump_memory_state`."""
+    memory.chat_memory.messages = messages_from_dict(state.get("messages", []))
+    if hasattr(memory, "summary"):
+        memory.summary = state.get("summary", "")
+    return memory
@@ -0,0 +1,309 @@
+import argparse
+import json
+import math
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from .agent_guardian import GuardianAgent
+from ..storage.customer_store import get_customer_store
+from ..observability.logs import get_logger
+from ..observability.telemetry import get_telemetry
+
+logger = get_logger("guardian.stream")
+
+STREAM_BATCH_SIZE = int(os.getenv("AEGIS_STREAM_BATCH_SIZE", "500"))
+STREAM_MAX_WAIT_SECONDS = float(os.getenv("AEGIS_STREAM_MAX_WAIT_SECONDS", "0.2"))
+STREAM_QUEUE_SIZE = int(os.getenv("AEGIS_STREAM_QUEUE_SIZE", "10000"))
+ALERT_RISK_LEVEL = "Alto"
+REQUIRED_FIELDS = ("user_id", "transaction_id", "amount_brl", "location")
+
+_END_OF_STREAM = object()
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def is_valid_event(transaction) -> bool:
+    """
+    Evento com os campos e tipos que a pontuação usa: `user_id`, `transaction_id` e `location`
+    em texto, `amount_brl` numérico e finito e, se vier, `time_on_page_seconds` numérico.
+    """
+    if not isinstance(transaction, dict) or any(field not in transaction for field in REQUIRED_FIELDS):
+        return False
+    if not all(isinstance(transaction[field], str) for field in ("user_id", "transaction_id", "location")):
+        return False
+    page_time = transaction.get("time_on_page_seconds")
+    return _is_number(transaction["amount_brl"]) and (page_time is None or _is_number(page_time))
+
+
+def _alert_details(transaction: dict) -> str:
+    return (f"identifiquei uma transação de R${transaction['amount_brl']} em {transaction['location']} "
+            f"(ID {transaction['transaction_id']}) fora do seu padrão de uso, e ela foi bloqueada preventivamente. "
+            f"Se foi você, posso ajudar a liberá-la.")
+
+
+def build_alert(transaction: dict, analysis: dict) -> dict:
+    """Registro `proactive_alert` lido por `get_user_context` no próximo atendimento do cliente."""
+    return {
+        "type": "blocked_transaction",
+        "transaction_id": transaction["transaction_id"],
+        "risk_score": analysis["risk_score"],
+        "reasons": analysis["reasons"],
+        "details": _alert_details(transaction),
+        "created_at": datetime.now().isoformat(),
+    }
+
+
+class JsonlTransactionSource:
+    """
+    Fluxo de transações num arquivo JSONL (uma transação com `user_id` por linha). Lê a partir
+    de um deslocamento em bytes e, com `follow=True`, continua acompanhando o arquivo como um
+    `tail -f`. Cada linha sai junto do deslocamento logo após ela, que é o que vai para o checkpoint.
+    """
+    def __init__(self, path: str, follow: bool = False, poll_seconds: float = 0.2):
+        self.path = path
+        self.follow = follow
+        self.poll_seconds = poll_seconds
+
+    def read(self, offset: int, stop_event: threading.Event):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            pending = b""
+            while not stop_event.is_set():
+                pending += f.readline()
+                if pending.endswith(b"\n"):
+                    offset += len(pending)
+                    line, pending = pending, b""
+                    yield offset, line
+                    continue
+                # Linha incompleta: no modo follow, espera o produtor terminá-la.
+                if not self.follow:
+                    if pending.strip():
+                        yield offset + len(pending), pending
+                    return
+                time.sleep(self.poll_seconds)
+
+
+class FileCheckpoint:
+    """Guarda o deslocamento já processado; a gravação é atômica (arquivo temporário + rename)."""
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> int:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return int(json.load(f)["offset"])
+        except FileNotFoundError:
+            return 0
+
+    def save(self, offset: int):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"offset": offset, "updated_at": datetime.now().isoformat()}, f)
+        os.replace(temp_path, self.path)
+
+
+class TransactionStreamConsumer:
+    """
+    Consome um fluxo de transações em tempo real com as regras do Guardian e grava um
+    `proactive_alert` para cada transação de risco Alto.
+
+    Uma thread lê o fluxo para uma fila limitada a `queue_size` eventos: quando a análise fica
+    para trás, a leitura para de avançar (contrapressão) e a memória não cresce. A análise tira
+    da fila lotes de até `batch_size` eventos (ou o que chegar em `max_wait_seconds`), carrega os
+    atributos dos usuários do lote numa só consulta e grava os alertas numa só escrita. O
+    checkpoint só avança depois que os alertas do lote foram gravados, então numa retomada
+    nenhum evento se perde; os últimos podem ser reprocessados (entrega pelo menos uma vez), o
+    que só regrava o mesmo alerta. Um alerta ainda não lido só é substituído por outro de
+    pontuação igual ou maior.
+    """
+    def __init__(self, guardian: GuardianAgent = None, store=None, batch_size: int = STREAM_BATCH_SIZE,
+                 max_wait_seconds: float = STREAM_MAX_WAIT_SECONDS, queue_size: int = STREAM_QUEUE_SIZE):
+        self.store = store or get_customer_store()
+        self.guardian = guardian or GuardianAgent(store=self.store)
+        self.batch_size = batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.queue_size = queue_size
+
+    @staticmethod
+    def _put(events: queue.Queue, item, stop_event: threading.Event) -> bool:
+        # Com a fila cheia, bloqueia a leitura até a análise liberar espaço (ou o consumo ser interrompido).
+        while not stop_event.is_set():
+            try:
+                events.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, source, offset: int, events: queue.Queue, stop_event: threading.Event, errors: list):
+        try:
+            for event in source.read(offset, stop_event):
+                if not self._put(events, event, stop_event):
+                    break
+        except Exception as e:
+            errors.append(e)
+        finally:
+            self._put(events, _END_OF_STREAM, stop_event)
+
+    def _next_batch(self, events: queue.Queue, stop_event: threading.Event):
+        """Retorna (lote, fim_do_fluxo). Bloqueia até o primeiro evento e então espera no máximo `max_wait_seconds`."""
+        batch = []
+        while not batch:
+            if stop_event.is_set():
+                return batch, True
+            try:
+                event = events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if event is _END_OF_STREAM:
+                return batch, True
+            batch.append(event)
+        deadline = time.monotonic() + self.max_wait_seconds
+        while len(batch) < self.batch_size:
+            try:
+                event = events.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if event is _END_OF_STREAM:
+                return batch, True
+            batch.append(event)
+        return batch, False
+
+    def process_batch(self, lines: list) -> dict:
+        """Analisa um lote de linhas JSONL e grava os alertas. Retorna as contagens do lote."""
+        transactions = []
+        malformed = 0
+        for line in lines:
+            try:
+                transaction = json.loads(line)
+            except ValueError:
+                malformed += 1
+                continue
+            if not is_valid_event(transaction):
+                malformed += 1
+                continue
+            transactions.append((transaction["user_id"], transaction))
+
+        features = self.store.features_many({user_id for user_id, _ in transactions})
+        known = [(user_id, transaction) for user_id, transaction in transactions if user_id in features]
+        alerts = {}
+        analyses = self._score(known, features)
+        for (user_id, transaction), analysis in zip(known, analyses):
+            if analysis is None:
+                malformed += 1
+                continue
+            if analysis["risk_level"] != ALERT_RISK_LEVEL:
+                continue
+            if user_id not in alerts or analysis["risk_score"] >= alerts[user_id]["risk_score"]:
+                alerts[user_id] = build_alert(transaction, analysis)
+        alerts = self._keep_unread_alerts(alerts)
+        if alerts:
+            self.store.patch_many("proactive_alert", alerts)
+        return {
+            "events": len(lines),
+            "scored": sum(1 for analysis in analyses if analysis is not None),
+            "unknown_users": len(transactions) - len(known),
+            "malformed": malformed,
+            "alerts": len(alerts),
+        }
+
+    def _score(self, known: list, features: dict) -> list:
+        """
+        Pontua o lote de uma vez; se algo falhar, pontua evento a evento, e os que falharem
+        (None) são descartados para que um evento ruim não trave o checkpoint do fluxo.
+        """
+        try:
+            return self.guardian.score_batch(known, features)
+        except Exception as e:
+            logger.warning(f"⚠️ Guardian: Falha ao pontuar o lote ({e}); pontuando evento a evento.")
+        analyses = []
+        for user_id, transaction in known:
+            try:
+                analyses.append(self.guardian.score_batch([(user_id, transaction)], features)[0])
+            except Exception as e:
+                logger.warning(f"⚠️ Guardian: Evento {transaction.get('transaction_id')} descartado: {e}")
+                analyses.append(None)
+        return analyses
+
+    def _keep_unread_alerts(self, alerts: dict) -> dict:
+        """
+        Descarta os alertas novos que substituiriam um alerta ainda não lido de pontuação maior.
+        Um alerta da mesma transação (um lote reprocessado) sempre é regravado.
+        """
+        if not alerts:
+            return alerts
+        current = self.store.json_field_many(alerts, "$.proactive_alert")
+        kept = {}
+        for user_id, alert in alerts.items():
+            unread = json.loads(current[user_id]) if current.get(user_id) else None
+            if (not isinstance(unread, dict) or unread.get("transaction_id") == alert["transaction_id"]
+                    or alert["risk_score"] >= unread.get("risk_score", 0)):
+                kept[user_id] = alert
+        return kept
+
+    def run(self, source, checkpoint: FileCheckpoint = None, stop_event: threading.Event = None) -> dict:
+        """Consome `source` a partir do checkpoint até o fim do fluxo (ou até `stop_event`)."""
+        stop_event = stop_event or threading.Event()
+        telemetry = get_telemetry()
+        offset = checkpoint.load() if checkpoint else 0
+        logger.info(f"🤖 Guardian: Consumindo fluxo de transações a partir do byte {offset}.")
+        events = queue.Queue(maxsize=self.queue_size)
+        errors = []
+        producer = threading.Thread(
+            target=self._produce, args=(source, offset, events, stop_event, errors), name="guardian-stream-reader", daemon=True
+        )
+        producer.start()
+
+        totals = {"events": 0, "scored": 0, "unknown_users": 0, "malformed": 0, "alerts": 0, "batches": 0}
+        started_at = time.perf_counter()
+        try:
+            finished = False
+            while not finished:
+                batch, finished = self._next_batch(events, stop_event)
+                if not batch:
+                    continue
+                batch_started_at = time.perf_counter()
+                counts = self.process_batch([line for _, line in batch])
+                offset = batch[-1][0]
+                if checkpoint:
+                    checkpoint.save(offset)
+                telemetry.record_span("guardian.stream.batch", time.perf_counter() - batch_started_at,
+                                      events=counts["events"], alerts=counts["alerts"])
+                telemetry.increment("aegis_stream_events_total", counts["events"])
+                telemetry.increment("aegis_stream_alerts_total", counts["alerts"])
+                for key, value in counts.items():
+                    totals[key] += value
+                totals["batches"] += 1
+        finally:
+            stop_event.set()
+            producer.join()
+        if errors:
+            raise errors[0]
+
+        elapsed = time.perf_counter() - started_at
+        summary = dict(totals, offset=offset, elapsed_seconds=round(elapsed, 3),
+                       events_per_second=round(totals["events"] / elapsed, 1) if elapsed > 0 else None)
+        logger.info(f"🤖 Guardian: {summary['events']} transações consumidas, {summary['alerts']} alertas gravados "
+                    f"em {summary['elapsed_seconds']}s ({summary['events_per_second']} eventos/s).")
+        return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consome um fluxo JSONL de transações e grava alertas de fraude.")
+    parser.add_argument("stream", help="Arquivo JSONL com uma transação (com user_id) por linha.")
+    parser.add_argument("--checkpoint", default=None, help="Arquivo de checkpoint (padrão: <stream>.checkpoint).")
+    parser.add_argument("--follow", action="store_true", help="Continua acompanhando o arquivo após o fim (como tail -f).")
+    parser.add_argument("--batch-size", type=int, default=STREAM_BATCH_SIZE)
+    parser.add_argument("--queue-size", type=int, default=STREAM_QUEUE_SIZE, help="Eventos lidos à frente da análise.")
+    args = parser.parse_args()
+    consumer = TransactionStreamConsumer(batch_size=args.batch_size, queue_size=args.queue_size)
+    try:
+        consumer.run(JsonlTransactionSource(args.stream, follow=args.follow),
+                     FileCheckpoint(args.checkpoint or f"{args.stream}.checkpoint"))
+    except KeyboardInterrupt:
+        logger.info("🤖 Guardian: Consumo interrompido; será retomado a partir do último checkpoint.")
@@ -0,0 +1,183 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+FAST_PATH_ENABLED = os.getenv("AEGIS_FAST_PATH", "1") != "0"
+MAX_FAST_PATH_WORDS = 10
+
+INTENT_PATTERNS = {
+    "subscriptions": r"\b(assinaturas?|planos?|pacotes?|servicos ativos)\b",
+    "billing_history": r"\b(faturas?|historico de faturamento|historico de pagamentos|cobrancas|meus pagamentos)\b",
+    "payment_methods": r"\b(metodos? de pagamento|formas? de pagamento|meus cartoes|cartoes cadastrados)\b",
+}
+QUERY_CUES = r"\b(quais|qual|mostre|mostra|mostrar|ver|veja|listar|liste|lista|exiba|exibir|consultar|consulte|minhas|meus|quero ver)\b"
+BLOCKERS = (
+    r"\b(remov|apag|exclu|delet|atualiz|alter|troc|mud|cancel|suspeit|reconhec|parcel|pagar|contest|"
+    r"por que|porque|erro|problema|ajuda|segunda via|nao|txn_|cc_|\d|"
+    r"quando|quanto|valor|venc|ultim|proxim|janeiro|fevereiro|marco|abril|maio|junho|julho|agosto|"
+    r"setembro|outubro|novembro|dezembro)"
+)
+
+STATUS_LABELS = {"success": "Pago", "failed": "Falhou", "pending": "Pendente"}
+PAYMENT_TYPE_LABELS = {"credit_card": "Cartão de Crédito", "pix": "Pix"}
+
+
+def normalize_message(text: str) -> str:
+    """Minúsculas, sem acentos e sem pontuação, para comparar com os padrões."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+def format_brl(value) -> str:
+    return "R$ " + f"{float(value):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def format_date(value: str) -> str:
+    try:
+        year, month, day = value[:10].split("-")
+        return f"{day}/{month}/{year}"
+    except (AttributeError, ValueError):
+        return value or "-"
+
+
+def _markdown_table(headers: list, rows: list) -> str:
+    lines = ["| " + " | ".join(headers) + " |", "|" + "|".join("-" * (len(h) + 2) for h in headers) + "|"]
+    lines += ["| " + " | ".join(str(cell) for cell in row) + " |" for row in rows]
+    return "\n".join(lines)
+
+
+def render_subscriptions(subscriptions: list) -> str:
+    if not subscriptions:
+        return "Grace(Agente Concierge): Não encontrei nenhuma assinatura ativa na sua conta."
+    rows = [
+        [s.get("service_name", s.get("service_id", "-")), format_brl(s.get("monthly_fee_brl", 0)), format_date(s.get("next_billing_date"))]
+        for s in subscriptions
+    ]
+    return (
+        "Grace(Agente Concierge): Aqui estão as suas assinaturas ativas.\n\n**Assinaturas Ativas**\n\n"
+        + _markdown_table(["Serviço", "Mensalidade", "Próxima Cobrança"], rows)
+    )
+
+
+def _more_pages_note(shown: int, page: dict, noun: str, hint: str) -> str:
+    if page.get("next_cursor") is None:
+        return ""
+    return f"\n\nMostrando {shown} de {page.get('total', shown)} {noun}. {hint}"
+
+
+def render_billing_history(page: dict) -> str:
+    transactions = page.get("transactions", [])
+    if not transactions:
+        return "Grace(Agente Concierge): Não encontrei nenhuma fatura no seu histórico."
+    rows = [
+        [t["transaction_id"], format_date(t.get("date")), t.get("description", "-"), format_brl(t.get("amount_brl", 0)),
+         STATUS_LABELS.get(t.get("status"), t.get("status", "-"))]
+        for t in transactions
+    ]
+    return (
+        "Grace(Agente Concierge): Aqui está o seu histórico de faturas.\n\n**Histórico de Faturamento**\n\n"
+        + _markdown_table(["ID da Fatura", "Data", "Descrição", "Valor", "Status"], rows)
+        + _more_pages_note(len(transactions), page, "faturas, das mais recentes para as mais antigas",
+                           "Posso mostrar as anteriores ou filtrar por período, status ou local.")
+    )
+
+
+def render_payment_methods(page: dict) -> str:
+    payment_methods = page.get("payment_methods", [])
+    if not payment_methods:
+        return "Grace(Agente Concierge): Você ainda não tem métodos de pagamento cadastrados."
+    rows = []
+    for pm in payment_methods:
+        if pm.get("type") == "credit_card":
+            details = f"{pm.get('brand', 'Cartão')} final {pm.get('last4', '----')}"
+            expiry = pm.get("expiry_date") or "-"
+            if expiry != "-":
+                year, month = expiry.split("-")
+                expiry = f"{month}/{year}"
+        else:
+            details = pm.get("details", "-")
+            expiry = "-"
+        rows.append([pm.get("id", "-"), PAYMENT_TYPE_LABELS.get(pm.get("type"), pm.get("type", "-")), details, expiry])
+    return (
+        "Grace(Agente Concierge): Estes são os seus métodos de pagamento cadastrados.\n\n**Métodos de Pagamento**\n\n"
+        + _markdown_table(["ID", "Tipo", "Detalhes", "Validade"], rows)
+        + _more_pages_note(len(payment_methods), page, "métodos de pagamento", "Posso mostrar os demais.")
+    )
+
+
+RENDERERS = {
+    "subscriptions": render_subscriptions,
+    "billing_history": render_billing_history,
+    "payment_methods": render_payment_methods,
+}
+
+
+class IntentRouter:
+    """
+    Pré-roteador determinístico do Concierge. Reconhece localmente consultas simples e
+    inequívocas ("quais são minhas assinaturas?", "mostre minhas faturas") e as responde
+    chamando a ferramenta correspondente e montando a tabela Markdown, sem passar pelo LLM.
+    Qualquer mensagem fora desses casos segue para o agente normalmente.
+    """
+    def __init__(self, tools: dict, enabled: bool = FAST_PATH_ENABLED):
+        self.tools = tools
+        self.enabled = enabled
+        self._patterns = {intent: re.compile(pattern) for intent, pattern in INTENT_PATTERNS.items()}
+        self._query_cues = re.compile(QUERY_CUES)
+        self._blockers = re.compile(BLOCKERS)
+        self._lock = threading.Lock()
+        self.hits = {intent: 0 for intent in INTENT_PATTERNS}
+        self.fast_path_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_path_seconds = 0.0
+
+    def classify(self, message: str):
+        """Retorna a intenção quando ela é simples e inequívoca; caso contrário, None."""
+        text = normalize_message(message)
+        if not text or len(text.split()) > MAX_FAST_PATH_WORDS:
+            return None
+        if self._blockers.search(text) or not self._query_cues.search(text):
+            return None
+        matches = [intent for intent, pattern in self._patterns.items() if pattern.search(text)]
+        return matches[0] if len(matches) == 1 else None
+
+    def try_answer(self, message: str):
+        """Responde pelo caminho rápido ou retorna None para que a mensagem siga ao LLM."""
+        if not self.enabled:
+            return None
+        started_at = time.perf_counter()
+        intent = self.classify(message)
+        if intent is None or intent not in self.tools:
+            return None
+        result = json.loads(self.tools[intent]()).get("result", [])
+        reply = RENDERERS[intent](result)
+        with self._lock:
+            self.hits[intent] += 1
+            self.fast_path_seconds += time.perf_counter() - started_at
+        return reply
+
+    def record_llm_latency(self, seconds: float):
+        """Registra a duração de um turno resolvido pelo LLM, base da estimativa de tempo economizado."""
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_path_seconds += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            total_hits = sum(self.hits.values())
+            messages = total_hits + self.llm_calls
+            avg_fast = self.fast_path_seconds / total_hits if total_hits else 0.0
+            avg_llm = self.llm_path_seconds / self.llm_calls if self.llm_calls else None
+            return {
+                "messages": messages,
+                "fast_path_hits": total_hits,
+                "hit_rate": round(total_hits / messages, 4) if messages else 0.0,
+                "hits_by_intent": dict(self.hits),
+                "avg_fast_path_ms": round(avg_fast * 1000, 2),
+                "avg_llm_path_ms": round(avg_llm * 1000, 2) if avg_llm is not None else None,
+                "estimated_latency_saved_ms": round((avg_llm - avg_fast) * total_hits * 1000, 2) if avg_llm is not None else None,
+            }
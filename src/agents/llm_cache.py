@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+from ..storage.customer_store import DATA_DIR
+
+LLM_CACHE_ENABLED = os.getenv("AEGIS_LLM_CACHE", "1") != "0"
+DEFAULT_CACHE_FILE = os.getenv("AEGIS_LLM_CACHE_FILE", os.path.join(DATA_DIR, 'llm_cache.db'))
+DEFAULT_MAX_ENTRIES = int(os.getenv("AEGIS_LLM_CACHE_MAX_ENTRIES", "2000"))
+DEFAULT_TTL_SECONDS = float(os.getenv("AEGIS_LLM_CACHE_TTL_SECONDS", str(24 * 3600)))
+MAX_PENDING_LOOKUPS = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_responses (
+    cache_key TEXT PRIMARY KEY,
+    generations TEXT NOT NULL,
+    latency_seconds REAL NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Ignora diferenças de espaçamento, que não mudam o que o modelo recebe na prática."""
+    return " ".join(prompt.split())
+
+
+class ResponseCache(BaseCache):
+    """
+    Cache das respostas do LLM em dois níveis: um LRU em memória e uma tabela SQLite em
+    disco, que sobrevive a reinícios e é compartilhada entre processos. A chave combina o
+    prompt normalizado, a configuração do modelo e o `scope()` do momento da chamada; no
+    Concierge o escopo é o usuário e a versão do perfil, então qualquer escrita no perfil
+    deixa de casar com as respostas antigas.
+    """
+    def __init__(self, scope=None, db_file: str = DEFAULT_CACHE_FILE, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.scope = scope or (lambda: "")
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        if db_file:
+            with self._connection() as conn:
+                conn.execute(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        material = "\x00".join((str(self.scope()), llm_string, normalize_prompt(prompt)))
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str):
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                self.saved_seconds += entry[1]
+                return entry[0]
+        row = None
+        if self.db_file:
+            row = self._connection().execute(
+                "SELECT generations, latency_seconds, created_at FROM llm_responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+        if row is not None and row[2] + self.ttl_seconds > now:
+            generations = [loads(raw) for raw in json.loads(row[0])]
+            with self._lock:
+                self._remember(key, generations, row[1], row[2] + self.ttl_seconds)
+                self.disk_hits += 1
+                self.saved_seconds += row[1]
+            return generations
+        with self._lock:
+            self.misses += 1
+            self._pending[(prompt, llm_string)] = (key, time.perf_counter())
+            if len(self._pending) > MAX_PENDING_LOOKUPS:
+                self._pending.pop(next(iter(self._pending)))
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val):
+        """
+        Grava a resposta gerada. A chave e o início da chamada vêm do `lookup` que falhou, para
+        que a latência economizada nos próximos acertos seja a da geração original.
+        """
+        with self._lock:
+            key, started_at = self._pending.pop((prompt, llm_string), (None, None))
+        if key is None:
+            key, latency = self._key(prompt, llm_string), 0.0
+        else:
+            latency = time.perf_counter() - started_at
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, list(return_val), latency, created_at + self.ttl_seconds)
+        if self.db_file:
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_responses (cache_key, generations, latency_seconds, created_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps([dumps(generation) for generation in return_val]), latency, created_at),
+                )
+                conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (created_at - self.ttl_seconds,))
+
+    def _remember(self, key: str, generations: list, latency: float, expires_at: float):
+        self._entries[key] = (generations, latency, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+        if self.db_file:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM llm_responses")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries_in_memory": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_hit_ratio": round(self.memory_hits / lookups, 4) if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
@@ -0,0 +1,480 @@
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, message_chunk_to_message
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from .streaming import get_async_runner
+from ..observability.logs import get_logger
+from ..observability.telemetry import get_telemetry
+
+logger = get_logger("llm")
+
+MAX_CONCURRENCY = int(os.getenv("AEGIS_LLM_MAX_CONCURRENCY", "16"))
+ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("AEGIS_LLM_ATTEMPT_TIMEOUT_SECONDS", "30"))
+DEADLINE_SECONDS = float(os.getenv("AEGIS_LLM_DEADLINE_SECONDS", "45"))
+MAX_RETRIES = int(os.getenv("AEGIS_LLM_MAX_RETRIES", "2"))
+BACKOFF_SECONDS = float(os.getenv("AEGIS_LLM_BACKOFF_SECONDS", "0.5"))
+MAX_BACKOFF_SECONDS = float(os.getenv("AEGIS_LLM_MAX_BACKOFF_SECONDS", "8"))
+BREAKER_FAILURES = int(os.getenv("AEGIS_LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("AEGIS_LLM_BREAKER_RESET_SECONDS", "30"))
+
+FALLBACK_REPLY = ("Grace: Desculpe, estou com uma instabilidade para responder agora. "
+                  "Pode tentar de novo em alguns instantes? Seus dados e pedidos continuam seguros.")
+
+RETRIABLE_ERRORS = (TimeoutError, ConnectionError)
+try:
+    from google.api_core import exceptions as google_exceptions
+    RETRIABLE_ERRORS += (
+        google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable, google_exceptions.DeadlineExceeded,
+        google_exceptions.InternalServerError,
+    )
+except ImportError:
+    pass
+
+
+class CircuitOpenError(RuntimeError):
+    """O circuito está aberto: o modelo falhou seguidamente e as chamadas estão suspensas."""
+
+
+class CircuitBreaker:
+    """
+    Depois de `failure_threshold` falhas seguidas, abre por `reset_seconds`: nesse tempo
+    nenhuma chamada sai. Passado o intervalo, uma única chamada de teste é liberada
+    (meio aberto); se ela der certo o circuito fecha, senão volta a abrir. Só erros
+    transitórios (`RETRIABLE_ERRORS` e prazos estourados) contam como falha.
+    """
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.opened_count = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def admit(self):
+        """
+        None se a chamada deve ser barrada. Senão, "probe" quando ela é a chamada de teste do
+        meio aberto, que precisa terminar em `record_success`, `record_failure` ou
+        `release_probe`, e "closed" nos demais casos.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._probing:
+                return None
+            self._probing = True
+            return "probe"
+
+    def release_probe(self):
+        """Devolve a chamada de teste que terminou sem dizer nada sobre o modelo (ex.: cancelada)."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    self.opened_count += 1
+                    logger.warning(f"⚠️ LLM: {self._failures} falhas seguidas; circuito aberto por {self.reset_seconds}s.")
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class _SharedCall:
+    """Uma chamada ao modelo em andamento; quem pedir o mesmo prompt acompanha os mesmos pedaços."""
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self.changed = asyncio.Condition()
+
+    async def publish(self, chunk):
+        async with self.changed:
+            self.chunks.append(chunk)
+            self.changed.notify_all()
+
+    async def finish(self, error: BaseException = None):
+        async with self.changed:
+            self.done = True
+            self.error = error
+            self.changed.notify_all()
+
+
+class ResilientLLMClient:
+    """
+    Política compartilhada por todas as conversas do processo para as chamadas ao modelo:
+    no máximo `max_concurrency` chamadas simultâneas, prazo total de `deadline_seconds` por
+    pedido (incluindo a espera na fila e as novas tentativas) e de `attempt_timeout_seconds`
+    por tentativa, novas tentativas com backoff exponencial e jitter para erros transitórios,
+    disjuntor (`CircuitBreaker`) e agrupamento de pedidos idênticos em andamento numa única
+    chamada. Quando nada disso basta, `ResilientChatModel` responde com `FALLBACK_REPLY`.
+    """
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, attempt_timeout_seconds: float = ATTEMPT_TIMEOUT_SECONDS,
+                 deadline_seconds: float = DEADLINE_SECONDS, max_retries: int = MAX_RETRIES,
+                 backoff_seconds: float = BACKOFF_SECONDS, max_backoff_seconds: float = MAX_BACKOFF_SECONDS,
+                 breaker: CircuitBreaker = None):
+        self.max_concurrency = max_concurrency
+        self.attempt_timeout_seconds = attempt_timeout_seconds
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self._loop = None
+        self._semaphore = None
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.in_flight_calls = 0
+
+    def _bind_loop(self):
+        # Semáforo e pedidos em andamento são do event loop (um por processo, ver streaming.py).
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._in_flight = {}
+        return loop
+
+    async def stream(self, key: str, open_stream):
+        """
+        Repassa os pedaços de `open_stream()` (um iterável assíncrono que faz a chamada ao
+        modelo) aplicando a política. Pedidos com a mesma `key` feitos enquanto outro está em
+        andamento não geram nova chamada: recebem os mesmos pedaços.
+        """
+        self._bind_loop()
+        call = self._in_flight.get(key)
+        if call is None:
+            call = self._in_flight[key] = _SharedCall()
+            call.task = asyncio.ensure_future(self._produce(key, call, open_stream))
+        else:
+            self.coalesced += 1
+            get_telemetry().increment("aegis_llm_coalesced_total")
+        call.subscribers += 1
+        try:
+            position = 0
+            while True:
+                async with call.changed:
+                    await call.changed.wait_for(lambda: call.done or len(call.chunks) > position)
+                    chunks, done, error = call.chunks[position:], call.done, call.error
+                for chunk in chunks:
+                    yield chunk
+                position += len(chunks)
+                if done and position == len(call.chunks):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            call.subscribers -= 1
+            if call.subscribers == 0 and not call.done:
+                # Ninguém mais espera por esta resposta (ex.: o cliente fechou a conexão).
+                if self._in_flight.get(key) is call:
+                    del self._in_flight[key]
+                call.task.cancel()
+
+    async def _produce(self, key: str, call: _SharedCall, open_stream):
+        try:
+            await self._call_with_policy(call, open_stream)
+        except asyncio.CancelledError:
+            await call.finish(RuntimeError("Chamada ao modelo cancelada."))
+        except Exception as error:
+            await call.finish(error)
+        else:
+            await call.finish()
+        finally:
+            if self._in_flight.get(key) is call:
+                del self._in_flight[key]
+
+    async def _call_with_policy(self, call: _SharedCall, open_stream):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_seconds
+        attempt = 0
+        while True:
+            admission = self.breaker.admit()
+            if admission is None:
+                raise CircuitOpenError("Circuito do modelo aberto.")
+            # A tentativa só dá um veredito ao disjuntor quando o modelo respondeu ou teve uma
+            # falha transitória; sem vaga dentro do prazo, cancelada ou com erro do próprio
+            # pedido (validação, 4xx), a chamada de teste do meio aberto é só devolvida.
+            settled = False
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), max(0.0, deadline - loop.time()))
+                published = len(call.chunks)
+                self.calls += 1
+                self.in_flight_calls += 1
+                try:
+                    timeout = min(self.attempt_timeout_seconds, deadline - loop.time())
+                    await asyncio.wait_for(self._pump(call, open_stream), max(0.0, timeout))
+                except RETRIABLE_ERRORS as error:
+                    self.breaker.record_failure()
+                    settled = True
+                    # Depois que parte da resposta já foi repassada, repetir a chamada a duplicaria.
+                    delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt) * random.uniform(0.5, 1.0)
+                    if len(call.chunks) > published or attempt >= self.max_retries or loop.time() + delay >= deadline:
+                        raise
+                    logger.warning(f"⚠️ LLM: Falha transitória ({type(error).__name__}); nova tentativa em {delay:.2f}s.")
+                else:
+                    self.breaker.record_success()
+                    settled = True
+                    return
+                finally:
+                    self.in_flight_calls -= 1
+                    self._semaphore.release()
+            finally:
+                if admission == "probe" and not settled:
+                    self.breaker.release_probe()
+            attempt += 1
+            self.retries += 1
+            get_telemetry().increment("aegis_llm_retries_total")
+            await asyncio.sleep(delay)
+
+    def call(self, invoke):
+        """
+        Versão síncrona da política, para quem precisa do modelo sem poder esperar pelo event
+        loop do processo (ex.: o resumo da memória, gravado pelo agente dentro do próprio loop).
+        Mesmos prazos, novas tentativas e disjuntor; o limite de concorrência é o das threads
+        que executam `invoke()`, e não há agrupamento de pedidos idênticos.
+        """
+        deadline = time.monotonic() + self.deadline_seconds
+        attempt = 0
+        while True:
+            admission = self.breaker.admit()
+            if admission is None:
+                raise CircuitOpenError("Circuito do modelo aberto.")
+            settled = False
+            self.calls += 1
+            self.in_flight_calls += 1
+            try:
+                timeout = min(self.attempt_timeout_seconds, deadline - time.monotonic())
+                result = _sync_calls().submit(invoke).result(max(0.0, timeout))
+            except RETRIABLE_ERRORS as error:
+                self.breaker.record_failure()
+                settled = True
+                delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt) * random.uniform(0.5, 1.0)
+                if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                logger.warning(f"⚠️ LLM: Falha transitória ({type(error).__name__}); nova tentativa em {delay:.2f}s.")
+            else:
+                self.breaker.record_success()
+                settled = True
+                return result
+            finally:
+                self.in_flight_calls -= 1
+                if admission == "probe" and not settled:
+                    self.breaker.release_probe()
+            attempt += 1
+            self.retries += 1
+            get_telemetry().increment("aegis_llm_retries_total")
+            time.sleep(delay)
+
+    @staticmethod
+    async def _pump(call: _SharedCall, open_stream):
+        async for chunk in open_stream():
+            await call.publish(chunk)
+
+    def stats(self) -> dict:
+        return {
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.opened_count,
+            "max_concurrency": self.max_concurrency,
+            "in_flight_calls": self.in_flight_calls,
+            "calls": self.calls,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+        }
+
+
+# O modelo original roda sem os callbacks herdados da execução do agente: quem emite os
+# eventos (tokens, início e fim) para o agente é o `ResilientChatModel`, uma única vez por
+# pedido, mesmo quando vários pedidos compartilham a mesma chamada.
+_ISOLATED = {"callbacks": []}
+
+
+_client = None
+_client_lock = threading.Lock()
+_sync_executor = None
+
+
+def _sync_calls() -> ThreadPoolExecutor:
+    """Threads das chamadas síncronas (`ResilientLLMClient.call`): o prazo de cada tentativa é a espera pelo resultado."""
+    global _sync_executor
+    if _sync_executor is None:
+        with _client_lock:
+            if _sync_executor is None:
+                _sync_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="aegis-llm-sync")
+    return _sync_executor
+
+
+def get_llm_client() -> ResilientLLMClient:
+    """Política de chamadas ao modelo compartilhada pelo processo."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ResilientLLMClient()
+    return _client
+
+
+def _call_key(kind: str, messages: List[BaseMessage], stop, kwargs: dict) -> str:
+    material = dumps([kind, messages, stop, kwargs])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _as_chunk(message: AIMessage) -> AIMessageChunk:
+    """Reproduz uma resposta em cache como um único pedaço de streaming, com as chamadas de ferramenta."""
+    return AIMessageChunk(
+        content=message.content,
+        tool_call_chunks=[
+            {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+            for index, call in enumerate(message.tool_calls)
+        ],
+        response_metadata=message.response_metadata,
+    )
+
+
+class ResilientChatModel(BaseChatModel):
+    """
+    Modelo de chat que passa as chamadas do `inner` pelo `ResilientLLMClient`. Mantém a
+    interface do LangChain (inclusive `bind_tools` e streaming), então o agente de
+    ferramentas o usa no lugar do modelo original. Se o modelo não responder dentro da
+    política, a resposta é `FALLBACK_REPLY`.
+
+    Com `response_cache` (ver llm_cache.py), cada chamada consulta o cache antes de ir ao
+    modelo, tanto em streaming quanto fora dele; a resposta de contingência nunca é gravada.
+    """
+    inner: Any
+    client: Any
+    response_cache: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return f"resilient-{self.inner._llm_type}"
+
+    def bind_tools(self, tools, **kwargs):
+        # O modelo original converte as ferramentas para o próprio formato; os argumentos
+        # resultantes voltam para ele a cada chamada.
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    def _fallback(self, error: BaseException) -> AIMessage:
+        reason = "circuit_open" if isinstance(error, CircuitOpenError) else type(error).__name__
+        logger.error(f"❌ LLM: Sem resposta do modelo ({reason}: {error}); usando a resposta de contingência.")
+        get_telemetry().increment("aegis_llm_fallbacks_total", reason=reason)
+        return AIMessage(content=FALLBACK_REPLY)
+
+    def _cache_lookup(self, messages: List[BaseMessage], stop, kwargs: dict):
+        """
+        Consulta o cache com a mesma chave que o LangChain usa nos modelos de chat (prompt
+        serializado e a configuração do modelo, incluindo as ferramentas declaradas).
+        Retorna a chave, para gravar a resposta depois, e a mensagem em cache, se houver. Os ids
+        que o LangChain dá a cada resposta do modelo mudam a cada execução e ficam fora da chave.
+        """
+        if self.response_cache is None:
+            return None, None
+        prompt = dumps([message.model_copy(update={"id": None}) for message in messages])
+        key = (prompt, self.inner._get_llm_string(stop=stop, **kwargs))
+        generations = self.response_cache.lookup(*key)
+        return key, (generations[0].message if generations else None)
+
+    def _cache_update(self, key, message: AIMessage):
+        if key is not None:
+            self.response_cache.update(*key, [ChatGeneration(message=message)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any):
+        key, cached = self._cache_lookup(messages, stop, kwargs)
+        if cached is not None:
+            generation = ChatGenerationChunk(message=_as_chunk(cached))
+            if run_manager:
+                await run_manager.on_llm_new_token(generation.text, chunk=generation)
+            yield generation
+            return
+        streamed = None
+        try:
+            async for chunk in self.client.stream(
+                _call_key("stream", messages, stop, kwargs),
+                lambda: self.inner.astream(messages, config=_ISOLATED, stop=stop, **kwargs),
+            ):
+                generation = ChatGenerationChunk(message=copy.copy(chunk))
+                if run_manager:
+                    await run_manager.on_llm_new_token(generation.text, chunk=generation)
+                streamed = generation if streamed is None else streamed + generation
+                yield generation
+        except Exception as error:
+            if streamed is not None:
+                raise
+            generation = ChatGenerationChunk(message=AIMessageChunk(content=self._fallback(error).content))
+            if run_manager:
+                await run_manager.on_llm_new_token(generation.text, chunk=generation)
+            yield generation
+            return
+        if streamed is not None:
+            self._cache_update(key, message_chunk_to_message(streamed.message))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        key, cached = self._cache_lookup(messages, stop, kwargs)
+        if cached is not None:
+            return ChatResult(generations=[ChatGeneration(message=cached)])
+
+        async def invoke():
+            yield await self.inner.ainvoke(messages, config=_ISOLATED, stop=stop, **kwargs)
+
+        try:
+            async for message in self.client.stream(_call_key("invoke", messages, stop, kwargs), invoke):
+                self._cache_update(key, message)
+                return ChatResult(generations=[ChatGeneration(message=copy.copy(message))])
+        except Exception as error:
+            return ChatResult(generations=[ChatGeneration(message=self._fallback(error))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        # Chamadas síncronas (ex.: o resumo da memória) passam pelo mesmo event loop do
+        # processo, para dividir o limite de concorrência e o disjuntor com as conversas.
+        runner = get_async_runner()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not runner.loop:
+            return runner.run(self._agenerate(messages, stop=stop, **kwargs))
+        # Dentro do próprio loop do processo não dá para esperar por ele: a política é
+        # aplicada na versão síncrona do cliente.
+        key, cached = self._cache_lookup(messages, stop, kwargs)
+        if cached is not None:
+            return ChatResult(generations=[ChatGeneration(message=cached)])
+        try:
+            message = self.client.call(lambda: self.inner.invoke(messages, config=_ISOLATED, stop=stop, **kwargs))
+        except Exception as error:
+            return ChatResult(generations=[ChatGeneration(message=self._fallback(error))])
+        self._cache_update(key, message)
+        return ChatResult(generations=[ChatGeneration(message=copy.copy(message))])
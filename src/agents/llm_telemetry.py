@@ -0,0 +1,49 @@
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from ..observability.telemetry import get_telemetry
+
+
+class LLMTelemetryCallback(BaseCallbackHandler):
+    """
+    Callback do LangChain que registra cada chamada ao modelo como um span `llm.<modelo>`
+    e soma os tokens de entrada e saída em `aegis_llm_tokens_total`.
+    """
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        with self._lock:
+            self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        with self._lock:
+            self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        elapsed = self._elapsed(run_id)
+        telemetry = get_telemetry()
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+        telemetry.increment("aegis_llm_tokens_total", input_tokens, model=self.model_name, kind="input")
+        telemetry.increment("aegis_llm_tokens_total", output_tokens, model=self.model_name, kind="output")
+        if elapsed is not None:
+            telemetry.record_span(f"llm.{self.model_name}", elapsed, input_tokens=input_tokens, output_tokens=output_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        elapsed = self._elapsed(run_id)
+        if elapsed is not None:
+            get_telemetry().record_span(f"llm.{self.model_name}", elapsed, status="error", error=str(error))
+
+    def _elapsed(self, run_id):
+        with self._lock:
+            started_at = self._started.pop(run_id, None)
+        return time.perf_counter() - started_at if started_at is not None else None
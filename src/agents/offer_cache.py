@@ -0,0 +1,75 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("AEGIS_OFFER_CACHE_MAX_ENTRIES", "20000"))
+DEFAULT_TTL_SECONDS = float(os.getenv("AEGIS_OFFER_CACHE_TTL_SECONDS", "3600"))
+
+
+class OfferCache:
+    """
+    Cache LRU em memória das ofertas do Dynamo, por (usuário, impressão digital da transação).
+    Cada entrada guarda a versão do perfil usada no cálculo e só vale enquanto ela for a
+    versão atual: qualquer escrita no perfil (que também atualiza os atributos lidos pelo
+    Guardian) invalida as ofertas do usuário. Guarda o JSON, então cada leitura devolve
+    uma cópia independente da oferta.
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str, fingerprint: tuple, version: int):
+        """Retorna a oferta calculada com a versão `version` do perfil, ou None."""
+        key = (user_id, fingerprint)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            raw, cached_version, expires_at = entry
+            if cached_version != version or expires_at < time.monotonic():
+                del self._entries[key]
+                if cached_version != version:
+                    self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return json.loads(raw)
+
+    def set(self, user_id: str, fingerprint: tuple, version: int, offer: dict):
+        if self.max_entries <= 0:
+            return
+        raw = json.dumps(offer, ensure_ascii=False)
+        with self._lock:
+            self._entries[(user_id, fingerprint)] = (raw, version, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end((user_id, fingerprint))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
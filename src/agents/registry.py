@@ -0,0 +1,75 @@
+import threading
+
+from .agent_ambassador import AmbassadorAgent
+from .agent_dynamo import DynamoAgent
+from .agent_gatekeeper import GatekeeperAgent
+from .agent_guardian import GuardianAgent
+from .agent_oracle import OracleAgent
+from ..storage.customer_store import get_customer_store
+
+
+class AgentRegistry:
+    """
+    Contêiner das instâncias de longa duração dos seis agentes. Cada agente é criado uma
+    única vez, na primeira vez em que é pedido, já com suas dependências (o armazenamento
+    de clientes e os outros agentes) injetadas. Os agentes não guardam estado por chamada
+    e leem os dados sempre pelo armazenamento, então podem ser compartilhados entre threads.
+    """
+    def __init__(self, store=None):
+        self.store = store or get_customer_store()
+        self._instances = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name: str, factory):
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    instance = factory()
+                    self._instances[name] = instance
+        return instance
+
+    def override(self, name: str, instance):
+        """Substitui a instância de um agente (ex.: um Concierge com modelo falso nos benchmarks)."""
+        with self._lock:
+            self._instances[name] = instance
+
+    @property
+    def guardian(self) -> GuardianAgent:
+        return self._get("guardian", lambda: GuardianAgent(store=self.store))
+
+    @property
+    def dynamo(self) -> DynamoAgent:
+        return self._get("dynamo", lambda: DynamoAgent(guardian=self.guardian))
+
+    @property
+    def oracle(self) -> OracleAgent:
+        return self._get("oracle", lambda: OracleAgent(store=self.store))
+
+    @property
+    def ambassador(self) -> AmbassadorAgent:
+        return self._get("ambassador", lambda: AmbassadorAgent(oracle=self.oracle, store=self.store))
+
+    @property
+    def gatekeeper(self) -> GatekeeperAgent:
+        return self._get("gatekeeper", lambda: GatekeeperAgent(store=self.store))
+
+    @property
+    def concierge(self):
+        from .agent_concierge import ConciergeAgent
+        return self._get("concierge", ConciergeAgent)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_agent_registry() -> AgentRegistry:
+    """Retorna o registro compartilhado de agentes do processo."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = AgentRegistry()
+    return _registry
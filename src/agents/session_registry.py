@@ -0,0 +1,240 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from ..storage.customer_store import DATA_DIR
+
+# Cliente e sessão usados quando a requisição não informa os seus (a demonstração com a Maria).
+USER_ID = "user_maria_123"
+DEFAULT_SESSION_ID = "default"
+
+DEFAULT_IDLE_TTL_SECONDS = float(os.getenv("AEGIS_SESSION_IDLE_TTL_SECONDS", "1800"))
+DEFAULT_MAX_SESSIONS = int(os.getenv("AEGIS_MAX_SESSIONS", "10000"))
+SESSION_BACKEND = os.getenv("AEGIS_SESSION_BACKEND", "memory")
+SESSION_DB_FILE = os.getenv("AEGIS_SESSION_DB_FILE", os.path.join(DATA_DIR, 'sessions.db'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    turns INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class ConciergeSession:
+    """Estado de uma conversa: o usuário atendido, a memória própria e o executor ligado a ela."""
+    def __init__(self, session_id: str, user_id: str, memory):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.memory = memory
+        self.executor = None
+        self.lock = threading.Lock()
+        self.async_lock = None
+        self.created_at = time.monotonic()
+        self.last_seen = self.created_at
+        self.turns = 0
+        self.revision = 0
+
+
+class InMemorySessionBackend:
+    """
+    Guarda o estado das sessões no próprio processo, serializado como no backend SQLite.
+    Serve para desenvolvimento e testes com um único processo.
+    """
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str, newer_than: int = 0):
+        """Registro da sessão, ou None se ela não existe ou não mudou desde a revisão `newer_than`."""
+        with self._lock:
+            record = self._records.get(session_id)
+            if record is None or record["revision"] <= newer_than:
+                return None
+            return dict(record, state=json.loads(record["state"]))
+
+    def save(self, session_id: str, user_id: str, turns: int, state: dict) -> int:
+        with self._lock:
+            revision = self._records.get(session_id, {}).get("revision", 0) + 1
+            self._records[session_id] = {
+                "user_id": user_id, "turns": turns, "state": json.dumps(state, ensure_ascii=False),
+                "revision": revision, "updated_at": time.time(),
+            }
+            return revision
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._records.pop(session_id, None)
+
+    def purge(self, older_than: float) -> int:
+        with self._lock:
+            expired = [session_id for session_id, record in self._records.items() if record["updated_at"] < older_than]
+            for session_id in expired:
+                del self._records[session_id]
+            return len(expired)
+
+
+class SqliteSessionBackend:
+    """
+    Guarda o estado das sessões num arquivo SQLite compartilhado pelos workers, para que
+    uma conversa continue igual em qualquer processo que receba a próxima mensagem.
+    """
+    def __init__(self, db_file: str = SESSION_DB_FILE):
+        self.db_file = db_file
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self, session_id: str, newer_than: int = 0):
+        """Registro da sessão, ou None se ela não existe ou não mudou desde a revisão `newer_than`."""
+        row = self._connection().execute(
+            "SELECT user_id, turns, state, revision, updated_at FROM sessions WHERE session_id = ? AND revision > ?",
+            (session_id, newer_than),
+        ).fetchone()
+        if row is None:
+            return None
+        user_id, turns, state, revision, updated_at = row
+        return {"user_id": user_id, "turns": turns, "state": json.loads(state), "revision": revision,
+                "updated_at": updated_at}
+
+    def save(self, session_id: str, user_id: str, turns: int, state: dict) -> int:
+        with self._connection() as conn:
+            return conn.execute(
+                """
+                INSERT INTO sessions (session_id, user_id, turns, state, revision, updated_at) VALUES (?, ?, ?, ?, 1, ?)
+                ON CONFLICT (session_id) DO UPDATE SET
+                    user_id = excluded.user_id, turns = excluded.turns, state = excluded.state,
+                    revision = sessions.revision + 1, updated_at = excluded.updated_at
+                RETURNING revision
+                """,
+                (session_id, user_id, turns, json.dumps(state, ensure_ascii=False), time.time()),
+            ).fetchone()[0]
+
+    def delete(self, session_id: str):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def purge(self, older_than: float) -> int:
+        with self._connection() as conn:
+            return conn.execute("DELETE FROM sessions WHERE updated_at < ?", (older_than,)).rowcount
+
+
+def create_session_backend(kind: str = SESSION_BACKEND):
+    """Backend de sessões conforme `AEGIS_SESSION_BACKEND`: "memory" (padrão) ou "sqlite" (vários workers)."""
+    if kind == "sqlite":
+        return SqliteSessionBackend()
+    return InMemorySessionBackend()
+
+
+class SessionRegistry:
+    """
+    Entrega uma sessão por session_id, criando-a sob demanda. Sessões ociosas por mais
+    de `idle_ttl_seconds` são descartadas, e a menos usada sai quando o limite é atingido.
+
+    Com um `backend`, o estado de cada sessão (memória e turnos) é gravado após cada turno
+    por `save`, e uma sessão cuja revisão no backend é mais nova que a local (porque outro
+    worker atendeu a mensagem anterior) é recarregada antes de ser entregue.
+    """
+    def __init__(self, memory_factory, idle_ttl_seconds: float = DEFAULT_IDLE_TTL_SECONDS,
+                 max_sessions: int = DEFAULT_MAX_SESSIONS, backend=None):
+        self.memory_factory = memory_factory
+        self.backend = backend
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def get_or_create(self, session_id: str, user_id: str) -> ConciergeSession:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is not None and session.user_id != user_id:
+                del self._sessions[session_id]
+                session = None
+            if session is None:
+                session = ConciergeSession(session_id, user_id, self.memory_factory())
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_seen = now
+        if self.backend is not None:
+            self._sync(session)
+        return session
+
+    def _sync(self, session: ConciergeSession):
+        record = self.backend.load(session.session_id, newer_than=session.revision)
+        if record is None or record["user_id"] != session.user_id:
+            return
+        if time.time() - record["updated_at"] >= self.idle_ttl_seconds:
+            return
+        from .conversation_memory import restore_memory_state
+        restore_memory_state(session.memory, record["state"])
+        session.turns = record["turns"]
+        session.revision = record["revision"]
+
+    def save(self, session: ConciergeSession):
+        """Grava o estado da sessão no backend; chamado ao fim de cada turno."""
+        if self.backend is not None:
+            from .conversation_memory import dump_memory_state
+            session.revision = self.backend.save(
+                session.session_id, session.user_id, session.turns, dump_memory_state(session.memory)
+            )
+
+    def reset(self, session_id: str):
+        """Descarta a sessão; a próxima mensagem começa uma conversa nova."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self.backend is not None:
+            self.backend.delete(session_id)
+
+    def evict_idle(self) -> int:
+        if self.backend is not None:
+            self.backend.purge(time.time() - self.idle_ttl_seconds)
+        with self._lock:
+            return self._evict_idle(time.monotonic())
+
+    def _evict_idle(self, now: float) -> int:
+        removed = 0
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_seen < self.idle_ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            removed += 1
+        self.evicted += removed
+        return removed
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "evicted": self.evicted,
+                "backend": type(self.backend).__name__ if self.backend is not None else None,
+            }
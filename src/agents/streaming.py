@@ -0,0 +1,66 @@
+import asyncio
+import os
+import queue
+import threading
+
+_DONE = object()
+
+
+class AsyncLoopRunner:
+    """
+    Mantém um único event loop em uma thread de fundo. Todas as conversas em andamento
+    rodam nele como tarefas, então um worker atende várias ao mesmo tempo enquanto as
+    chamadas ao modelo aguardam a rede.
+    """
+    def __init__(self):
+        self.pid = os.getpid()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="aegis-async-loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine, timeout: float = None):
+        """Executa uma corrotina no loop e espera o resultado."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def iterate(self, async_iterable_factory):
+        """
+        Consome um gerador assíncrono criado no loop de fundo e o expõe como iterador
+        síncrono (para respostas em streaming do Flask). Se o consumidor parar no meio,
+        a tarefa no loop é cancelada.
+        """
+        chunks = queue.SimpleQueue()
+
+        async def pump():
+            try:
+                async for chunk in async_iterable_factory():
+                    chunks.put(chunk)
+            except Exception as error:
+                chunks.put(error)
+            finally:
+                chunks.put(_DONE)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item = chunks.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_async_runner() -> AsyncLoopRunner:
+    """Runner do processo; um worker criado por fork não herda a thread do loop, então cria o próprio."""
+    global _runner
+    if _runner is None or _runner.pid != os.getpid():
+        with _runner_lock:
+            if _runner is None or _runner.pid != os.getpid():
+                _runner = AsyncLoopRunner()
+    return _runner
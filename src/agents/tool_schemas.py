@@ -0,0 +1,30 @@
+from typing import Annotated, Optional
+
+from pydantic import Field
+
+# Os esquemas de argumentos das ferramentas são inferidos das assinaturas das funções
+# (`StructuredTool.from_function`); aqui ficam os tipos anotados que elas usam, com a
+# descrição e os limites de cada argumento que vão para o modelo.
+
+# Itens por página nas ferramentas de listagem: o resultado vai inteiro para o prompt.
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+
+NewEmail = Annotated[Optional[str], Field(description="Novo e-mail do cliente, se ele pediu para trocar.")]
+NewAddress = Annotated[Optional[str], Field(description="Novo endereço completo do cliente, se ele pediu para trocar.")]
+
+TransactionId = Annotated[str, Field(description="ID exato da transação, como aparece no histórico (ex.: txn_strange_01).")]
+PaymentMethodId = Annotated[str, Field(description="ID exato do método de pagamento (ex.: cc_1).")]
+
+StartDate = Annotated[Optional[str], Field(description="Só faturas a partir desta data (AAAA-MM-DD), inclusive.")]
+EndDate = Annotated[Optional[str], Field(description="Só faturas até esta data (AAAA-MM-DD), inclusive.")]
+BillingStatus = Annotated[Optional[str], Field(description="Só faturas com este status: success (paga), failed (falhou) ou pending (pendente).")]
+Location = Annotated[Optional[str], Field(description="Só cobranças feitas nesta cidade (ex.: São Paulo).")]
+MinAmount = Annotated[Optional[float], Field(description="Valor mínimo em R$.")]
+MaxAmount = Annotated[Optional[float], Field(description="Valor máximo em R$.")]
+BillingPageSize = Annotated[int, Field(ge=1, le=MAX_PAGE_SIZE, description="Quantidade de faturas por página.")]
+BillingCursor = Annotated[Optional[str], Field(description="O next_cursor devolvido pela página anterior, para ver as faturas seguintes (mais antigas).")]
+
+PaymentType = Annotated[Optional[str], Field(description="Só métodos deste tipo: credit_card ou pix.")]
+PaymentMethodsPageSize = Annotated[int, Field(ge=1, le=MAX_PAGE_SIZE, description="Quantidade de métodos por página.")]
+PaymentMethodsCursor = Annotated[Optional[str], Field(description="O next_cursor devolvido pela página anterior.")]
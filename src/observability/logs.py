@@ -0,0 +1,59 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+LOG_LEVEL = os.getenv("AEGIS_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+_listeners = []
+_configure_lock = threading.Lock()
+
+
+def start_queue_listener(logger: logging.Logger, *handlers):
+    """
+    Liga `logger` a `handlers` por uma fila: quem loga só enfileira o registro, e a escrita
+    (terminal, arquivo) acontece numa thread de fundo, fora do caminho da requisição.
+    """
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return listener
+
+
+def _configure():
+    logger = logging.getLogger("aegis")
+    if logger.handlers:
+        return
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    start_queue_listener(logger, handler)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger da hierarquia "aegis" (ex.: get_logger("guardian") → "aegis.guardian"), com nível em `AEGIS_LOG_LEVEL`."""
+    with _configure_lock:
+        _configure()
+    return logging.getLogger(f"aegis.{name}")
+
+
+def _restart_listeners_in_child():
+    # Processos criados por fork (ex.: o pool do Oracle) herdam as filas, mas não as threads que as esvaziam.
+    for listener in _listeners:
+        listener._thread = None
+        listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_listeners_in_child)
+
+
+@atexit.register
+def _flush_logs():
+    while _listeners:
+        _listeners.pop().stop()
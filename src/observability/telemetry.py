@@ -0,0 +1,163 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .logs import start_queue_listener
+
+TRACE_FILE = os.getenv("AEGIS_TRACE_FILE")
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current_span = ContextVar("aegis_current_span", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{key}="{str(value)}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Telemetry:
+    """
+    Métricas e rastreamento do processo. `span()` mede a duração de um trecho (requisição,
+    ferramenta, agente, chamada ao modelo) e a registra num histograma; `observe()` e
+    `increment()` registram valores avulsos, como tempo de banco e tokens. Tudo é exportado
+    no formato texto do Prometheus por `render_prometheus()` e, com `AEGIS_TRACE_FILE`
+    definido, cada span também vira uma linha JSON nesse arquivo, gravada em segundo plano.
+    """
+    def __init__(self, trace_file: str = TRACE_FILE):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._trace_logger = None
+        if trace_file:
+            self._trace_logger = logging.getLogger("aegis.trace")
+            self._trace_logger.setLevel(logging.INFO)
+            self._trace_logger.propagate = False
+            if not self._trace_logger.handlers:
+                handler = logging.FileHandler(trace_file, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                start_queue_listener(self._trace_logger, handler)
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Mede o bloco como um span. Os atributos vão para o log de trace; o que for
+        acrescentado ao dicionário devolvido durante o bloco também.
+        """
+        span = self._new_span(name, attributes)
+        token = _current_span.set(span)
+        started_at = time.perf_counter()
+        status = "ok"
+        try:
+            yield span["attributes"]
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span, time.perf_counter() - started_at, status)
+
+    def record_span(self, name: str, duration_seconds: float, status: str = "ok", **attributes):
+        """Registra um span já medido por fora (ex.: callbacks do LangChain, respostas em streaming)."""
+        self._finish(self._new_span(name, attributes), duration_seconds, status)
+
+    @staticmethod
+    def _new_span(name: str, attributes: dict) -> dict:
+        parent = _current_span.get()
+        return {
+            "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent["span_id"] if parent else None,
+            "name": name,
+            "attributes": attributes,
+        }
+
+    def _finish(self, span: dict, elapsed: float, status: str):
+        self.observe("aegis_span_duration_seconds", elapsed, span=span["name"])
+        if status != "ok":
+            self.increment("aegis_span_errors_total", span=span["name"])
+        if self._trace_logger is not None:
+            span.update(status=status, duration_ms=round(elapsed * 1000, 3), start=time.time() - elapsed)
+            self._trace_logger.info(json.dumps(span, ensure_ascii=False, default=str))
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        lines = []
+        last_name = None
+        for (name, labels), histogram in histograms:
+            if name != last_name:
+                lines.append(f"# TYPE {name} histogram")
+                last_name = name
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                cumulative += count
+                bucket_label = 'le="%s"' % bound
+                lines.append(f"{name}_bucket{_format_labels(labels, bucket_label)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            if name != last_name:
+                lines.append(f"# TYPE {name} counter")
+                last_name = name
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry() -> Telemetry:
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                _telemetry = Telemetry()
+    return _telemetry
+
+
+def traced(name: str):
+    """Decorador que mede cada chamada da função como um span `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_telemetry().span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,32 @@
+import json
+
+# Colunas do índice de transações (`billing_transactions`): uma linha por item do
+# `billing_history`, na mesma posição do array, com os campos usados nos filtros e a
+# transação completa em `payload`.
+TRANSACTION_COLUMNS = ("user_id", "position", "transaction_id", "date", "amount_brl", "status", "location", "payload")
+
+# Campos das transações devolvidos às ferramentas do Concierge (o que vai para o prompt).
+TRANSACTION_SUMMARY_FIELDS = ("transaction_id", "date", "description", "amount_brl", "status", "location")
+
+
+def transaction_row(user_id: str, position: int, transaction: dict) -> tuple:
+    return (
+        user_id,
+        position,
+        transaction.get("transaction_id"),
+        transaction.get("date"),
+        transaction.get("amount_brl"),
+        transaction.get("status"),
+        transaction.get("location"),
+        json.dumps(transaction, ensure_ascii=False),
+    )
+
+
+def transaction_rows(user_id: str, profile: dict) -> list:
+    """Linhas do índice para todo o histórico do perfil."""
+    return [transaction_row(user_id, position, transaction)
+            for position, transaction in enumerate(profile.get("billing_history", []))]
+
+
+def summarize_transaction(transaction: dict) -> dict:
+    return {field: transaction[field] for field in TRANSACTION_SUMMARY_FIELDS if field in transaction}
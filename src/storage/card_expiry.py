@@ -0,0 +1,25 @@
+from datetime import date, timedelta
+
+
+def effective_expiry(expiry_date: str) -> date:
+    """
+    Primeiro dia após o mês de validade ("AAAA-MM"): a partir dele o cartão está vencido.
+    Levanta ValueError se a data não estiver nesse formato.
+    """
+    year, month = map(int, expiry_date.split('-'))
+    return (date(year, month, 1) + timedelta(days=32)).replace(day=1)
+
+
+def card_rows(user_id: str, profile: dict) -> list:
+    """Linhas do índice de validade para os cartões de crédito do perfil (datas inválidas ficam de fora)."""
+    rows = []
+    for index, pm in enumerate(profile.get("payment_methods", [])):
+        if pm.get("type") != "credit_card" or not pm.get("expiry_date"):
+            continue
+        try:
+            expires_on = effective_expiry(pm["expiry_date"])
+        except ValueError:
+            continue
+        rows.append((user_id, pm.get("id") or f"#{index}", pm.get("brand"), pm.get("last4"), pm["expiry_date"],
+                     expires_on.isoformat()))
+    return rows
@@ -0,0 +1,578 @@
+import argparse
+import copy
+import json
+import math
+import mmap
+import os
+import sys
+import threading
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import compress
+
+# Arquivo colunar do `billing_history` e do `behavioral_data.login_locations`: uma pasta com
+# um arquivo por coluna (arrays tipados, lidos por mmap sem cópia), dicionários para as
+# strings repetidas e um `meta.json` com a quantidade de linhas confirmadas. Uma escrita
+# acrescenta ao fim dos arquivos e só então regrava o `meta.json`: o que passa da contagem
+# confirmada (uma escrita interrompida) é ignorado na leitura e descartado na escrita seguinte.
+# Um único processo escreve por vez; qualquer número de processos pode ler.
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+
+# Dicionários compartilhados entre as tabelas: o código de uma cidade é o mesmo em
+# `transactions.location` e `logins.city`. O código 0 significa "campo ausente".
+DICTIONARIES = ("users", "descriptions", "statuses", "places")
+
+# (campo, tipo, dicionário). Tipos: código de array, "text" (offsets + bytes UTF-8) ou
+# "timestamp" (microssegundos desde 1970 + código do formato original da data).
+TABLES = {
+    "transactions": (
+        ("user_id", "I", "users"),
+        ("transaction_id", "text", None),
+        ("date", "timestamp", None),
+        ("amount_brl", "d", None),
+        ("description", "I", "descriptions"),
+        ("status", "I", "statuses"),
+        ("location", "I", "places"),
+        ("time_on_page_seconds", "i", None),
+        ("extras", "text", None),
+    ),
+    "logins": (
+        ("user_id", "I", "users"),
+        ("city", "I", "places"),
+        ("date", "timestamp", None),
+        ("extras", "text", None),
+    ),
+}
+
+# Formatos de data aceitos na coluna de timestamp, por código: (precisão do `isoformat`, sufixo).
+# A data é guardada só se, reformatada, reproduzir exatamente a string original; qualquer
+# outra (com fuso, por exemplo) vai para `extras`.
+TIMESTAMP_FORMATS = ((None, ""), ("seconds", ""), ("microseconds", ""), ("seconds", "Z"), ("microseconds", "Z"))
+_FORMAT_BY_LENGTH = {10: 1, 19: 2, 26: 3, 20: 4, 27: 5}
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Campos com coluna própria; os demais (inclusive `user_id` e `extras`, se vierem no item) vão para `extras`.
+_TYPED_FIELDS = {table: {field for field, _, _ in schema} - {"user_id", "extras"} for table, schema in TABLES.items()}
+
+MISSING_INT = -2 ** 31
+MISSING_TIMESTAMP = -2 ** 63
+
+
+def _column_files(table: str, field: str, kind: str) -> dict:
+    """Arquivos de uma coluna, por papel, com o código de tipo de cada um."""
+    base = f"{table}.{field}"
+    if kind == "text":
+        return {"offsets": (f"{base}.offsets", "Q"), "data": (f"{base}.data", "B")}
+    if kind == "timestamp":
+        return {"values": (f"{base}.values", "q"), "format": (f"{base}.format", "B")}
+    return {"values": (f"{base}.values", kind)}
+
+
+def _render_timestamp(moment: datetime, code: int) -> str:
+    timespec, suffix = TIMESTAMP_FORMATS[code - 1]
+    return (moment.isoformat(timespec=timespec) if timespec else moment.date().isoformat()) + suffix
+
+
+def encode_timestamp(value):
+    """(microssegundos desde 1970, código do formato) da data, ou None se ela não couber na coluna."""
+    if not isinstance(value, str):
+        return None
+    code = _FORMAT_BY_LENGTH.get(len(value))
+    if code is None or value.endswith("Z") != (code >= 4):
+        return None
+    try:
+        moment = datetime.fromisoformat(value[:-1] if code >= 4 else value)
+    except ValueError:
+        return None
+    if moment.tzinfo is not None or _render_timestamp(moment, code) != value:
+        return None
+    return (moment - _EPOCH) // _MICROSECOND, code
+
+
+def decode_timestamp(micros: int, code: int) -> str:
+    return _render_timestamp(_EPOCH + timedelta(microseconds=micros), code)
+
+
+class ColumnarHistory:
+    """
+    Histórico de transações e logins em formato colunar, para análises e pontuação em lote
+    que percorrem milhões de linhas sem montar os perfis em Python. As colunas numéricas e
+    os códigos dos dicionários são devolvidos como `memoryview` sobre o mmap dos arquivos.
+
+    Os campos fora do esquema (ou com valores que não cabem na coluna tipada) são guardados
+    em JSON na coluna `extras`, então `export_profiles` devolve exatamente o que foi gravado.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._meta = self._read_meta()
+        self._dictionaries = {name: self._read_dictionary(name) for name in DICTIONARIES}
+        self._codes = {name: {value: code for code, value in enumerate(values) if code}
+                       for name, values in self._dictionaries.items()}
+        self._maps = []
+        self._views = {}
+
+    # --- arquivos -------------------------------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self._path(META_FILE), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return {
+                "format_version": FORMAT_VERSION,
+                "byteorder": sys.byteorder,
+                "rows": {table: 0 for table in TABLES},
+                "text_bytes": {},
+                "dictionaries": {name: 1 for name in DICTIONARIES},
+                "dictionary_bytes": {name: 0 for name in DICTIONARIES},
+            }
+        if meta.get("format_version") != FORMAT_VERSION or meta.get("byteorder") != sys.byteorder:
+            raise ValueError(f"Arquivo colunar em '{self.directory}' incompatível com esta versão ou plataforma.")
+        return meta
+
+    def _write_meta(self):
+        temporary = self._path(META_FILE + ".tmp")
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self._meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self._path(META_FILE))
+
+    def _read_dictionary(self, name: str) -> list:
+        """Valores do dicionário até a contagem confirmada; a posição na lista é o código."""
+        values = [None]
+        size = self._meta["dictionaries"][name]
+        try:
+            with open(self._path(f"{name}.dict"), 'r', encoding='utf-8') as f:
+                for line in f:
+                    if len(values) == size:
+                        break
+                    values.append(json.loads(line))
+        except FileNotFoundError:
+            pass
+        return values
+
+    def _committed_lengths(self) -> dict:
+        """Tamanho confirmado, em bytes, de cada arquivo de coluna e de dicionário."""
+        lengths = {}
+        for table, schema in TABLES.items():
+            rows = self._meta["rows"][table]
+            for field, kind, _ in schema:
+                for role, (file_name, typecode) in _column_files(table, field, kind).items():
+                    if role == "data":
+                        lengths[file_name] = self._meta["text_bytes"].get(f"{table}.{field}", 0)
+                    else:
+                        lengths[file_name] = rows * array(typecode).itemsize
+        for name in DICTIONARIES:
+            lengths[f"{name}.dict"] = self._meta["dictionary_bytes"][name]
+        return lengths
+
+    def _truncate_uncommitted(self):
+        """Descarta o que uma escrita interrompida deixou depois da parte confirmada."""
+        for file_name, length in self._committed_lengths().items():
+            path = self._path(file_name)
+            if os.path.exists(path) and os.path.getsize(path) > length:
+                os.truncate(path, length)
+
+    # --- escrita --------------------------------------------------------------------------
+
+    def _encode(self, name: str, value, pending: dict) -> int:
+        """Código de `value`; um valor novo fica em `pending` até a escrita ser confirmada."""
+        if value is None:
+            return 0
+        code = self._codes[name].get(value)
+        if code is None:
+            code = pending[name].get(value)
+            if code is None:
+                code = pending[name][value] = len(self._dictionaries[name]) + len(pending[name])
+        return code
+
+    def _encode_row(self, table: str, user_code: int, item: dict, buffers: dict, pending: dict):
+        extras = {}
+        for field, kind, dictionary in TABLES[table]:
+            if field == "extras":
+                continue
+            value = user_code if field == "user_id" else item.get(field)
+            present = field == "user_id" or field in item
+            if kind == "text":
+                if not isinstance(value, str) or not value:
+                    if present:
+                        extras[field] = value
+                    value = ""
+                buffers[field].append(value.encode('utf-8'))
+            elif kind == "timestamp":
+                encoded = encode_timestamp(value)
+                if encoded is None:
+                    if present:
+                        extras[field] = value
+                    encoded = (MISSING_TIMESTAMP, 0)
+                buffers[field][0].append(encoded[0])
+                buffers[field][1].append(encoded[1])
+            elif dictionary and field != "user_id":
+                if value is not None and not isinstance(value, str):
+                    extras[field] = value
+                    value = None
+                elif value is None and present:
+                    extras[field] = None
+                buffers[field].append(self._encode(dictionary, value, pending))
+            elif kind == "d":
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and not math.isnan(value):
+                    buffers[field].append(value)
+                else:
+                    if present:
+                        extras[field] = value
+                    buffers[field].append(math.nan)
+            elif kind == "i":
+                if type(value) is int and MISSING_INT < value < 2 ** 31:
+                    buffers[field].append(value)
+                else:
+                    if present:
+                        extras[field] = value
+                    buffers[field].append(MISSING_INT)
+            else:
+                buffers[field].append(value)
+        for key, value in item.items():
+            if key not in _TYPED_FIELDS[table]:
+                extras[key] = value
+        buffers["extras"].append(json.dumps(extras, ensure_ascii=False).encode('utf-8') if extras else b"")
+
+    @staticmethod
+    def _empty_buffers(table: str) -> dict:
+        buffers = {}
+        for field, kind, _ in TABLES[table]:
+            if kind == "text":
+                buffers[field] = []
+            elif kind == "timestamp":
+                buffers[field] = (array("q"), array("B"))
+            else:
+                buffers[field] = array(kind)
+        return buffers
+
+    def _flush(self, table: str, buffers: dict):
+        for field, kind, _ in TABLES[table]:
+            files = _column_files(table, field, kind)
+            if kind == "text":
+                key = f"{table}.{field}"
+                end = self._meta["text_bytes"].get(key, 0)
+                offsets = array("Q")
+                for chunk in buffers[field]:
+                    end += len(chunk)
+                    offsets.append(end)
+                with open(self._path(files["data"][0]), 'ab') as f:
+                    f.write(b"".join(buffers[field]))
+                with open(self._path(files["offsets"][0]), 'ab') as f:
+                    offsets.tofile(f)
+                self._meta["text_bytes"][key] = end
+            elif kind == "timestamp":
+                with open(self._path(files["values"][0]), 'ab') as f:
+                    buffers[field][0].tofile(f)
+                with open(self._path(files["format"][0]), 'ab') as f:
+                    buffers[field][1].tofile(f)
+            else:
+                with open(self._path(files["values"][0]), 'ab') as f:
+                    buffers[field].tofile(f)
+
+    def append_profiles(self, profiles, batch_size: int = 5000) -> int:
+        """
+        Acrescenta o histórico de pares (user_id, perfil) ou de um dict `{user_id: perfil}`,
+        confirmando a cada `batch_size` perfis. Retorna a quantidade de perfis gravados.
+        """
+        items = profiles.items() if isinstance(profiles, dict) else profiles
+        written = 0
+        batch = []
+        for user_id, profile in items:
+            batch.append((user_id, profile.get("billing_history", []),
+                          profile.get("behavioral_data", {}).get("login_locations", [])))
+            if len(batch) >= batch_size:
+                self.append_many(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            self.append_many(batch)
+            written += len(batch)
+        return written
+
+    def append(self, user_id: str, transactions=(), logins=()):
+        """Acrescenta transações e logins de um usuário (ex. a cada `append_transaction` da base)."""
+        self.append_many([(user_id, transactions, logins)])
+
+    def append_many(self, entries):
+        """
+        Acrescenta triplas (user_id, transações, logins) numa única confirmação. Se a escrita
+        falhar (ex.: um campo extra que não é JSON), nada dela vale: os valores novos dos
+        dicionários só entram em memória depois que o `meta.json` for regravado.
+        """
+        with self._lock:
+            self._truncate_uncommitted()
+            committed_meta = copy.deepcopy(self._meta)
+            pending = {name: {} for name in DICTIONARIES}
+            try:
+                buffers = {table: self._empty_buffers(table) for table in TABLES}
+                for user_id, transactions, logins in entries:
+                    user_code = self._encode("users", user_id, pending)
+                    for transaction in transactions:
+                        self._encode_row("transactions", user_code, transaction, buffers["transactions"], pending)
+                    for login in logins:
+                        self._encode_row("logins", user_code, login, buffers["logins"], pending)
+                for name, values in pending.items():
+                    if values:
+                        data = "".join(json.dumps(value, ensure_ascii=False) + "\n" for value in values).encode('utf-8')
+                        with open(self._path(f"{name}.dict"), 'ab') as f:
+                            f.write(data)
+                        self._meta["dictionary_bytes"][name] += len(data)
+                for table in TABLES:
+                    self._flush(table, buffers[table])
+                    self._meta["rows"][table] += len(buffers[table]["extras"])
+                for name in DICTIONARIES:
+                    self._meta["dictionaries"][name] = len(self._dictionaries[name]) + len(pending[name])
+                self._write_meta()
+            except BaseException:
+                # O que chegou aos arquivos passa da contagem confirmada e é descartado na próxima escrita.
+                self._meta = committed_meta
+                raise
+            for name, values in pending.items():
+                self._dictionaries[name].extend(values)
+                self._codes[name].update(values)
+            self._invalidate_views()
+
+    # --- leitura --------------------------------------------------------------------------
+
+    def rows(self, table: str) -> int:
+        return self._meta["rows"][table]
+
+    def dictionary(self, name: str) -> list:
+        """Valores do dicionário; a posição é o código (0 é "ausente")."""
+        return self._dictionaries[name]
+
+    def code(self, name: str, value) -> int:
+        """Código de `value` no dicionário, ou 0 se ele nunca foi gravado."""
+        return self._codes[name].get(value, 0)
+
+    def _invalidate_views(self):
+        """
+        Descarta as visões, que não enxergam as linhas acrescentadas, e fecha os mapeamentos
+        antigos. Um mapeamento de uma coluna que alguém ainda usa fica para a próxima vez.
+        """
+        self._views = {}
+        in_use = []
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                in_use.append(mapped)
+        self._maps = in_use
+
+    def _map(self, file_name: str, typecode: str, length: int) -> memoryview:
+        if length == 0:
+            return memoryview(array(typecode))
+        with open(self._path(file_name), 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped)[:length].cast(typecode)
+
+    def _view(self, table: str, field: str, role: str = "values") -> memoryview:
+        key = (table, field, role)
+        view = self._views.get(key)
+        if view is None:
+            kind = next(kind for name, kind, _ in TABLES[table] if name == field)
+            file_name, typecode = _column_files(table, field, kind)[role]
+            if role == "data":
+                length = self._meta["text_bytes"].get(f"{table}.{field}", 0)
+            else:
+                length = self.rows(table) * array(typecode).itemsize
+            view = self._views[key] = self._map(file_name, typecode, length)
+        return view
+
+    def column(self, table: str, field: str) -> memoryview:
+        """
+        Coluna tipada, sem cópia: valores (`amount_brl`, `time_on_page_seconds`), códigos de
+        dicionário (`user_id`, `status`, `location`...) ou microssegundos (`date`). Valores
+        ausentes são NaN, MISSING_INT, 0 e MISSING_TIMESTAMP, respectivamente.
+        """
+        return self._view(table, field)
+
+    def _text_reader(self, table: str, field: str):
+        offsets = self._view(table, field, "offsets")
+        data = self._view(table, field, "data")
+
+        def read(row):
+            start = offsets[row - 1] if row else 0
+            return str(data[start:offsets[row]], 'utf-8')
+        return read
+
+    def text(self, table: str, field: str, row: int) -> str:
+        return self._text_reader(table, field)(row)
+
+    def _field_reader(self, table: str, field: str, kind: str, dictionary: str):
+        """Função que lê o campo de uma linha, devolvendo None quando ele está ausente."""
+        if kind == "text":
+            read_text = self._text_reader(table, field)
+            return lambda row: read_text(row) or None
+        if kind == "timestamp":
+            values, formats = self._view(table, field), self._view(table, field, "format")
+            return lambda row: decode_timestamp(values[row], formats[row]) if formats[row] else None
+        values = self._view(table, field)
+        if dictionary:
+            names = self._dictionaries[dictionary]
+            return lambda row: names[values[row]]
+        if kind == "d":
+            return lambda row: values[row] if values[row] == values[row] else None
+        return lambda row: values[row] if values[row] != MISSING_INT else None
+
+    def _row_decoder(self, table: str, fields=None):
+        """Função que monta o item (dict) de uma linha com os campos pedidos (todos se None)."""
+        readers = [
+            (field, self._field_reader(table, field, kind, dictionary))
+            for field, kind, dictionary in TABLES[table]
+            if field not in ("user_id", "extras") and (fields is None or field in fields)
+        ]
+        read_extras = self._text_reader(table, "extras")
+
+        def decode(row):
+            item = {}
+            for field, read in readers:
+                value = read(row)
+                if value is not None:
+                    item[field] = value
+            extras = read_extras(row)
+            if extras:
+                extras = json.loads(extras)
+                item.update(extras if fields is None else {key: extras[key] for key in fields if key in extras})
+            return item
+        return decode
+
+    def _user_rows(self, table: str, user_ids) -> list:
+        """Linhas da tabela, em ordem, dos usuários informados (todas se None)."""
+        users = self.column(table, "user_id")
+        if user_ids is None:
+            return range(len(users))
+        codes = {self.code("users", user_id) for user_id in user_ids} - {0}
+        return list(compress(range(len(users)), map(codes.__contains__, users)))
+
+    def iter_rows(self, table: str, user_ids=None, fields=None):
+        """
+        Percorre (user_id, item) da tabela, em ordem de gravação. Com `fields`, monta só esses
+        campos, o suficiente para pontuar transações em lote.
+        """
+        users = self.column(table, "user_id")
+        names = self._dictionaries["users"]
+        decode = self._row_decoder(table, fields)
+        for row in self._user_rows(table, user_ids):
+            yield names[users[row]], decode(row)
+
+    def transaction_stats(self, user_ids=None) -> dict:
+        """
+        Por usuário, direto das colunas: quantidade de transações, valor médio e quantidade
+        de pagamentos com falha (o que o Guardian e o Oracle leem da tabela de atributos).
+        """
+        users = self.column("transactions", "user_id")
+        amounts = self.column("transactions", "amount_brl")
+        rows = self._user_rows("transactions", user_ids)
+        if user_ids is not None:
+            users = [users[row] for row in rows]
+            amounts = [amounts[row] for row in rows]
+            statuses = [self.column("transactions", "status")[row] for row in rows]
+        else:
+            statuses = self.column("transactions", "status")
+        counts = Counter(users)
+        failed = Counter(compress(users, map(self.code("statuses", "failed").__eq__, statuses)))
+        totals = [0.0] * len(self._dictionaries["users"])
+        valued = [0] * len(totals)
+        for user, amount in zip(users, amounts):
+            if amount == amount:
+                totals[user] += amount
+                valued[user] += 1
+        names = self._dictionaries["users"]
+        return {
+            names[user]: {
+                "tx_count": count,
+                "amount_mean": totals[user] / valued[user] if valued[user] else 0.0,
+                "failed_count": failed.get(user, 0),
+            }
+            for user, count in counts.items()
+        }
+
+    def export_profiles(self, user_ids=None) -> dict:
+        """
+        Exporta no formato dos perfis: `{user_id: {"billing_history": [...], "behavioral_data":
+        {"login_locations": [...]}}}`, para as ferramentas que trabalham com o JSON.
+        """
+        profiles = {}
+        for user_id, transaction in self.iter_rows("transactions", user_ids):
+            profiles.setdefault(user_id, {"billing_history": [], "behavioral_data": {"login_locations": []}})
+            profiles[user_id]["billing_history"].append(transaction)
+        for user_id, login in self.iter_rows("logins", user_ids):
+            profiles.setdefault(user_id, {"billing_history": [], "behavioral_data": {"login_locations": []}})
+            profiles[user_id]["behavioral_data"]["login_locations"].append(login)
+        return profiles
+
+    def export_json(self, json_file: str = None, user_ids=None) -> dict:
+        data = self.export_profiles(user_ids)
+        if json_file:
+            with open(json_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+        return data
+
+    def size_bytes(self) -> int:
+        return sum(os.path.getsize(self._path(name)) for name in os.listdir(self.directory))
+
+    def close(self):
+        """Libera os mapeamentos; os que ainda têm `memoryview` em uso são liberados pelo coletor."""
+        for view in self._views.values():
+            view.release()
+        self._views = {}
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                pass
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_from_store(store, directory: str, batch_size: int = 5000) -> ColumnarHistory:
+    """Gera o arquivo colunar a partir da base de clientes, substituindo o que houver em `directory`."""
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name == META_FILE or name.endswith((".dict", ".values", ".format", ".offsets", ".data", ".tmp")):
+                os.remove(os.path.join(directory, name))
+    history = ColumnarHistory(directory)
+    history.append_profiles(store.iter_profiles(batch_size=500), batch_size=batch_size)
+    return history
+
+
+if __name__ == "__main__":
+    from .customer_store import DB_FILE, get_customer_store
+
+    parser = argparse.ArgumentParser(description="Arquivo colunar do histórico de transações e logins.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Gera o arquivo a partir da base SQLite de clientes.")
+    build.add_argument("directory")
+    build.add_argument("--db", default=DB_FILE)
+    export = commands.add_parser("export", help="Exporta o arquivo para JSON no formato dos perfis.")
+    export.add_argument("directory")
+    export.add_argument("json_file")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        with build_from_store(get_customer_store(args.db), args.directory) as history:
+            print(f"✅ {history.rows('transactions')} transação(ões) e {history.rows('logins')} login(s) gravados "
+                  f"em '{args.directory}' ({history.size_bytes()} bytes).")
+    else:
+        with ColumnarHistory(args.directory) as history:
+            data = history.export_json(args.json_file)
+        print(f"✅ Histórico de {len(data)} usuário(s) exportado para '{args.json_file}'.")
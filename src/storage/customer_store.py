@@ -0,0 +1,739 @@
+import functools
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from .billing_index import TRANSACTION_COLUMNS, transaction_row, transaction_rows
+from .card_expiry import card_rows
+from .profile_cache import ProfileCache
+from .user_features import (
+    FEATURE_COLUMNS, apply_login, apply_transaction, features_from_profile, features_from_row, features_to_row,
+    touch_activity,
+)
+from ..observability.telemetry import get_telemetry
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, '..', 'data')
+SEED_FILE = os.path.join(DATA_DIR, 'customer_profile.json')
+DB_FILE = os.getenv("AEGIS_DB_FILE", os.path.join(DATA_DIR, 'customers.db'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS customers (
+    user_id TEXT PRIMARY KEY,
+    profile TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at TEXT NOT NULL
+)
+"""
+
+_FEATURES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS customer_features (
+    user_id TEXT PRIMARY KEY,
+    tx_count INTEGER NOT NULL,
+    amount_mean REAL NOT NULL,
+    amount_m2 REAL NOT NULL,
+    failed_count INTEGER NOT NULL,
+    last_activity_date TEXT,
+    last_login_city TEXT,
+    signup_date TEXT,
+    locations TEXT NOT NULL
+)
+"""
+_FEATURE_SELECT = f"SELECT user_id, {', '.join(FEATURE_COLUMNS)}, locations FROM customer_features"
+_FEATURE_UPSERT = (
+    f"INSERT OR REPLACE INTO customer_features (user_id, {', '.join(FEATURE_COLUMNS)}, locations) "
+    f"VALUES ({', '.join('?' * (len(FEATURE_COLUMNS) + 2))})"
+)
+
+# Índice de validade dos cartões de crédito: `expires_on` é o primeiro dia em que o cartão
+# já está vencido (ver card_expiry.effective_expiry).
+_CARD_EXPIRY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS card_expiry (
+    user_id TEXT NOT NULL,
+    payment_method_id TEXT NOT NULL,
+    brand TEXT,
+    last4 TEXT,
+    expiry_date TEXT NOT NULL,
+    expires_on TEXT NOT NULL,
+    PRIMARY KEY (user_id, payment_method_id)
+)
+"""
+_CARD_EXPIRY_INDEX = "CREATE INDEX IF NOT EXISTS card_expiry_expires_on ON card_expiry (expires_on)"
+_CARD_COLUMNS = ("user_id", "payment_method_id", "brand", "last4", "expiry_date", "expires_on")
+
+# Índice do `billing_history`: consultas filtradas e paginadas e busca por `transaction_id`
+# sem ler o perfil inteiro. A paginação segue `position` (a ordem do histórico).
+_TRANSACTIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS billing_transactions (
+    user_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    transaction_id TEXT,
+    date TEXT,
+    amount_brl REAL,
+    status TEXT,
+    location TEXT,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (user_id, position)
+) WITHOUT ROWID
+"""
+_TRANSACTIONS_ID_INDEX = (
+    "CREATE INDEX IF NOT EXISTS billing_transactions_id ON billing_transactions (user_id, transaction_id)"
+)
+_TRANSACTION_INSERT = (
+    f"INSERT OR REPLACE INTO billing_transactions ({', '.join(TRANSACTION_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(TRANSACTION_COLUMNS))})"
+)
+
+# Campos do perfil dos quais as tabelas derivadas (atributos e validade dos cartões) dependem.
+_DERIVED_SOURCE_FIELDS = ("billing_history", "behavioral_data", "personal_info", "payment_methods")
+
+# Objetos de primeiro nível que `patch_many` pode mesclar. O nome vai para o caminho JSON da
+# consulta, então só entram campos conhecidos (e nenhum do qual as tabelas derivadas dependem).
+PATCHABLE_FIELDS = ("aegis_scores", "proactive_alert", "retention")
+
+
+def _timed(operation: str):
+    """Registra a duração de cada chamada em `aegis_db_seconds{operation, method}`."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                get_telemetry().observe("aegis_db_seconds", time.perf_counter() - started_at,
+                                        operation=operation, method=method.__name__)
+        return wrapper
+    return decorator
+
+
+class CustomerNotFoundError(KeyError):
+    """Levantada quando uma atualização é pedida para um user_id inexistente."""
+
+
+class CustomerStore:
+    """
+    Camada única de armazenamento dos perfis de clientes, compartilhada por todos os agentes.
+    Cada perfil é um registro indexado por user_id (SQLite), então leituras e escritas
+    custam o mesmo independentemente do tamanho da base, e uma escrita só afeta o próprio registro.
+    As leituras passam por um cache em memória que é invalidado a cada escrita.
+    Junto de cada perfil é mantida uma linha de atributos derivados (`customer_features`:
+    média e desvio dos valores, cidades, falhas de pagamento, última atividade), atualizada
+    na mesma transação de cada escrita, para que os agentes não precisem varrer o histórico;
+    o mesmo vale para os índices de validade dos cartões e de transações.
+    """
+    def __init__(self, db_file: str = DB_FILE, seed_file: str = SEED_FILE, cache: ProfileCache = None):
+        self.db_file = db_file
+        self.cache = cache if cache is not None else ProfileCache()
+        self._local = threading.local()
+        is_new = not os.path.exists(db_file)
+        with self._transaction() as conn:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            conn.execute(_SCHEMA)
+            conn.execute(_FEATURES_SCHEMA)
+            conn.execute(_CARD_EXPIRY_SCHEMA)
+            conn.execute(_CARD_EXPIRY_INDEX)
+            conn.execute(_TRANSACTIONS_SCHEMA)
+            conn.execute(_TRANSACTIONS_ID_INDEX)
+        if is_new:
+            # Base nova: a carga inicial já gravou as tabelas derivadas junto de cada perfil.
+            if seed_file and os.path.exists(seed_file):
+                self.import_json(seed_file)
+        else:
+            # Uma tabela derivada nova precisa ser preenchida para todos os perfis já gravados.
+            self._backfill_derived(everyone=not {"card_expiry", "billing_transactions"} <= tables)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.data_version = None
+        return conn
+
+    def _check_external_writes(self, conn):
+        """
+        `PRAGMA data_version` muda quando outra conexão (outra thread ou outro processo, como
+        os workers do gunicorn) grava na base. Nesse caso o cache deste processo pode estar
+        desatualizado, e as entradas passam a ser conferidas pela versão antes do uso.
+        """
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._local.data_version:
+            self._local.data_version = data_version
+            self.cache.mark_stale()
+
+    def _cached(self, conn, user_ids) -> dict:
+        """Perfis do cache ainda válidos, como {user_id: json}; as entradas a confirmar são checadas numa só consulta."""
+        self._check_external_writes(conn)
+        found = {}
+        unconfirmed = {}
+        for user_id in user_ids:
+            entry = self.cache.get(user_id)
+            if entry is None:
+                continue
+            raw, version, confirmed = entry
+            if confirmed:
+                found[user_id] = raw
+            else:
+                unconfirmed[user_id] = raw
+        unconfirmed_ids = list(unconfirmed)
+        for start in range(0, len(unconfirmed_ids), 500):
+            chunk = unconfirmed_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            current = dict(conn.execute(
+                f"SELECT user_id, version FROM customers WHERE user_id IN ({placeholders})", chunk
+            ).fetchall())
+            for user_id in chunk:
+                if self.cache.confirm(user_id, current.get(user_id, -1)):
+                    found[user_id] = unconfirmed[user_id]
+        return found
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _dumps(profile: dict) -> str:
+        return json.dumps(profile, ensure_ascii=False)
+
+    @staticmethod
+    def _save_derived(conn, profiles):
+        """
+        Recalcula e grava os atributos, o índice de validade dos cartões e o índice de transações
+        de `(user_id, perfil)`; chamado dentro da transação da escrita.
+        """
+        profiles = list(profiles)
+        conn.executemany(
+            _FEATURE_UPSERT, [features_to_row(user_id, features_from_profile(profile)) for user_id, profile in profiles]
+        )
+        conn.executemany("DELETE FROM card_expiry WHERE user_id = ?", [(user_id,) for user_id, _ in profiles])
+        conn.executemany(
+            f"INSERT OR REPLACE INTO card_expiry ({', '.join(_CARD_COLUMNS)}) VALUES ({', '.join('?' * len(_CARD_COLUMNS))})",
+            [row for user_id, profile in profiles for row in card_rows(user_id, profile)],
+        )
+        conn.executemany("DELETE FROM billing_transactions WHERE user_id = ?", [(user_id,) for user_id, _ in profiles])
+        conn.executemany(
+            _TRANSACTION_INSERT, [row for user_id, profile in profiles for row in transaction_rows(user_id, profile)]
+        )
+
+    def _refresh_derived(self, conn, user_ids):
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT user_id, profile FROM customers WHERE user_id IN ({placeholders})", chunk
+            ).fetchall()
+            self._save_derived(conn, [(user_id, json.loads(raw)) for user_id, raw in rows])
+
+    def _backfill_derived(self, everyone: bool = False):
+        """Calcula as tabelas derivadas de perfis gravados antes de elas existirem."""
+        if everyone:
+            query = "SELECT user_id FROM customers"
+        else:
+            query = "SELECT user_id FROM customers WHERE user_id NOT IN (SELECT user_id FROM customer_features)"
+        missing = [row[0] for row in self._connection().execute(query)]
+        for start in range(0, len(missing), 5000):
+            with self._transaction() as conn:
+                self._refresh_derived(conn, missing[start:start + 5000])
+
+    @_timed("read")
+    def get(self, user_id: str):
+        """Retorna o perfil do usuário ou None se ele não existir."""
+        conn = self._connection()
+        raw = self._cached(conn, (user_id,)).get(user_id)
+        if raw is None:
+            generation = self.cache.generation()
+            row = conn.execute(
+                "SELECT profile, version FROM customers WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            raw = row[0]
+            self.cache.set(user_id, raw, row[1], generation)
+        return json.loads(raw)
+
+    @_timed("read")
+    def get_many(self, user_ids) -> dict:
+        """Retorna {user_id: perfil} para os usuários existentes da lista."""
+        user_ids = list(user_ids)
+        conn = self._connection()
+        cached = self._cached(conn, user_ids)
+        profiles = {user_id: json.loads(raw) for user_id, raw in cached.items()}
+        user_ids = [user_id for user_id in user_ids if user_id not in cached]
+        generation = self.cache.generation()
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for user_id, raw, version in conn.execute(
+                f"SELECT user_id, profile, version FROM customers WHERE user_id IN ({placeholders})", chunk
+            ):
+                self.cache.set(user_id, raw, version, generation)
+                profiles[user_id] = json.loads(raw)
+        return profiles
+
+    @_timed("read")
+    def exists(self, user_id: str) -> bool:
+        row = self._connection().execute(
+            "SELECT 1 FROM customers WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row is not None
+
+    @_timed("read")
+    def version(self, user_id: str) -> int:
+        """Versão do registro, incrementada a cada escrita (0 se o usuário não existe)."""
+        row = self._connection().execute(
+            "SELECT version FROM customers WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    @_timed("read")
+    def version_many(self, user_ids) -> dict:
+        """Retorna {user_id: versão} para os usuários existentes da lista."""
+        user_ids = list(user_ids)
+        versions = {}
+        conn = self._connection()
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            versions.update(conn.execute(f"SELECT user_id, version FROM customers WHERE user_id IN ({placeholders})", chunk))
+        return versions
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+
+    def user_ids(self) -> list:
+        return [row[0] for row in self._connection().execute("SELECT user_id FROM customers ORDER BY user_id")]
+
+    def iter_profiles(self, batch_size: int = 500):
+        """Percorre todos os perfis em lotes, sem carregar a base inteira em memória."""
+        last_user_id = ""
+        conn = self._connection()
+        while True:
+            rows = conn.execute(
+                "SELECT user_id, profile FROM customers WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (last_user_id, batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            for user_id, raw in rows:
+                yield user_id, json.loads(raw)
+            last_user_id = rows[-1][0]
+
+    @_timed("write")
+    def insert(self, user_id: str, profile: dict) -> bool:
+        """Cria um novo perfil. Retorna False se o user_id já existir."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO customers (user_id, profile, version, updated_at) VALUES (?, ?, 1, ?)",
+                (user_id, self._dumps(profile), datetime.now().isoformat()),
+            )
+            if cursor.rowcount == 1:
+                self._save_derived(conn, [(user_id, profile)])
+        self.cache.invalidate(user_id)
+        return cursor.rowcount == 1
+
+    def put(self, user_id: str, profile: dict):
+        """Cria ou substitui o perfil de um usuário."""
+        self.put_many({user_id: profile})
+
+    @_timed("write")
+    def put_many(self, profiles: dict):
+        """
+        Cria ou substitui vários perfis numa única transação. Perfis gravados com o mesmo
+        conteúdo não mudam de versão.
+        """
+        now = datetime.now().isoformat()
+        with self._transaction() as conn:
+            conn.executemany(
+                """
+                INSERT INTO customers (user_id, profile, version, updated_at) VALUES (?, ?, 1, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    profile = excluded.profile,
+                    version = customers.version + 1,
+                    updated_at = excluded.updated_at
+                WHERE customers.profile IS NOT excluded.profile
+                """,
+                [(user_id, self._dumps(profile), now) for user_id, profile in profiles.items()],
+            )
+            self._save_derived(conn, profiles.items())
+        for user_id in profiles:
+            self.cache.invalidate(user_id)
+
+    @_timed("write")
+    def update(self, user_id: str, mutator):
+        """
+        Aplica `mutator(perfil)` de forma atômica sobre um único registro e retorna o seu resultado.
+        O perfil só é regravado se o mutator de fato alterá-lo.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT profile FROM customers WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None:
+                raise CustomerNotFoundError(user_id)
+            profile = json.loads(row[0])
+            result = mutator(profile)
+            new_raw = self._dumps(profile)
+            if new_raw != row[0]:
+                conn.execute(
+                    "UPDATE customers SET profile = ?, version = version + 1, updated_at = ? WHERE user_id = ?",
+                    (new_raw, datetime.now().isoformat(), user_id),
+                )
+                self._save_derived(conn, [(user_id, profile)])
+        self.cache.invalidate(user_id)
+        return result
+
+    @_timed("write")
+    def update_many(self, mutators: dict) -> dict:
+        """
+        Aplica `{user_id: mutator}` numa única transação e retorna `{user_id: resultado}`.
+        Usuários inexistentes são ignorados.
+        """
+        user_ids = list(mutators)
+        results = {}
+        changed_rows = []
+        changed_profiles = []
+        now = datetime.now().isoformat()
+        with self._transaction() as conn:
+            for start in range(0, len(user_ids), 500):
+                chunk = user_ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for user_id, raw in conn.execute(
+                    f"SELECT user_id, profile FROM customers WHERE user_id IN ({placeholders})", chunk
+                ).fetchall():
+                    profile = json.loads(raw)
+                    results[user_id] = mutators[user_id](profile)
+                    new_raw = self._dumps(profile)
+                    if new_raw != raw:
+                        changed_rows.append((new_raw, now, user_id))
+                        changed_profiles.append((user_id, profile))
+            conn.executemany(
+                "UPDATE customers SET profile = ?, version = version + 1, updated_at = ? WHERE user_id = ?",
+                changed_rows,
+            )
+            self._save_derived(conn, changed_profiles)
+        for _, _, user_id in changed_rows:
+            self.cache.invalidate(user_id)
+        return results
+
+    @_timed("write")
+    def patch_many(self, field: str, patches: dict):
+        """
+        Mescla `{user_id: {chave: valor}}` no objeto de primeiro nível `field` de cada perfil,
+        numa única transação e sem desserializar os perfis em Python (funções JSON do SQLite).
+        `field` deve estar em PATCHABLE_FIELDS; outro valor levanta ValueError.
+        """
+        if field not in PATCHABLE_FIELDS:
+            raise ValueError(f"Campo '{field}' não pode ser atualizado por patch_many.")
+        rows = [(json.dumps(patch, ensure_ascii=False), datetime.now().isoformat(), user_id)
+                for user_id, patch in patches.items()]
+        path = f"$.{field}"
+        with self._transaction() as conn:
+            conn.executemany(
+                f"""
+                UPDATE customers SET
+                    profile = json_set(profile, '{path}', json_patch(COALESCE(json_extract(profile, '{path}'), '{{}}'), ?)),
+                    version = version + 1,
+                    updated_at = ?
+                WHERE user_id = ?
+                """,
+                rows,
+            )
+        for user_id in patches:
+            self.cache.invalidate(user_id)
+
+    @_timed("read")
+    def json_field_many(self, user_ids, path: str) -> dict:
+        """Lê um único campo (caminho JSON, ex. `$.retention.last_action_date`) de vários perfis sem desserializá-los."""
+        user_ids = list(user_ids)
+        values = {}
+        conn = self._connection()
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            values.update(conn.execute(
+                f"SELECT user_id, json_extract(profile, ?) FROM customers WHERE user_id IN ({placeholders})",
+                [path, *chunk],
+            ).fetchall())
+        return values
+
+    @_timed("read")
+    def churn_features(self, user_ids) -> list:
+        """
+        Lê da tabela de atributos, para vários usuários de uma vez, só o que o cálculo de churn usa:
+        (user_id, last_activity_date, signup_date, quantidade de pagamentos com falha).
+        """
+        user_ids = list(user_ids)
+        features = []
+        conn = self._connection()
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            features.extend(conn.execute(
+                f"SELECT user_id, last_activity_date, signup_date, failed_count "
+                f"FROM customer_features WHERE user_id IN ({placeholders})",
+                chunk,
+            ).fetchall())
+        return features
+
+    @_timed("read")
+    def features(self, user_id: str):
+        """Atributos derivados do cliente (ver `user_features`), ou None se ele não existir."""
+        row = self._connection().execute(f"{_FEATURE_SELECT} WHERE user_id = ?", (user_id,)).fetchone()
+        return features_from_row(row) if row else None
+
+    @_timed("read")
+    def features_many(self, user_ids) -> dict:
+        """Retorna {user_id: atributos} para os usuários existentes da lista."""
+        user_ids = list(user_ids)
+        features = {}
+        conn = self._connection()
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row in conn.execute(f"{_FEATURE_SELECT} WHERE user_id IN ({placeholders})", chunk):
+                features[row[0]] = features_from_row(row)
+        return features
+
+    def _append(self, user_id: str, array_path: str, item: dict, update_features, update_index=None):
+        with self._transaction() as conn:
+            row = conn.execute(f"{_FEATURE_SELECT} WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None:
+                raise CustomerNotFoundError(user_id)
+            features = update_features(features_from_row(row))
+            conn.execute(
+                f"""
+                UPDATE customers SET
+                    profile = json_set(
+                        json_set(profile, '{array_path}',
+                                 json_insert(COALESCE(json_extract(profile, '{array_path}'), '[]'), '$[#]', json(?))),
+                        '$.behavioral_data.last_activity_date', ?
+                    ),
+                    version = version + 1,
+                    updated_at = ?
+                WHERE user_id = ?
+                """,
+                (json.dumps(item, ensure_ascii=False), features["last_activity_date"], datetime.now().isoformat(), user_id),
+            )
+            conn.execute(_FEATURE_UPSERT, features_to_row(user_id, features))
+            if update_index:
+                update_index(conn)
+        self.cache.invalidate(user_id)
+        return features
+
+    @_timed("write")
+    def append_transaction(self, user_id: str, transaction: dict) -> dict:
+        """
+        Acrescenta uma transação ao `billing_history` e atualiza os atributos em O(1), sem
+        recalcular o histórico. Retorna os atributos atualizados.
+        """
+        def index_transaction(conn):
+            position = conn.execute(
+                "SELECT COALESCE(MAX(position), -1) + 1 FROM billing_transactions WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+            conn.execute(_TRANSACTION_INSERT, transaction_row(user_id, position, transaction))
+
+        return self._append(user_id, "$.billing_history", transaction, lambda features: touch_activity(
+            apply_transaction(features, transaction), transaction.get("date")
+        ), index_transaction)
+
+    @_timed("write")
+    def append_login(self, user_id: str, city: str, date: str = None) -> dict:
+        """Registra um login em `behavioral_data.login_locations` e atualiza os atributos em O(1)."""
+        login = {"city": city, "date": date or datetime.now().isoformat()}
+        return self._append(user_id, "$.behavioral_data.login_locations", login, lambda features: touch_activity(
+            apply_login(features, login), login["date"]
+        ))
+
+    @_timed("read")
+    def transaction(self, user_id: str, transaction_id: str):
+        """Transação do `billing_history` pelo ID, pelo índice (sem ler o perfil); None se não existir."""
+        row = self._connection().execute(
+            "SELECT payload FROM billing_transactions WHERE user_id = ? AND transaction_id = ? ORDER BY position LIMIT 1",
+            (user_id, transaction_id),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @_timed("read")
+    def transactions_many(self, keys) -> dict:
+        """Versão em lote de `transaction`: {(user_id, transaction_id): transação} para os pares que existem."""
+        keys = list(dict.fromkeys(keys))
+        transactions = {}
+        conn = self._connection()
+        for start in range(0, len(keys), 250):
+            chunk = keys[start:start + 250]
+            placeholders = ",".join("(?, ?)" for _ in chunk)
+            rows = conn.execute(
+                f"SELECT user_id, transaction_id, payload FROM billing_transactions "
+                f"WHERE (user_id, transaction_id) IN (VALUES {placeholders}) ORDER BY position",
+                [value for key in chunk for value in key],
+            )
+            for user_id, transaction_id, payload in rows:
+                transactions.setdefault((user_id, transaction_id), json.loads(payload))
+        return transactions
+
+    @_timed("read")
+    def query_transactions(self, user_id: str, since: str = None, until: str = None, status: str = None,
+                           location: str = None, min_amount: float = None, max_amount: float = None,
+                           limit: int = 20, cursor: int = None) -> dict:
+        """
+        Transações do cliente, das mais recentes para as mais antigas, filtradas por período
+        (datas "AAAA-MM-DD", inclusive), status, local (sem diferenciar maiúsculas) e faixa de
+        valor. Retorna uma página de até `limit` transações, o total que atende aos filtros e
+        `next_cursor`, a ser repassado como `cursor` para obter a página seguinte (None na última).
+        """
+        conditions = ["user_id = ?"]
+        params = [user_id]
+        if since:
+            conditions.append("substr(date, 1, 10) >= ?")
+            params.append(since[:10])
+        if until:
+            conditions.append("substr(date, 1, 10) <= ?")
+            params.append(until[:10])
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if location:
+            conditions.append("location = ? COLLATE NOCASE")
+            params.append(location)
+        if min_amount is not None:
+            conditions.append("amount_brl >= ?")
+            params.append(min_amount)
+        if max_amount is not None:
+            conditions.append("amount_brl <= ?")
+            params.append(max_amount)
+        conn = self._connection()
+        where = " AND ".join(conditions)
+        total = conn.execute(f"SELECT COUNT(*) FROM billing_transactions WHERE {where}", params).fetchone()[0]
+        if cursor is not None:
+            where += " AND position < ?"
+            params.append(cursor)
+        rows = conn.execute(
+            f"SELECT position, payload FROM billing_transactions WHERE {where} ORDER BY position DESC LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+        page = rows[:limit]
+        return {
+            "transactions": [json.loads(payload) for _, payload in page],
+            "total": total,
+            "next_cursor": page[-1][0] if len(rows) > limit else None,
+        }
+
+    @_timed("read")
+    def cards_expiring(self, until: date, since: date = None, user_id: str = None) -> list:
+        """
+        Cartões de crédito vencidos em `until` (ou antes), opcionalmente só os que vencem a partir
+        de `since` e só os de um cliente. Uma consulta sobre o índice de validade, sem ler os perfis.
+        Ex.: `cards_expiring(hoje + 30 dias, since=hoje)` são os que vencem nos próximos 30 dias.
+        """
+        conditions = ["expires_on <= ?"]
+        params = [until.isoformat()]
+        if since is not None:
+            conditions.append("expires_on >= ?")
+            params.append(since.isoformat())
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        rows = self._connection().execute(
+            f"SELECT {', '.join(_CARD_COLUMNS)} FROM card_expiry WHERE {' AND '.join(conditions)} ORDER BY expires_on",
+            params,
+        ).fetchall()
+        return [dict(zip(_CARD_COLUMNS, row)) for row in rows]
+
+    @_timed("write")
+    def take_field(self, user_id: str, field: str):
+        """
+        Remove e devolve o campo de primeiro nível `field` do perfil (ex.: um alerta que acabou de
+        ser mostrado), numa única atualização atômica. Retorna None se o campo não existir.
+
+        Quase sempre não há nada a remover: uma leitura decide antes, e o bloqueio de escrita
+        só é tomado quando o campo existe (e a presença é conferida de novo dentro dele).
+        """
+        path = f"$.{field}"
+        row = self._connection().execute(
+            "SELECT json_type(profile, ?) FROM customers WHERE user_id = ?", (path, user_id)
+        ).fetchone()
+        if row is None:
+            raise CustomerNotFoundError(user_id)
+        if row[0] is None:
+            return None
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT json_extract(profile, ?), json_type(profile, ?) FROM customers WHERE user_id = ?",
+                (path, path, user_id),
+            ).fetchone()
+            if row is None:
+                raise CustomerNotFoundError(user_id)
+            value, value_type = row
+            if value_type is None:
+                return None
+            conn.execute(
+                "UPDATE customers SET profile = json_remove(profile, ?), version = version + 1, updated_at = ? "
+                "WHERE user_id = ?",
+                (path, datetime.now().isoformat(), user_id),
+            )
+            if field in _DERIVED_SOURCE_FIELDS:
+                self._refresh_derived(conn, [user_id])
+        self.cache.invalidate(user_id)
+        return json.loads(value) if value_type in ("object", "array") else value
+
+    @_timed("write")
+    def delete(self, user_id: str) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute("DELETE FROM customers WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM customer_features WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM card_expiry WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM billing_transactions WHERE user_id = ?", (user_id,))
+        self.cache.invalidate(user_id)
+        return cursor.rowcount == 1
+
+    def import_json(self, json_file: str = SEED_FILE) -> int:
+        """Importa (ou sobrescreve) os perfis a partir do formato antigo `{user_id: perfil}`."""
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.put_many(data)
+        return len(data)
+
+    def export_json(self, json_file: str = None) -> dict:
+        """Exporta a base no formato antigo `{user_id: perfil}`, opcionalmente para um arquivo."""
+        data = dict(self.iter_profiles())
+        if json_file:
+            with open(json_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+        return data
+
+
+_stores = {}
+_store_lock = threading.Lock()
+
+
+def get_customer_store(db_file: str = None) -> CustomerStore:
+    """Retorna a instância compartilhada do armazenamento de clientes (uma por arquivo de banco)."""
+    db_file = db_file or DB_FILE
+    store = _stores.get(db_file)
+    if store is None:
+        with _store_lock:
+            store = _stores.get(db_file)
+            if store is None:
+                store = CustomerStore(db_file, seed_file=SEED_FILE if db_file == DB_FILE else None)
+                _stores[db_file] = store
+    return store
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else SEED_FILE
+    imported = get_customer_store().import_json(source)
+    print(f"✅ {imported} perfil(is) importado(s) de '{source}' para '{DB_FILE}'.")
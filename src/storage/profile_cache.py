@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("AEGIS_PROFILE_CACHE_MAX_ENTRIES", "10000"))
+DEFAULT_MAX_BYTES = int(os.getenv("AEGIS_PROFILE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+DEFAULT_TTL_SECONDS = float(os.getenv("AEGIS_PROFILE_CACHE_TTL_SECONDS", "300"))
+
+
+class ProfileCache:
+    """
+    Cache LRU em memória dos perfis serializados, com expiração por TTL e limite
+    de memória (número de entradas e bytes). Guarda o JSON cru para que cada leitura
+    devolva uma cópia independente do perfil, junto da versão do registro.
+
+    O cache é do processo. Quando outro processo pode ter escrito na base, `mark_stale`
+    faz com que cada entrada só volte a ser usada depois que `confirm` conferir que a
+    versão guardada ainda é a do banco.
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._size_bytes = 0
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str):
+        """
+        Retorna (json, versão, confirmado) ou None. Se `confirmado` for falso, a entrada é
+        anterior ao último `mark_stale` e só pode ser usada depois de `confirm`.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            raw, expires_at, version, epoch = entry
+            if expires_at < time.monotonic():
+                self._remove(user_id)
+                self.misses += 1
+                return None
+            if epoch != self._epoch:
+                return raw, version, False
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return raw, version, True
+
+    def confirm(self, user_id: str, version: int) -> bool:
+        """Revalida uma entrada contra a versão atual do banco; se mudou, a entrada é descartada."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[2] != version:
+                if entry is not None:
+                    self._remove(user_id)
+                    self.invalidations += 1
+                self.misses += 1
+                return False
+            self._entries[user_id] = (entry[0], entry[1], version, self._epoch)
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return True
+
+    def mark_stale(self):
+        """Outro processo pode ter alterado a base: todas as entradas passam a exigir `confirm`."""
+        with self._lock:
+            self._epoch += 1
+
+    def generation(self) -> int:
+        """Marca a ser lida antes de buscar no banco e repassada a `set`."""
+        return self._generation
+
+    def set(self, user_id: str, raw: str, version: int, generation: int = None):
+        """
+        Guarda o perfil. Se `generation` for informado e alguma invalidação tiver ocorrido
+        desde então, o valor lido pode estar desatualizado e é descartado.
+        """
+        if self.max_entries <= 0 or len(raw) > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if user_id in self._entries:
+                self._remove(user_id)
+            self._entries[user_id] = (raw, time.monotonic() + self.ttl_seconds, version, self._epoch)
+            self._size_bytes += len(raw)
+            while len(self._entries) > self.max_entries or self._size_bytes > self.max_bytes:
+                oldest_user_id = next(iter(self._entries))
+                self._remove(oldest_user_id)
+                self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._generation += 1
+            if user_id in self._entries:
+                self._remove(user_id)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._size_bytes = 0
+
+    def _remove(self, user_id: str):
+        raw = self._entries.pop(user_id)[0]
+        self._size_bytes -= len(raw)
+
+    def stats(self) -> dict:
+        """Contadores para dimensionar o cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,117 @@
+import json
+import math
+
+
+def empty_features(avg_transaction_value: float = 0.0) -> dict:
+    """
+    Atributos de um cliente sem histórico. A média parte do `avg_transaction_value`
+    cadastrado no perfil e é substituída pelos valores reais já na primeira transação.
+    """
+    return {
+        "tx_count": 0,
+        "amount_mean": float(avg_transaction_value or 0.0),
+        "amount_m2": 0.0,
+        "failed_count": 0,
+        "last_activity_date": None,
+        "last_login_city": None,
+        "signup_date": None,
+        "tx_locations": {},
+        "login_locations": {},
+    }
+
+
+def apply_transaction(features: dict, transaction: dict) -> dict:
+    """Incorpora uma transação em O(1): média e variância (Welford), contagem de falhas e cidades."""
+    amount = float(transaction.get("amount_brl", 0.0))
+    features["tx_count"] += 1
+    delta = amount - features["amount_mean"]
+    features["amount_mean"] += delta / features["tx_count"]
+    features["amount_m2"] += delta * (amount - features["amount_mean"])
+    if transaction.get("status") == "failed":
+        features["failed_count"] += 1
+    location = transaction.get("location")
+    if location:
+        features["tx_locations"][location] = features["tx_locations"].get(location, 0) + 1
+    return features
+
+
+def without_transaction(features: dict, transaction: dict) -> dict:
+    """
+    Cópia dos atributos sem uma transação já incorporada (o inverso de `apply_transaction`),
+    para pontuar uma transação do histórico contra as demais. Sem outras transações, a média
+    fica em 0: não há valor de referência.
+    """
+    features = dict(features, tx_locations=dict(features["tx_locations"]))
+    amount = float(transaction.get("amount_brl", 0.0))
+    count = features["tx_count"] - 1
+    if count <= 0:
+        features.update(tx_count=0, amount_mean=0.0, amount_m2=0.0)
+    else:
+        mean = (features["tx_count"] * features["amount_mean"] - amount) / count
+        features["amount_m2"] = max(0.0, features["amount_m2"] - (amount - mean) * (amount - features["amount_mean"]))
+        features.update(tx_count=count, amount_mean=mean)
+    if transaction.get("status") == "failed" and features["failed_count"]:
+        features["failed_count"] -= 1
+    location = transaction.get("location")
+    if location and location in features["tx_locations"]:
+        features["tx_locations"][location] -= 1
+        if not features["tx_locations"][location]:
+            del features["tx_locations"][location]
+    return features
+
+
+def apply_login(features: dict, login: dict) -> dict:
+    """Incorpora um login em O(1). O último login registrado passa a ser a localização atual."""
+    city = login.get("city")
+    if city:
+        features["login_locations"][city] = features["login_locations"].get(city, 0) + 1
+        features["last_login_city"] = city
+    return features
+
+
+def touch_activity(features: dict, date: str) -> dict:
+    if date and (features["last_activity_date"] is None or date > features["last_activity_date"]):
+        features["last_activity_date"] = date
+    return features
+
+
+def features_from_profile(profile: dict) -> dict:
+    """Calcula do zero os atributos de um perfil completo (carga inicial e regravações do perfil)."""
+    behavioral = profile.get("behavioral_data", {})
+    features = empty_features(behavioral.get("avg_transaction_value", 0.0))
+    for transaction in profile.get("billing_history", []):
+        apply_transaction(features, transaction)
+    for login in behavioral.get("login_locations", []):
+        apply_login(features, login)
+    features["last_activity_date"] = behavioral.get("last_activity_date")
+    features["signup_date"] = profile.get("personal_info", {}).get("signup_date")
+    return features
+
+
+def amount_stddev(features: dict) -> float:
+    """Desvio padrão amostral dos valores das transações (0 com menos de duas transações)."""
+    if features["tx_count"] < 2:
+        return 0.0
+    return math.sqrt(features["amount_m2"] / (features["tx_count"] - 1))
+
+
+def seen_locations(features: dict) -> set:
+    """Cidades em que o cliente já fez login ou transação."""
+    return set(features["tx_locations"]) | set(features["login_locations"])
+
+
+FEATURE_COLUMNS = ("tx_count", "amount_mean", "amount_m2", "failed_count", "last_activity_date",
+                   "last_login_city", "signup_date")
+
+
+def features_to_row(user_id: str, features: dict) -> tuple:
+    locations = json.dumps({"tx": features["tx_locations"], "login": features["login_locations"]}, ensure_ascii=False)
+    return (user_id, *(features[column] for column in FEATURE_COLUMNS), locations)
+
+
+def features_from_row(row: tuple) -> dict:
+    features = dict(zip(FEATURE_COLUMNS, row[1:-1]))
+    locations = json.loads(row[-1])
+    features["tx_locations"] = locations["tx"]
+    features["login_locations"] = locations["login"]
+    return features
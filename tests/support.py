@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+
+from src.storage.customer_store import CustomerStore
+
+
+def make_profile(user_id: str, billing_history=None, login_cities=("Rio de Janeiro",), avg_transaction_value: float = 150.0,
+                 **fields) -> dict:
+    """Perfil mínimo no formato de `customer_profile.json`."""
+    profile = {
+        "user_id": user_id,
+        "personal_info": {"name": "Cliente Teste", "email": f"{user_id}@example.com",
+                          "signup_date": "2024-01-10T10:00:00Z"},
+        "payment_methods": [],
+        "subscriptions": [],
+        "billing_history": list(billing_history or []),
+        "behavioral_data": {
+            "avg_transaction_value": avg_transaction_value,
+            "login_locations": [{"city": city, "date": "2025-09-01"} for city in login_cities],
+            "last_activity_date": "2025-09-30T12:00:00Z",
+        },
+    }
+    profile.update(fields)
+    return profile
+
+
+def make_transaction(transaction_id: str, amount_brl: float = 150.0, location: str = "Rio de Janeiro",
+                     status: str = "success", date: str = "2025-09-10", **fields) -> dict:
+    transaction = {"transaction_id": transaction_id, "date": date, "amount_brl": amount_brl,
+                   "description": "Mensalidade", "status": status, "location": location}
+    transaction.update(fields)
+    return transaction
+
+
+class TemporaryStore:
+    """Base SQLite descartável, num diretório temporário, com os perfis informados."""
+    def __init__(self, profiles: dict = None):
+        self.directory = tempfile.mkdtemp(prefix="aegis_test_")
+        self.store = CustomerStore(os.path.join(self.directory, "customers.db"), seed_file=None)
+        if profiles:
+            self.store.put_many(profiles)
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.storage.columnar_history import ColumnarHistory
+
+from support import make_transaction
+
+
+def history_entry(user_id: str, transactions) -> tuple:
+    return user_id, transactions, [{"city": "Rio de Janeiro", "date": "2025-09-01"}]
+
+
+class ColumnarHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="aegis_test_")
+        self.history = ColumnarHistory(os.path.join(self.directory, "history"))
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def reopen(self) -> ColumnarHistory:
+        self.history.close()
+        self.history = ColumnarHistory(self.history.directory)
+        return self.history
+
+    def test_failed_append_leaves_no_trace(self):
+        self.history.append_many([history_entry("u1", [make_transaction("t1", location="Recife")])])
+        with self.assertRaises(TypeError):
+            self.history.append_many([history_entry("u2", [make_transaction("t2", location="Manaus", device=object())])])
+        self.assertEqual(self.history.code("users", "u2"), 0)
+        self.assertEqual(self.history.code("places", "Manaus"), 0)
+        self.assertEqual(self.history.rows("transactions"), 1)
+
+        self.history.append_many([history_entry("u3", [make_transaction("t3", location="Curitiba")])])
+        expected = {
+            "u1": {"billing_history": [make_transaction("t1", location="Recife")],
+                   "behavioral_data": {"login_locations": [{"city": "Rio de Janeiro", "date": "2025-09-01"}]}},
+            "u3": {"billing_history": [make_transaction("t3", location="Curitiba")],
+                   "behavioral_data": {"login_locations": [{"city": "Rio de Janeiro", "date": "2025-09-01"}]}},
+        }
+        self.assertEqual(self.history.export_profiles(), expected)
+        self.assertEqual(self.reopen().export_profiles(), expected)
+        self.assertEqual(self.history.dictionary("users"), [None, "u1", "u3"])
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "contagem de descritores só no Linux")
+    def test_appends_do_not_leak_mappings(self):
+        def open_descriptors():
+            return len(os.listdir("/proc/self/fd"))
+
+        self.history.append("u0", [make_transaction("t0")])
+        self.history.transaction_stats()
+        baseline = open_descriptors()
+        for i in range(1, 50):
+            self.history.append(f"u{i}", [make_transaction(f"t{i}")])
+            self.assertEqual(self.history.transaction_stats()[f"u{i}"]["tx_count"], 1)
+        self.assertLessEqual(open_descriptors(), baseline)
+
+        # Uma coluna ainda em uso mantém o próprio mapeamento até ser solta.
+        amounts = self.history.column("transactions", "amount_brl")
+        self.history.append("u50", [make_transaction("t50", 80.0)])
+        self.assertEqual(amounts[49], 150.0)
+        self.assertEqual(self.history.column("transactions", "amount_brl")[50], 80.0)
+        del amounts
+        self.history.append("u51", [make_transaction("t51")])
+        self.history.transaction_stats()
+        self.assertLessEqual(open_descriptors(), baseline)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+import asyncio
+import functools
+import inspect
+import json
+import unittest
+from unittest import mock
+
+from benchmarks.fake_llm import ScriptedChatModel, tool_calling_script
+from src.agents import agent_concierge
+from src.agents.conversation_memory import BoundedSummaryMemory
+from src.agents.llm_cache import ResponseCache
+from src.agents.session_registry import SessionRegistry, SqliteSessionBackend
+from src.agents.tool_schemas import MAX_PAGE_SIZE
+
+from support import TemporaryStore, make_profile
+
+
+class ResponseCacheTest(unittest.TestCase):
+    """O cache de respostas precisa valer nos turnos do agente de ferramentas, que chama o modelo em streaming."""
+
+    def setUp(self):
+        self.temporary = TemporaryStore({"cache_user": make_profile("cache_user")})
+        self.calls = 0
+
+        def counting_script(messages):
+            self.calls += 1
+            return tool_calling_script(messages)
+
+        patches = [
+            mock.patch.object(agent_concierge, "get_customer_store", lambda: self.temporary.store),
+            mock.patch.object(agent_concierge, "ResponseCache", functools.partial(ResponseCache, db_file=None)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.agent = agent_concierge.ConciergeAgent(
+            llm=ScriptedChatModel(script=counting_script, latency_seconds=0, latency_jitter_seconds=0)
+        )
+
+    def tearDown(self):
+        self.temporary.close()
+
+    def run_turn(self, session_id: str) -> str:
+        return self.agent.run("Olá, quero ver minhas assinaturas", session_id=session_id, user_id="cache_user")
+
+    def stream_turn(self, session_id: str) -> str:
+        async def collect():
+            return "".join([text async for text in self.agent.astream(
+                "Olá, quero ver minhas assinaturas", session_id=session_id, user_id="cache_user"
+            )])
+        return asyncio.run(collect())
+
+    def test_repeated_turn_is_a_cache_hit(self):
+        first = self.run_turn("session_1")
+        calls = self.calls
+        stats = self.agent.response_cache.stats()
+        self.assertEqual(calls, 2)
+        self.assertEqual(stats["memory_hits"], 0)
+        self.assertEqual(stats["misses"], 2)
+
+        self.assertEqual(self.run_turn("session_2"), first)
+        self.assertEqual(self.calls, calls)
+        self.assertEqual(self.agent.response_cache.stats()["memory_hits"], 2)
+
+        self.assertEqual(self.stream_turn("session_3"), first)
+        self.assertEqual(self.calls, calls)
+        self.assertEqual(self.agent.response_cache.stats()["memory_hits"], 4)
+
+    def test_profile_change_invalidates_the_cached_turn(self):
+        self.run_turn("session_1")
+        self.temporary.store.update("cache_user", lambda profile: profile["personal_info"].update(name="Outro Nome"))
+        self.run_turn("session_2")
+        self.assertEqual(self.calls, 4)
+        self.assertEqual(self.agent.response_cache.stats()["memory_hits"], 0)
+
+
+class BoundedMemoryTest(unittest.TestCase):
+    """A memória limitada precisa valer nos turnos reais, que gravam o contexto pela via assíncrona."""
+
+    RECENT_TURNS = 2  # na memória com resumo pelo modelo; a outra é a padrão do agente
+    SUMMARY = "Resumo gerado pelo modelo."
+
+    def setUp(self):
+        self.temporary = TemporaryStore({"memory_user": make_profile("memory_user")})
+
+        def script(messages):
+            if str(messages[-1].content).startswith("Atualize o resumo"):
+                return self.SUMMARY
+            return tool_calling_script(messages)
+
+        patches = [
+            mock.patch.object(agent_concierge, "get_customer_store", lambda: self.temporary.store),
+            mock.patch.object(agent_concierge, "ResponseCache", functools.partial(ResponseCache, db_file=None)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.backend = SqliteSessionBackend(f"{self.temporary.directory}/sessions.db")
+        self.llm_summary = False
+        self.agent = agent_concierge.ConciergeAgent(
+            sessions=SessionRegistry(memory_factory=self.new_memory, backend=self.backend),
+            llm=ScriptedChatModel(script=script, latency_seconds=0, latency_jitter_seconds=0),
+        )
+
+    def tearDown(self):
+        self.temporary.close()
+
+    def new_memory(self):
+        if self.llm_summary:
+            return BoundedSummaryMemory(llm=self.agent.llm, recent_turns=self.RECENT_TURNS)
+        return self.agent._new_memory()
+
+    def converse(self, turns: int):
+        """Alterna `run` e `astream`, com mensagens que vão ao modelo e outras que o caminho rápido responde."""
+        async def stream(message):
+            return "".join([text async for text in self.agent.astream(message, session_id="s", user_id="memory_user")])
+
+        for i in range(turns):
+            message = "quais são minhas assinaturas?" if i % 3 == 2 else f"Preciso de ajuda com o pedido {i}"
+            if i % 2:
+                reply = asyncio.run(stream(message))
+            else:
+                reply = self.agent.run(message, session_id="s", user_id="memory_user")
+            self.assertTrue(reply)
+            session = self.agent.sessions.get_or_create("s", "memory_user")
+            self.assertLessEqual(len(session.memory.chat_memory.messages), 2 * session.memory.recent_turns)
+        return session
+
+    def assert_bounded(self, session, turns: int):
+        self.assertEqual(session.turns, turns)
+        bound = 2 * session.memory.recent_turns
+        self.assertLessEqual(len(session.memory.chat_memory.messages), bound)
+        stored = self.backend.load("s")["state"]
+        self.assertLessEqual(len(stored["messages"]), bound)
+        self.assertEqual(stored["summary"], session.memory.summary)
+
+    def test_memory_stays_bounded_over_many_turns(self):
+        session = self.converse(15)
+        self.assert_bounded(session, 15)
+        self.assertIn("Cliente: Preciso de ajuda com o pedido", session.memory.summary)
+
+    def test_model_summary_is_awaited_on_the_async_path(self):
+        self.llm_summary = True
+        # O resumo dentro do event loop não pode passar pela via síncrona do cliente.
+        with mock.patch.object(self.agent.llm.client, "call", side_effect=AssertionError("chamada síncrona")):
+            session = self.converse(8)
+        self.assert_bounded(session, 8)
+        self.assertEqual(session.memory.summary, self.SUMMARY)
+
+
+class ToolSchemaTest(unittest.TestCase):
+    """Os esquemas das ferramentas são inferidos das assinaturas, com as descrições e os limites anotados."""
+
+    def setUp(self):
+        self.temporary = TemporaryStore({"cache_user": make_profile("cache_user")})
+        patch = mock.patch.object(agent_concierge, "get_customer_store", lambda: self.temporary.store)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.agent = agent_concierge.ConciergeAgent(llm=ScriptedChatModel(latency_seconds=0, latency_jitter_seconds=0))
+        self.tools = {tool.name: tool for tool in self.agent.tools}
+
+    def tearDown(self):
+        self.temporary.close()
+
+    def test_schema_matches_the_function_signature(self):
+        for name, tool in self.tools.items():
+            with self.subTest(tool=name):
+                parameters = list(inspect.signature(getattr(agent_concierge, name)).parameters)
+                schema = tool.tool_call_schema.model_json_schema()
+                self.assertEqual(list(schema.get("properties", {})), parameters)
+                for field in schema.get("properties", {}).values():
+                    self.assertTrue(field.get("description"))
+
+    def test_annotated_bounds_are_enforced(self):
+        page_size = self.tools["get_billing_history"].tool_call_schema.model_json_schema()["properties"]["page_size"]
+        self.assertEqual((page_size["minimum"], page_size["maximum"]), (1, MAX_PAGE_SIZE))
+        token = agent_concierge._current_user_id.set("cache_user")
+        try:
+            self.assertEqual(self.tools["get_billing_history"].invoke({"page_size": MAX_PAGE_SIZE + 1}),
+                             "Tool input validation error")
+            result = json.loads(self.tools["get_billing_history"].invoke({"page_size": 5}))
+        finally:
+            agent_concierge._current_user_id.reset(token)
+        self.assertEqual(result["result"]["total"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.storage.customer_store import CustomerNotFoundError, CustomerStore
+
+from support import TemporaryStore, make_profile, make_transaction
+
+
+class RecordingStore(CustomerStore):
+    def _backfill_derived(self, everyone: bool = False):
+        self.backfills = getattr(self, "backfills", []) + [everyone]
+        super()._backfill_derived(everyone)
+
+
+class DerivedTablesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="aegis_test_")
+        self.seed_file = os.path.join(self.directory, "seed.json")
+        with open(self.seed_file, "w", encoding="utf-8") as f:
+            json.dump({"u1": make_profile("u1", [make_transaction("t1", 120.0)])}, f)
+        self.db_file = os.path.join(self.directory, "customers.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_new_database_is_not_backfilled_after_the_seed_import(self):
+        store = RecordingStore(self.db_file, seed_file=self.seed_file)
+        self.assertEqual(getattr(store, "backfills", []), [])
+        self.assertEqual(store.features("u1")["tx_count"], 1)
+        self.assertEqual(store.transaction("u1", "t1")["amount_brl"], 120.0)
+
+    def test_existing_database_fills_missing_derived_rows(self):
+        CustomerStore(self.db_file, seed_file=self.seed_file)
+        store = RecordingStore(self.db_file, seed_file=self.seed_file)
+        self.assertEqual(store.backfills, [False])
+
+
+class PatchManyTest(unittest.TestCase):
+    def setUp(self):
+        self.temporary = TemporaryStore({"u1": make_profile("u1")})
+        self.store = self.temporary.store
+
+    def tearDown(self):
+        self.temporary.close()
+
+    def test_merges_into_an_allowed_field(self):
+        self.store.patch_many("retention", {"u1": {"last_action_date": "2025-10-01"}})
+        self.store.patch_many("retention", {"u1": {"channel": "email"}})
+        self.assertEqual(self.store.get("u1")["retention"], {"last_action_date": "2025-10-01", "channel": "email"})
+
+    def test_rejects_fields_outside_the_whitelist(self):
+        for field in ("billing_history", "x', 1) --", "unknown"):
+            with self.subTest(field=field), self.assertRaises(ValueError):
+                self.store.patch_many(field, {"u1": {"a": 1}})
+        self.assertEqual(self.store.version("u1"), 1)
+
+
+class TakeFieldTest(unittest.TestCase):
+    def setUp(self):
+        self.temporary = TemporaryStore({"u1": make_profile("u1", proactive_alert={"type": "blocked_transaction"})})
+        self.store = self.temporary.store
+        self.transactions = 0
+        transaction = self.store._transaction
+
+        def counting_transaction():
+            self.transactions += 1
+            return transaction()
+
+        self.store._transaction = counting_transaction
+
+    def tearDown(self):
+        self.temporary.close()
+
+    def test_takes_the_field_once(self):
+        self.assertEqual(self.store.take_field("u1", "proactive_alert"), {"type": "blocked_transaction"})
+        self.assertNotIn("proactive_alert", self.store.get("u1"))
+        self.assertEqual(self.store.version("u1"), 2)
+        self.assertIsNone(self.store.take_field("u1", "proactive_alert"))
+        self.assertEqual(self.transactions, 1)
+
+    def test_missing_field_does_not_take_the_write_lock(self):
+        for _ in range(3):
+            self.assertIsNone(self.store.take_field("u1", "retention"))
+        self.assertEqual(self.transactions, 0)
+        self.assertEqual(self.store.version("u1"), 1)
+
+    def test_unknown_user(self):
+        with self.assertRaises(CustomerNotFoundError):
+            self.store.take_field("nobody", "proactive_alert")
+
+
+if __name__ == "__main__":
+    unittest.main()
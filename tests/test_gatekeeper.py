@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+
+from src.agents.agent_gatekeeper import GatekeeperAgent, OnboardingPipeline
+
+from support import TemporaryStore
+
+
+class InstantOcrBackend:
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+
+    def extract(self, document_image_path: str, new_user_data: dict) -> dict:
+        time.sleep(self.latency_seconds)
+        return {"name": new_user_data["personal_info"]["name"], "email": new_user_data["personal_info"]["email"]}
+
+
+class SlowKycBackend:
+    def __init__(self, latency_seconds: float):
+        self.latency_seconds = latency_seconds
+
+    def verify(self, extracted_data: dict) -> dict:
+        time.sleep(self.latency_seconds)
+        return {"approved": True}
+
+
+def new_user(user_id: str) -> dict:
+    return {
+        "user_id": user_id,
+        "personal_info": {"name": f"Cliente {user_id}", "email": f"{user_id}@example.com"},
+        "payment_methods": [],
+        "billing_history": [],
+        "behavioral_data": {"avg_transaction_value": 0.0, "login_locations": []},
+    }
+
+
+class OnboardingShutdownTest(unittest.TestCase):
+    def setUp(self):
+        self.temporary = TemporaryStore()
+
+    def tearDown(self):
+        self.temporary.close()
+
+    def pipeline(self, ocr_latency: float, kyc_latency: float) -> OnboardingPipeline:
+        gatekeeper = GatekeeperAgent(InstantOcrBackend(ocr_latency), SlowKycBackend(kyc_latency), self.temporary.store)
+        return OnboardingPipeline(gatekeeper, workers_per_stage={"ocr": 1, "kyc": 2, "profile": 1})
+
+    def submit_all(self, pipeline, count: int):
+        finished = []
+        done = threading.Event()
+
+        def callback(job):
+            finished.append(job)
+            if len(finished) == count:
+                done.set()
+
+        job_ids = [pipeline.submit("doc.png", new_user(f"new_{i}"), callback=callback) for i in range(count)]
+        return job_ids, finished, done
+
+    def test_shutdown_without_wait_finishes_queued_jobs(self):
+        pipeline = self.pipeline(ocr_latency=0.02, kyc_latency=0.0)
+        job_ids, finished, done = self.submit_all(pipeline, 10)
+        pipeline.shutdown(wait=False)
+        self.assertTrue(done.wait(timeout=10), f"{len(finished)} de {len(job_ids)} jobs terminaram")
+        self.assertEqual({job["status"] for job in finished}, {"completed"})
+        self.assertEqual(self.temporary.store.count(), 10)
+
+    def test_shutdown_waits_for_every_stage(self):
+        pipeline = self.pipeline(ocr_latency=0.0, kyc_latency=0.02)
+        job_ids, finished, done = self.submit_all(pipeline, 10)
+        pipeline.shutdown(wait=True)
+        self.assertTrue(done.is_set())
+        self.assertEqual([pipeline.get_status(job_id)["status"] for job_id in job_ids], ["completed"] * 10)
+
+    def test_submit_after_shutdown_is_rejected(self):
+        pipeline = self.pipeline(ocr_latency=0.0, kyc_latency=0.0)
+        pipeline.shutdown()
+        with self.assertRaises(RuntimeError):
+            pipeline.submit("doc.png", new_user("late"))
+
+
+if __name__ == "__main__":
+    unittest.main()
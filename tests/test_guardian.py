@@ -0,0 +1,218 @@
+import os
+import unittest
+
+from src.agents.agent_guardian import (
+    BEHAVIORAL_ANOMALY_SCORE, NETWORK_ANOMALY_SCORE, NOVEL_LOCATION_SCORE, VALUE_ANOMALY_SCORE, GuardianAgent,
+    _luhn_reference, luhn_valid,
+)
+
+from src.storage.columnar_history import ColumnarHistory
+
+from support import TemporaryStore, make_profile, make_transaction
+
+
+class ScoreBatchParityTest(unittest.TestCase):
+    """`analyze_transactions_batch` deve dar, par a par, o mesmo resultado de `analyze_transaction`."""
+
+    def setUp(self):
+        self.temporary = TemporaryStore({
+            "regular": make_profile("regular", [
+                make_transaction("t1", 150.0, "Rio de Janeiro"),
+                make_transaction("t2", 140.0, "Rio de Janeiro", status="failed"),
+                make_transaction("t3", 160.0, "Niterói"),
+            ], login_cities=("Rio de Janeiro", "Niterói")),
+            "no_history": make_profile("no_history", [], login_cities=(), avg_transaction_value=0.0),
+            "no_logins": make_profile("no_logins", [make_transaction("t4", 80.0, "Recife")], login_cities=()),
+        })
+        self.guardian = GuardianAgent(store=self.temporary.store)
+
+    def tearDown(self):
+        self.temporary.close()
+
+    def assert_parity(self, pairs):
+        batch = self.guardian.analyze_transactions_batch(pairs)
+        self.assertEqual(len(batch), len(pairs))
+        for (user_id, transaction), result in zip(pairs, batch):
+            with self.subTest(user_id=user_id, transaction=transaction):
+                self.assertEqual(result, self.guardian.analyze_transaction(user_id, transaction))
+
+    def test_regular_transactions(self):
+        self.assert_parity([
+            ("regular", {"amount_brl": 150.0, "location": "Rio de Janeiro", "time_on_page_seconds": 40}),
+            ("regular", {"amount_brl": 2000.0, "location": "Manaus", "time_on_page_seconds": 2}),
+            ("regular", {"amount_brl": 150.0, "location": "Niterói", "time_on_page_seconds": 5}),
+            ("no_logins", {"amount_brl": 400.0, "location": "Salvador", "time_on_page_seconds": 30}),
+        ])
+
+    def test_unknown_user(self):
+        self.assert_parity([("nobody", {"amount_brl": 10.0, "location": "Recife", "time_on_page_seconds": 30})])
+        self.assertEqual(self.guardian.analyze_transactions_batch([("nobody", {"amount_brl": 10.0})])[0]["risk_level"],
+                         "Alto")
+
+    def test_missing_time_on_page(self):
+        self.assert_parity([
+            ("regular", {"amount_brl": 150.0, "location": "Rio de Janeiro"}),
+            ("regular", {"amount_brl": 900.0, "location": "Curitiba"}),
+        ])
+
+    def test_missing_location(self):
+        self.assert_parity([
+            ("regular", {"amount_brl": 150.0, "time_on_page_seconds": 40}),
+            ("regular", {"amount_brl": 900.0, "time_on_page_seconds": 1}),
+            ("no_history", {"amount_brl": 50.0}),
+        ])
+
+    def test_empty_history(self):
+        self.assert_parity([
+            ("no_history", {"amount_brl": 5000.0, "location": "Recife", "time_on_page_seconds": 30}),
+            ("no_history", {"amount_brl": 1.0, "location": "Rio de Janeiro", "time_on_page_seconds": 3}),
+        ])
+
+    def test_empty_batch(self):
+        self.assertEqual(self.guardian.analyze_transactions_batch([]), [])
+
+    def test_billing_history_rescoring_matches_single_analysis(self):
+        results = self.guardian.analyze_billing_histories()
+        profile = self.temporary.store.get("regular")
+        for transaction in profile["billing_history"]:
+            self.assertEqual(results["regular"][transaction["transaction_id"]],
+                             self.guardian.analyze_transaction("regular", transaction))
+
+
+class RiskScoringTest(unittest.TestCase):
+    """Regras e limites da pontuação a partir da tabela de atributos."""
+
+    def setUp(self):
+        self.temporary = TemporaryStore({
+            # Média real do histórico (100) bem abaixo do `avg_transaction_value` cadastrado (1000).
+            "client": make_profile("client", [make_transaction(f"t{i}", 100.0) for i in range(4)],
+                                   login_cities=("Rio de Janeiro",), avg_transaction_value=1000.0),
+            "newcomer": make_profile("newcomer", [], login_cities=(), avg_transaction_value=200.0),
+        })
+        self.guardian = GuardianAgent(store=self.temporary.store)
+
+    def tearDown(self):
+        self.temporary.close()
+
+    def analyze(self, user_id, amount, location="Rio de Janeiro", seconds=40):
+        return self.guardian.analyze_transaction(
+            user_id, {"amount_brl": amount, "location": location, "time_on_page_seconds": seconds}
+        )
+
+    def test_value_baseline_is_the_mean_of_the_history(self):
+        self.assertEqual(self.analyze("client", 300.0)["risk_score"], 0)
+        flagged = self.analyze("client", 300.01)
+        self.assertEqual(flagged["risk_score"], VALUE_ANOMALY_SCORE)
+        self.assertEqual(flagged["risk_level"], "Médio")
+
+    def test_value_baseline_without_history_is_the_registered_average(self):
+        self.assertEqual(self.analyze("newcomer", 600.0, location="Recife")["risk_score"], 0)
+        self.assertEqual(self.analyze("newcomer", 601.0, location="Recife")["risk_score"], VALUE_ANOMALY_SCORE)
+
+    def test_novel_location_adds_to_the_network_anomaly(self):
+        result = self.analyze("client", 100.0, location="Manaus")
+        self.assertEqual(result["risk_score"], NETWORK_ANOMALY_SCORE + NOVEL_LOCATION_SCORE)
+        self.assertEqual(result["risk_level"], "Médio")
+        self.assertEqual(len(result["reasons"]), 2)
+
+    def test_novel_location_is_not_flagged_without_known_cities(self):
+        self.assertEqual(self.analyze("newcomer", 100.0, location="Manaus")["risk_score"], 0)
+
+    def test_high_risk_threshold(self):
+        result = self.analyze("client", 1000.0, location="Manaus", seconds=2)
+        self.assertEqual(result["risk_score"],
+                         VALUE_ANOMALY_SCORE + NETWORK_ANOMALY_SCORE + NOVEL_LOCATION_SCORE + BEHAVIORAL_ANOMALY_SCORE)
+        self.assertEqual(result["risk_level"], "Alto")
+
+
+class HistoryTransactionScoringTest(unittest.TestCase):
+    """Uma transação do histórico é pontuada contra as demais, não contra si mesma."""
+
+    def setUp(self):
+        self.trip = make_transaction("trip", 350.0, "Manaus")
+        self.temporary = TemporaryStore({
+            "traveler": make_profile("traveler", [make_transaction(f"t{i}", 100.0) for i in range(3)] + [self.trip],
+                                     login_cities=("Rio de Janeiro",)),
+        })
+        self.guardian = GuardianAgent(store=self.temporary.store)
+        self.expected_score = VALUE_ANOMALY_SCORE + NETWORK_ANOMALY_SCORE + NOVEL_LOCATION_SCORE
+
+    def tearDown(self):
+        self.temporary.close()
+
+    def test_city_seen_only_in_the_scored_transaction_is_novel(self):
+        result = self.guardian.analyze_transaction("traveler", self.temporary.store.transaction("traveler", "trip"))
+        self.assertEqual(result["risk_score"], self.expected_score)
+        # A média de referência é a das outras transações (100), não a que inclui os 350.
+        self.assertIn("R$100.0", result["reasons"][0])
+
+    def test_batch_and_rescoring_paths_agree(self):
+        single = self.guardian.analyze_transaction("traveler", self.trip)
+        self.assertEqual(single["risk_score"], self.expected_score)
+        self.assertEqual(self.guardian.analyze_transactions_batch([("traveler", self.trip)]), [single])
+        self.assertEqual(self.guardian.analyze_billing_histories()["traveler"]["trip"], single)
+
+        history = ColumnarHistory(os.path.join(self.temporary.directory, "history"))
+        try:
+            profile = self.temporary.store.get("traveler")
+            history.append_many([("traveler", profile["billing_history"], profile["behavioral_data"]["login_locations"])])
+            self.assertEqual(self.guardian.analyze_billing_histories(history=history)["traveler"]["trip"], single)
+        finally:
+            history.close()
+
+    def test_new_transactions_keep_the_full_history(self):
+        result = self.guardian.analyze_transaction(
+            "traveler", {"amount_brl": 350.0, "location": "Manaus", "time_on_page_seconds": 40}
+        )
+        self.assertEqual(result["risk_score"], NETWORK_ANOMALY_SCORE)
+
+
+class CardValidationTest(unittest.TestCase):
+    """`luhn_valid` e `validate_cards_bulk` devem concordar com as versões cartão a cartão."""
+
+    NUMBERS = (
+        "4539578763621486", "4539578763621487", "4539 5787 6362 1486", " 4539578763621486 ", "", "0", "79927398713",
+        "٤٥٣٩٥٧٨٧٦٣٦٢١٤٨٦", "४५३९५७८७६३६२१४८६", "4539５787６３６２１４８６", "²²", "12a4", "\t18", "+18", "-18",
+    )
+
+    def setUp(self):
+        self.temporary = TemporaryStore()
+        self.guardian = GuardianAgent(store=self.temporary.store)
+
+    def tearDown(self):
+        self.temporary.close()
+
+    def test_luhn_matches_the_reference(self):
+        for number in self.NUMBERS + (None, 4539578763621486, ["4", "5"]):
+            with self.subTest(number=number):
+                self.assertEqual(luhn_valid(number), _luhn_reference(number))
+                if isinstance(number, str) and " " not in number:
+                    self.assertEqual(luhn_valid(number), self.guardian._luhn_check(number))
+
+    def test_bulk_results_match_validate_new_card(self):
+        expiry_dates = ("2099-12", "2020-01", "", None, "2030-13", "2030-00", "2030/01", "abc", "2030", "2030-1-1")
+        cvvs = ("123", "1234", "12", "12345", "12a", "", None, "١٢٣")
+        cards = [
+            (number, expiry_dates[i % len(expiry_dates)], cvvs[(i // len(expiry_dates)) % len(cvvs)])
+            for i, number in enumerate(self.NUMBERS * len(expiry_dates) * len(cvvs))
+        ]
+        summary = self.guardian.validate_cards_bulk(*zip(*cards), chunk_size=7)
+        self.assertEqual(summary["cards"], len(cards))
+        for (number, expiry_date, cvv), result in zip(cards, summary["results"]):
+            with self.subTest(number=number, expiry_date=expiry_date, cvv=cvv):
+                self.assertEqual(result, self.guardian.validate_new_card(
+                    {"number": number, "expiry_date": expiry_date, "cvv": cvv}
+                ))
+
+    def test_reports_the_processes_actually_used(self):
+        cards = (["4539578763621486"] * 10, ["2099-12"] * 10, ["123"] * 10)
+        self.assertEqual(self.guardian.validate_cards_bulk(*cards)["processes"], 1)
+        self.assertEqual(self.guardian.validate_cards_bulk(*cards, processes=8)["processes"], 1)
+        summary = self.guardian.validate_cards_bulk(*cards, processes=8, chunk_size=5)
+        self.assertEqual(summary["processes"], 2)
+        self.assertEqual(summary["valid"], 10)
+        self.assertEqual(self.guardian.validate_cards_bulk([], [], [])["processes"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+import unittest
+
+from src.agents.agent_guardian import GuardianAgent
+from src.agents.guardian_stream import FileCheckpoint, JsonlTransactionSource, TransactionStreamConsumer
+
+from support import TemporaryStore, make_profile, make_transaction
+
+
+def risky_event(user_id: str, transaction_id: str, amount: float = 5000.0) -> dict:
+    # Valor muito acima da média, cidade nunca vista e página preenchida em 1s: risco Alto.
+    return {"user_id": user_id, "transaction_id": transaction_id, "amount_brl": amount, "location": "Manaus",
+            "time_on_page_seconds": 1}
+
+
+def safe_event(user_id: str, transaction_id: str) -> dict:
+    return {"user_id": user_id, "transaction_id": transaction_id, "amount_brl": 100.0, "location": "Rio de Janeiro",
+            "time_on_page_seconds": 40}
+
+
+class CrashingCheckpoint(FileCheckpoint):
+    """Checkpoint que simula uma queda do processo na gravação número `crash_on`."""
+    def __init__(self, path: str, crash_on: int):
+        super().__init__(path)
+        self.crash_on = crash_on
+        self.saves = 0
+
+    def save(self, offset: int):
+        self.saves += 1
+        if self.saves == self.crash_on:
+            raise RuntimeError("queda simulada")
+        super().save(offset)
+
+
+class CountingSource:
+    """Fonte em memória que registra quantos eventos já foram entregues ao consumidor."""
+    def __init__(self, lines: list):
+        self.lines = lines
+        self.delivered = 0
+
+    def read(self, offset: int, stop_event: threading.Event):
+        for position in range(offset, len(self.lines)):
+            if stop_event.is_set():
+                return
+            self.delivered += 1
+            yield position + 1, self.lines[position]
+
+
+class ExplodingGuardian(GuardianAgent):
+    """Guardian que falha ao pontuar a transação `boom`, como um erro inesperado num único evento."""
+    def score_batch(self, transactions, features_by_user):
+        if any(transaction["transaction_id"] == "boom" for _, transaction in transactions):
+            raise RuntimeError("falha simulada na pontuação")
+        return super().score_batch(transactions, features_by_user)
+
+
+class GuardianStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.temporary = TemporaryStore({
+            f"user_{i}": make_profile(f"user_{i}", [make_transaction(f"old_{i}_{n}", 100.0) for n in range(3)])
+            for i in range(6)
+        })
+        self.store = self.temporary.store
+        self.stream_path = os.path.join(self.temporary.directory, "stream.jsonl")
+        self.checkpoint_path = f"{self.stream_path}.checkpoint"
+
+    def tearDown(self):
+        self.temporary.close()
+
+    def write_stream(self, events: list):
+        with open(self.stream_path, "w", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+
+    def test_resume_reprocesses_the_batch_that_was_not_checkpointed(self):
+        self.write_stream([risky_event(f"user_{i}", f"txn_{i}") for i in range(6)])
+        consumer = TransactionStreamConsumer(store=self.store, batch_size=2, max_wait_seconds=0.5)
+
+        # Cai ao gravar o checkpoint do segundo lote: ele foi processado, mas não confirmado.
+        with self.assertRaises(RuntimeError):
+            consumer.run(JsonlTransactionSource(self.stream_path), CrashingCheckpoint(self.checkpoint_path, crash_on=2))
+        first_offset = FileCheckpoint(self.checkpoint_path).load()
+        with open(self.stream_path, "rb") as f:
+            self.assertEqual(first_offset, len(f.readline()) + len(f.readline()))
+
+        summary = consumer.run(JsonlTransactionSource(self.stream_path), FileCheckpoint(self.checkpoint_path))
+        self.assertEqual(summary["events"], 4)
+        self.assertEqual(summary["offset"], os.path.getsize(self.stream_path))
+        self.assertEqual(FileCheckpoint(self.checkpoint_path).load(), os.path.getsize(self.stream_path))
+        for i in range(6):
+            self.assertEqual(self.store.get(f"user_{i}")["proactive_alert"]["transaction_id"], f"txn_{i}")
+
+        # Sem eventos novos, uma nova retomada não reprocessa nada.
+        self.assertEqual(consumer.run(JsonlTransactionSource(self.stream_path),
+                                      FileCheckpoint(self.checkpoint_path))["events"], 0)
+
+    def test_reader_stops_when_the_queue_is_full(self):
+        source = CountingSource([json.dumps(safe_event("user_0", f"txn_{i}")) for i in range(200)])
+        consumer = TransactionStreamConsumer(store=self.store, batch_size=1, max_wait_seconds=0.0, queue_size=3)
+        release = threading.Event()
+        process_batch = consumer.process_batch
+
+        def blocked_process_batch(lines):
+            release.wait()
+            return process_batch(lines)
+
+        consumer.process_batch = blocked_process_batch
+        result = {}
+        runner = threading.Thread(target=lambda: result.update(consumer.run(source)))
+        runner.start()
+        time.sleep(0.5)
+        # Um evento em análise, `queue_size` na fila e, no máximo, um aguardando vaga.
+        self.assertLessEqual(source.delivered, 1 + 3 + 1)
+        release.set()
+        runner.join(timeout=10)
+        self.assertFalse(runner.is_alive())
+        self.assertEqual(result["events"], 200)
+        self.assertEqual(source.delivered, 200)
+
+    def test_unread_alert_with_higher_score_is_kept(self):
+        consumer = TransactionStreamConsumer(store=self.store)
+        consumer.process_batch([json.dumps(risky_event("user_0", "txn_worst"))])
+        worst = self.store.get("user_0")["proactive_alert"]
+
+        # Valor normal: ainda risco Alto (cidade nova, página em 1s), mas com pontuação menor.
+        counts = consumer.process_batch([json.dumps(risky_event("user_0", "txn_weaker", amount=100.0))])
+        self.assertEqual(counts["alerts"], 0)
+        self.assertEqual(self.store.get("user_0")["proactive_alert"], worst)
+
+        # Uma transação de pontuação maior ou igual substitui o alerta; reprocessar o mesmo evento o regrava.
+        consumer.process_batch([json.dumps(risky_event("user_0", "txn_other"))])
+        self.assertEqual(self.store.get("user_0")["proactive_alert"]["transaction_id"], "txn_other")
+        consumer.process_batch([json.dumps(risky_event("user_0", "txn_other"))])
+        self.assertEqual(self.store.get("user_0")["proactive_alert"]["transaction_id"], "txn_other")
+
+    def test_wrongly_typed_events_are_skipped_and_the_checkpoint_advances(self):
+        bad_events = [
+            dict(risky_event("user_0", "txn_text"), amount_brl="5000"),
+            dict(risky_event("user_0", "txn_null"), amount_brl=None),
+            dict(risky_event("user_0", "txn_nan"), amount_brl=float("nan")),
+            dict(risky_event("user_0", "txn_bool"), amount_brl=True),
+            dict(risky_event("user_0", "txn_city"), location=42),
+            dict(risky_event("user_0", "txn_page"), time_on_page_seconds="1"),
+            dict(risky_event("user_0", 7)),
+            dict(risky_event("user_0", "txn_user"), user_id=["user_0"]),
+        ]
+        self.write_stream(bad_events + [risky_event("user_1", "txn_valid")])
+        consumer = TransactionStreamConsumer(store=self.store, batch_size=100)
+        summary = consumer.run(JsonlTransactionSource(self.stream_path), FileCheckpoint(self.checkpoint_path))
+        self.assertEqual((summary["malformed"], summary["scored"], summary["alerts"]), (len(bad_events), 1, 1))
+        self.assertEqual(FileCheckpoint(self.checkpoint_path).load(), os.path.getsize(self.stream_path))
+        self.assertNotIn("proactive_alert", self.store.get("user_0"))
+        self.assertEqual(self.store.get("user_1")["proactive_alert"]["transaction_id"], "txn_valid")
+
+    def test_scoring_error_drops_only_that_event(self):
+        self.write_stream([risky_event("user_0", "boom"), risky_event("user_1", "txn_ok")])
+        consumer = TransactionStreamConsumer(guardian=ExplodingGuardian(store=self.store), store=self.store)
+        summary = consumer.run(JsonlTransactionSource(self.stream_path), FileCheckpoint(self.checkpoint_path))
+        self.assertEqual((summary["malformed"], summary["scored"], summary["alerts"]), (1, 1, 1))
+        self.assertEqual(FileCheckpoint(self.checkpoint_path).load(), os.path.getsize(self.stream_path))
+        self.assertEqual(self.store.get("user_1")["proactive_alert"]["transaction_id"], "txn_ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import asyncio
+import unittest
+
+from benchmarks.fake_llm import ScriptedChatModel
+from langchain_core.messages import HumanMessage
+from src.agents.llm_client import FALLBACK_REPLY, CircuitBreaker, ResilientChatModel, ResilientLLMClient
+from src.agents.streaming import get_async_runner
+
+
+async def failing_stream(error: BaseException):
+    raise error
+    yield
+
+
+async def hanging_stream():
+    await asyncio.sleep(60)
+    yield "nunca"
+
+
+async def consume(client: ResilientLLMClient, key: str, open_stream) -> list:
+    return [chunk async for chunk in client.stream(key, open_stream)]
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    """A chamada de teste do meio aberto precisa ser devolvida em qualquer desfecho."""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+        self.client = ResilientLLMClient(max_retries=0, breaker=self.breaker, deadline_seconds=5)
+
+    def open_circuit(self):
+        async def fail():
+            with self.assertRaises(ConnectionError):
+                await consume(self.client, "fail", lambda: failing_stream(ConnectionError("queda")))
+        asyncio.run(fail())
+        self.assertEqual(self.breaker.state, "open")
+        self.assertEqual(self.breaker.admit(), None)
+        asyncio.run(asyncio.sleep(0.06))
+        self.assertEqual(self.breaker.state, "half_open")
+
+    def test_cancelled_probe_is_released(self):
+        self.open_circuit()
+
+        async def cancel_probe():
+            consumer = asyncio.ensure_future(consume(self.client, "probe", hanging_stream))
+            await asyncio.sleep(0.05)
+            consumer.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await consumer
+            await asyncio.sleep(0.01)
+        asyncio.run(cancel_probe())
+        self.assertEqual(self.breaker.admit(), "probe")
+        self.assertEqual(self.breaker.opened_count, 1)
+
+    def test_probe_waiting_for_a_slot_past_the_deadline_is_released(self):
+        self.open_circuit()
+        client = ResilientLLMClient(max_concurrency=1, max_retries=0, breaker=self.breaker, deadline_seconds=0.05)
+
+        async def starve_probe():
+            client._bind_loop()
+            await client._semaphore.acquire()
+            with self.assertRaises(TimeoutError):
+                await consume(client, "probe", hanging_stream)
+        asyncio.run(starve_probe())
+        self.assertEqual(client.calls, 0)
+        self.assertEqual(self.breaker.admit(), "probe")
+
+    def test_non_transient_errors_do_not_trip_the_breaker(self):
+        async def invalid_requests():
+            for _ in range(3):
+                with self.assertRaises(ValueError):
+                    await consume(self.client, "invalid", lambda: failing_stream(ValueError("pedido inválido")))
+        asyncio.run(invalid_requests())
+        self.assertEqual(self.breaker.state, "closed")
+
+        self.open_circuit()
+        asyncio.run(invalid_requests())
+        self.assertEqual(self.breaker.state, "half_open")
+        self.assertEqual(self.breaker.opened_count, 1)
+
+    def test_sync_call_applies_the_same_policy(self):
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 2:
+                raise ConnectionError("queda")
+            return "ok"
+
+        client = ResilientLLMClient(max_retries=2, backoff_seconds=0.001, breaker=CircuitBreaker(5, 60))
+        self.assertEqual(client.call(flaky), "ok")
+        self.assertEqual((len(attempts), client.retries), (2, 1))
+
+        self.open_circuit()
+        self.assertEqual(self.client.call(lambda: "ok"), "ok")
+        self.assertEqual(self.breaker.state, "closed")
+
+
+class SyncGenerateTest(unittest.TestCase):
+    """`invoke` dentro de um event loop também passa pela política (e cai na resposta de contingência)."""
+
+    def setUp(self):
+        self.client = ResilientLLMClient(max_retries=1, backoff_seconds=0.001, breaker=CircuitBreaker(10, 60))
+        self.model = ResilientChatModel(
+            inner=ScriptedChatModel(latency_seconds=0, latency_jitter_seconds=0, error_rate=1.0), client=self.client
+        )
+
+    def invoke(self) -> str:
+        return self.model.invoke([HumanMessage(content="Olá")]).content
+
+    def test_inside_the_process_loop(self):
+        async def summarize():
+            return self.invoke()
+        self.assertEqual(get_async_runner().run(summarize()), FALLBACK_REPLY)
+        self.assertEqual((self.client.calls, self.client.retries), (2, 1))
+
+    def test_inside_another_loop(self):
+        async def summarize():
+            return self.invoke()
+        self.assertEqual(asyncio.run(summarize()), FALLBACK_REPLY)
+        self.assertEqual((self.client.calls, self.client.retries), (2, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()